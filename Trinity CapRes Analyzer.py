@@ -1,23 +1,42 @@
 
 
+import time
+_STARTUP_T0 = time.perf_counter()
+import os
 from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, colorchooser
 from typing import List, Dict, Tuple, Optional
 import numpy as np
-import matplotlib
-matplotlib.use("TkAgg")
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib import rcParams
-from matplotlib.ticker import AutoMinorLocator
+# matplotlib / asyncio / json 都在第一次用到時才 import（見 _mpl()），縮短啟動時間
 
 APP_TITLE = "Trinity CapRes Analyzer"
 
-# ---- Matplotlib base style ----
-rcParams['font.family'] = 'Times New Roman'
-rcParams['axes.titleweight'] = 'bold'
-rcParams['axes.labelweight'] = 'bold'
+# ---- Matplotlib base style（延遲載入） ----
+_MPL_READY = False
+
+def _mpl():
+    """第一次要畫圖時才載入 matplotlib 並套用基本樣式。"""
+    global _MPL_READY
+    import matplotlib
+    if not _MPL_READY:
+        matplotlib.rcParams['font.family'] = 'Times New Roman'
+        matplotlib.rcParams['axes.titleweight'] = 'bold'
+        matplotlib.rcParams['axes.labelweight'] = 'bold'
+        _MPL_READY = True
+    return matplotlib
+
+def new_subplots(figw=6.0, figh=4.0, dpi=100):
+    """不經 pyplot 建立 Figure（不進全域 figure 管理，也不需要 GUI backend）。"""
+    _mpl()
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(figw, figh), dpi=dpi)
+    return fig, fig.add_subplot(111)
+
+def new_figure(figsize):
+    _mpl()
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
 
 UM_TO_CM = 1e-4  # μm → cm
 
@@ -61,7 +80,8 @@ def apply_dark_style(root, base_font=("Segoe UI", 12)):
 
 # ---------- Splash ----------
 class Splash(tk.Toplevel):
-    def __init__(self, master, *, secs=1.2):
+    """secs=None：不自動關閉，由呼叫端在初始化完成時呼叫 close()。"""
+    def __init__(self, master, *, secs=None):
         super().__init__(master)
         self.overrideredirect(True)
         self.configure(bg="#0f1216")
@@ -82,9 +102,10 @@ class Splash(tk.Toplevel):
         foot = tk.Label(self, text="Loading modules…", fg="#95a7c6", bg="#0f1216", font=("Segoe UI", 10))
         foot.pack(side="bottom", pady=10)
         # Auto close
-        self.after(int(secs*1000), self._close)
+        if secs:
+            self.after(int(secs*1000), self.close)
 
-    def _close(self):
+    def close(self):
         try:
             self.destroy()
         except Exception:
@@ -92,8 +113,9 @@ class Splash(tk.Toplevel):
 
 # ---------- 小工具 ----------
 def rainbow_color(i: int, n: int):
-    cmap = plt.get_cmap('rainbow')
-    return matplotlib.colors.to_hex(cmap(i / max(n-1, 1)))
+    mpl = _mpl()
+    cmap = mpl.colormaps['rainbow']
+    return mpl.colors.to_hex(cmap(i / max(n-1, 1)))
 
 def safe_float(s, default=None):
     try:
@@ -142,6 +164,17 @@ def _find_header_params(lines):
                 except Exception: pass
     return locus, vstart, vstop, (freqs if freqs else None)
 
+def _header_meta(lines):
+    """表頭 key → 值字串（多個值以逗號串接），供 die 座標 / 分組規則查詢。"""
+    meta = {}
+    for ln in lines[:800]:
+        parts = [p.strip() for p in ln.split(",")]
+        if len(parts) < 3 or parts[0].lower().startswith("data"): continue
+        key = parts[1]
+        if key and key not in meta:
+            meta[key] = ",".join(t for t in parts[2:] if t)
+    return meta
+
 def _find_dimension1_near(lines, dataname_line_index):
     for look in range(1, 60):
         j = dataname_line_index - look
@@ -193,6 +226,7 @@ def _split_by_locus_or_wrap(V, locus, vstart, vstop, n_expected=None, npts_hint=
 def parse_b1500_csv_text(txt: str):
     lines = [ln.rstrip("\n") for ln in txt.splitlines() if ln.strip()]
     locus, vstart, vstop, freqs = _find_header_params(lines)
+    meta = _header_meta(lines)
     curves = []; i = 0; sweep_idx = 0
 
     def find_idx(names_low, cands):
@@ -226,10 +260,10 @@ def parse_b1500_csv_text(txt: str):
         try:
             if not is_two_cols and v_iv_idx is not None and i_iv_idx is not None:
                 V = np.asarray(arr[:, v_iv_idx], float); I = np.asarray(arr[:, i_iv_idx], float)
-                sweep_idx += 1; curves.append(dict(label=f"Sweep_{sweep_idx}", V=V, I=I, type="iv")); continue
+                sweep_idx += 1; curves.append(dict(label=f"Sweep_{sweep_idx}", V=V, I=I, type="iv", locus=locus, meta=meta)); continue
             elif is_two_cols and v_iv_idx is None and c_cv_idx is None:
                 V = np.asarray(arr[:, 0], float); I = np.asarray(arr[:, 1], float)
-                sweep_idx += 1; curves.append(dict(label=f"Sweep_{sweep_idx}", V=V, I=I, type="iv")); continue
+                sweep_idx += 1; curves.append(dict(label=f"Sweep_{sweep_idx}", V=V, I=I, type="iv", locus=locus, meta=meta)); continue
         except Exception:
             pass
 
@@ -250,12 +284,13 @@ def parse_b1500_csv_text(txt: str):
 
         for k, sl in enumerate(slices):
             V = V_all[sl]; C = C_all[sl]
+            f = None
             if freqs is not None and k < len(freqs):
-                f = freqs[k]; lbl = _fmt_freq(float(f))
+                f = float(freqs[k]); lbl = _fmt_freq(f)
             else:
                 lbl = f"CV_{sweep_idx+1}"
             sweep_idx += 1
-            curves.append(dict(label=lbl, V=V, C=C, type="cv"))
+            curves.append(dict(label=lbl, V=V, C=C, type="cv", freq=f, locus=locus, meta=meta))
     return curves
 
 def read_curves_from_file(path: Path):
@@ -264,6 +299,8 @@ def read_curves_from_file(path: Path):
     except Exception:
         txt = path.read_text(errors="ignore")
     cs = parse_b1500_csv_text(txt)
+    for c in cs:
+        c["src"] = str(path)
     if len(cs) == 1:
         cs[0]["label"] = path.stem
     return cs
@@ -278,6 +315,1920 @@ def read_curves_multi_files(paths: List[Path]):
             out.append(c)
     return out
 
+# ---------- CTLM 分組規則（die / structure / spacing / R2，一次建好索引） ----------
+DIE_XY_PATTERN = r"[Xx](-?\d+)[_\-]?[Yy](-?\d+)"
+GROUP_FIELDS = ("die", "structure", "spacing", "R2")
+DEFAULT_GROUP_RULES = {"die": DIE_XY_PATTERN, "structure": "", "spacing": r"(\d+(?:\.\d+)?)\s*(?:um|μm)", "R2": ""}
+# 'header:Key' 沒給 regex 時用的預設
+_HEADER_FALLBACK = {"die": r"(-?\d+)[^\d\-]+(-?\d+)", "structure": r"(.+)",
+                    "spacing": r"([-+]?\d*\.?\d+)", "R2": r"([-+]?\d*\.?\d+)", "condition": r"([-+]?\d*\.?\d+)"}
+
+def compile_group_rules(rules, fields=GROUP_FIELDS):
+    """rules: {field: 規則字串}，空字串表示不用該欄位。規則格式：
+    'regex'（比對檔名 stem）、'label:regex'（比對曲線 label）、'header:Key' 或 'header:Key:regex'（比對表頭值）。
+    regex 錯誤時丟出 re.error。"""
+    import re
+    out = {}
+    for f in fields:
+        text = (rules.get(f) or "").strip()
+        if not text: continue
+        src, key = "name", None
+        if text.startswith("header:"):
+            _, key, *rx = text.split(":", 2); src = "header"
+            text = rx[0] if rx and rx[0] else _HEADER_FALLBACK[f]
+        elif text.startswith("label:"):
+            src, text = "label", text[6:]
+        out[f] = (src, key, re.compile(text))
+    return out
+
+def extract_group_fields(curve, compiled):
+    """套用 compile_group_rules 的結果，回傳 {die, structure, spacing, R2}（對不到為 None）。
+    die：regex 有兩個 group 時為 (x, y) 整數，否則為字串；其餘（spacing / R2 / condition）為 float。"""
+    out = dict.fromkeys((*GROUP_FIELDS, *compiled))
+    name = None
+    for f, (src, key, rx) in compiled.items():
+        if src == "header":
+            text = (curve.get("meta") or {}).get(key)
+        elif src == "label":
+            text = curve.get("label", "")
+        else:
+            if name is None: name = Path(curve["src"]).stem if curve.get("src") else curve.get("label", "")
+            text = name
+        m = rx.search(text) if text else None
+        if not m: continue
+        g = [x for x in m.groups() if x is not None] or [m.group(0)]
+        if f == "die":
+            try: out[f] = (int(g[0]), int(g[1])) if len(g) >= 2 else g[0]
+            except ValueError: out[f] = "_".join(g)
+        elif f == "structure":
+            out[f] = "_".join(g)
+        else:
+            out[f] = safe_float(g[0])
+    return out
+
+def index_ctlm_groups(curves, rules, rows=None):
+    """一次走過 I–V 曲線，建立 groups = {(die, structure): {"R2": float 或 None, "spacings": {spacing: [row, ...]}}}。
+    rows 指定要收的 curve 索引（預設全部）；對不到的欄位為 None（照樣分組）。
+    回傳 (groups, fields)，fields[row] 是該曲線抽出的欄位。"""
+    compiled = compile_group_rules(rules)
+    groups, fields = {}, {}
+    for i in (range(len(curves)) if rows is None else rows):
+        c = curves[i]
+        if c.get("I") is None: continue
+        f = fields[i] = extract_group_fields(c, compiled)
+        g = groups.setdefault((f["die"], f["structure"]), {"R2": None, "spacings": {}})
+        if g["R2"] is None: g["R2"] = f["R2"]
+        g["spacings"].setdefault(f["spacing"], []).append(i)
+    return groups, fields
+
+def fit_ctlm_sets(sets, R2s, method="OLS"):
+    """sets: [(xs, ys)]（spacing μm、R0 Ω），R2s: 每組的 R2（NaN 表示沒有）。
+    離群判斷與 exact fit 整批一次，Method-1/2 逐組；回傳 [dict(n, R2, flagged, method1, method2, exact)]。"""
+    if not sets: return []
+    D, Y = pad_sets(sets); R2 = np.asarray(R2s, float)
+    W, flags = ctlm_outliers(D, Y, R2, method)
+    ex = rho_exact_batch(D, Y, R2, W)
+    out = []
+    for k in range(len(sets)):
+        n = len(sets[k][0]); x, y = D[k, :n], Y[k, :n]
+        w = None if W is None else W[k, :n]
+        ok = np.isfinite(R2[k]) and n >= 2
+        out.append(dict(n=n, R2=None if not np.isfinite(R2[k]) else float(R2[k]), flagged=int(flags[k].sum()),
+                        **_fit_result(rho_method1(x, y, R2[k], w) if ok else None,
+                                      rho_method2(x, y, R2[k], w) if ok else None,
+                                      (ex["Rs"][k], ex["Lt_um"][k], ex["rhoc"][k], ex["r2"][k]) if ex["ok"][k] else None,
+                                      _line_r2(x, y, w) if ok else np.nan)))
+    return out
+
+def fit_ctlm_groups(curves, groups, window=0.5, R2_um=None, method="OLS"):
+    """每個 group 的 R0 vs spacing 直接擬合（見 fit_ctlm_sets）；group 沒有自己的 R2 時用 R2_um。
+    回傳 {key: dict(n, R2, flagged, method1, method2, exact)}。"""
+    keys, sets, R2s = [], [], []
+    for key, g in groups.items():
+        xs, ys = [], []
+        for sp, rows in g["spacings"].items():
+            if sp is None: continue
+            for i in rows:
+                R0 = compute_r0_at_zero(curves[i]["V"], curves[i]["I"], window=window)
+                if np.isfinite(R0): xs.append(sp); ys.append(float(R0))
+        keys.append(key); sets.append((xs, ys))
+        R2s.append(g["R2"] if g["R2"] is not None else (np.nan if R2_um is None else R2_um))
+    return dict(zip(keys, fit_ctlm_sets(sets, R2s, method)))
+
+def group_name(key):
+    """(die, structure) → 顯示用名稱。"""
+    die, st = key
+    name = f"({die[0]}, {die[1]})" if isinstance(die, tuple) else (die or "—")
+    return f"{name} {st}" if st else name
+
+WAFER_METHODS = ("Method-1", "Method-2", "Exact")
+WAFER_METRICS = [("ρc (Ω·cm²)", "rhoc"), ("Rs (Ω/□)", "Rs"), ("Lt (μm)", "Lt"), ("R²", "r2")]
+METHOD_KEYS = {"Method-1": "method1", "Method-2": "method2", "Exact": "exact"}
+
+# ---------- 多條件（溫度 / 偏壓）：所有條件一次批次擬合，ln ρc 對 1/T 求 barrier height ----------
+K_B_EV = 8.617333262e-5   # Boltzmann 常數 (eV/K)
+CONDITION_RULE = r"(?:^|[_\-\s])T(-?\d+(?:\.\d+)?)"   # 檔名裡的 _T25、-T125C；格式同分組規則
+CONDITION_UNITS = ("°C", "K", "other")                    # other：偏壓等，不做 Arrhenius
+
+def condition_kelvin(value, unit):
+    """條件值 → 絕對溫度 (K)；unit 不是溫度時為 nan。"""
+    return value + 273.15 if unit == "°C" else (value if unit == "K" else float("nan"))
+
+def fit_conditions(records, R2_um=None, method="OLS"):
+    """records: [(condition, die, structure, spacing_um, R0, R2)] → 依 (condition, die, structure) 分組，
+    所有條件的所有組一次交給 fit_ctlm_sets（離群判斷與 exact fit 整批）。
+    回傳 {condition: {(die, structure): dict(n, R2, flagged, method1, method2, exact)}}。"""
+    groups = {}
+    for cond, die, st, sp, R0, R2 in records:
+        g = groups.setdefault((cond, die, st), [[], [], R2])
+        if g[2] is None: g[2] = R2
+        if sp is not None and np.isfinite(R0): g[0].append(sp); g[1].append(float(R0))
+    R2s = [g[2] if g[2] is not None else (np.nan if R2_um is None else R2_um) for g in groups.values()]
+    out = {}
+    for (cond, die, st), r in zip(groups, fit_ctlm_sets([(g[0], g[1]) for g in groups.values()], R2s, method)):
+        out.setdefault(cond, {})[(die, st)] = r
+    return out
+
+def condition_summary(fits, method="Exact"):
+    """{(die, structure): fit} → 該方法在 die 之間的中位數 dict(rhoc, Rs, Lt_um, n)（n = 有效 die 數）。"""
+    vals = [f[METHOD_KEYS[method]] for f in fits.values() if f[METHOD_KEYS[method]] is not None]
+    vals = [v for v in vals if np.isfinite(v["rhoc"]) and v["rhoc"] > 0]
+    med = {k: float(np.median([v[k] for v in vals])) if vals else np.nan for k in AGG_METRICS}
+    return dict(med, n=len(vals))
+
+def fit_arrhenius(T_K, rhoc):
+    """ln ρc = ln ρ0 + qφB / (kT)：對 1/T 最小平方 → dict(phiB_eV, rho0, r2, n, slope, intercept)；
+    有效溫度少於兩個時回傳 None。"""
+    T = np.asarray(T_K, float); r = np.asarray(rhoc, float)
+    ok = np.isfinite(T) & (T > 0) & np.isfinite(r) & (r > 0)
+    if np.unique(T[ok]).size < 2: return None
+    x, y = 1 / T[ok], np.log(r[ok])
+    a, b = np.polyfit(x, y, 1)
+    ss = np.sum((y - y.mean())**2)
+    return dict(phiB_eV=float(a * K_B_EV), rho0=float(np.exp(b)), r2=float(1 - np.sum((y - (a*x + b))**2) / ss) if ss > 0 else np.nan,
+                n=int(ok.sum()), slope=float(a), intercept=float(b))
+
+# ---------- 計算（純函式，worker process 也可直接呼叫） ----------
+def compute_rv(V, I):
+    if I is None or len(V) < 3:
+        return V, np.full_like(V, np.nan)
+    dIdV = np.gradient(I, V, edge_order=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R = 1.0 / dIdV
+    return V, R
+
+def compute_r0_at_zero(V, I, window=0.5):
+    if I is None:
+        return np.nan
+    idx = np.where(np.abs(V) <= window)[0]
+    if len(idx) < 3:
+        order = np.argsort(np.abs(V)); idx = order[:max(3, min(7, len(V)))]
+    v = V[idx]; i = I[idx]
+    try:
+        a, _b = np.polyfit(v, i, 1)
+        if np.isclose(a, 0): return np.nan
+        return 1.0 / a
+    except Exception:
+        return np.nan
+
+# Model-1（內部長度用 cm）
+def _line_r2(xs, ys, weights=None):
+    """R0 對 spacing 的（加權）直線 r²，當作 Method-1 的擬合度；有效點少於 2 或退化時為 nan。"""
+    x = np.asarray(xs, float); y = np.asarray(ys, float)
+    w = np.ones_like(x) if weights is None else np.asarray(weights, float)
+    if np.count_nonzero(w) < 2: return np.nan
+    try:
+        a, b = np.polyfit(x, y, 1, w=None if weights is None else np.sqrt(w))
+    except np.linalg.LinAlgError:
+        return np.nan
+    ss_tot = np.sum(w*(y - np.average(y, weights=w))**2)
+    return float(1 - np.sum(w*(y - (a*x + b))**2)/ss_tot) if ss_tot > 0 else np.nan
+
+def rho_method1(xs: np.ndarray, ys: np.ndarray, R2_um: float, weights=None):
+    d_cm  = np.asarray(xs, float) * UM_TO_CM
+    R2_cm = float(R2_um) * UM_TO_CM
+    if np.any(d_cm <= 0) or np.any(d_cm >= R2_cm) or d_cm.size < 2:
+        return None
+    x1 = np.log(R2_cm / (R2_cm - d_cm))                 # 無因次
+    x2 = 1.0/(R2_cm - d_cm) + 1.0/R2_cm                 # 1/cm
+    X = np.column_stack([x1, x2]); ys = np.asarray(ys, float)
+    if weights is not None:  # 加權最小平方：每列乘 √w
+        sw = np.sqrt(np.asarray(weights, float)); X = X * sw[:, None]; ys = ys * sw
+    try:
+        beta, *_ = np.linalg.lstsq(X, ys, rcond=None)
+    except Exception:
+        return None
+    A, B = beta  # A: Ω, B: Ω·cm
+    Rs = 2*np.pi*A                                   # Ω/□
+    rhoc = (2*np.pi*B)**2 / Rs if Rs != 0 else np.nan  # Ω·cm²
+    Lt_cm = np.sqrt(rhoc / Rs) if (np.isfinite(rhoc) and Rs > 0) else np.nan
+    Lt_um = Lt_cm / UM_TO_CM if np.isfinite(Lt_cm) else np.nan
+    return None if not np.isfinite(Lt_um) else (Rs, Lt_um, rhoc)
+
+# Model-2（correlation 線性化）
+def rho_method2(xs: np.ndarray, ys: np.ndarray, R2_um: float, weights=None):
+    d = np.asarray(xs, float); Rt = np.asarray(ys, float)
+    if d.size < 2 or np.any(d <= 0) or np.any(d >= R2_um):
+        return None
+    C = (R2_um/d)*np.log(R2_um/(R2_um - d))
+    ycorr = Rt / C
+    X = np.column_stack([d, np.ones_like(d)])
+    w = np.ones_like(d) if weights is None else np.asarray(weights, float)
+    sw = np.sqrt(w)
+    beta, *_ = np.linalg.lstsq(X * sw[:, None], ycorr * sw, rcond=None)
+    m, c = float(beta[0]), float(beta[1])
+    yfit = m*d + c
+    ybar = np.sum(w * ycorr) / np.sum(w) if np.sum(w) > 0 else np.nan
+    ss_res = np.sum(w * (ycorr - yfit)**2); ss_tot = np.sum(w * (ycorr - ybar)**2)
+    r2 = 1 - ss_res/ss_tot if ss_tot > 0 else np.nan
+    Rs = m * 2*np.pi*R2_um
+    Lt_um = c/(2*m) if m != 0 else np.nan
+    if not np.isfinite(Lt_um):
+        return None
+    rhoc = Rs * (Lt_um*UM_TO_CM)**2
+    return Rs, Lt_um, rhoc, (m, c, r2)
+
+# Exact CTLM（Bessel 解）：RT = Rs/2π·[(Lt/r0)·I0/I1(r0/Lt) + ln(R/r0) + (Lt/R)·K0/K1(R/Lt)]，r0 = R2−d, R = R2
+def _bessel_i01e(x):
+    """e^-x·I0(x), e^-x·I1(x)，x ≥ 0（Abramowitz & Stegun 9.8.1–9.8.4）。"""
+    x = np.asarray(x, float)
+    xs = np.minimum(x, 3.75); t2 = (xs / 3.75)**2
+    ex = np.exp(-xs)
+    i0s = np.polyval([0.0045813, 0.0360768, 0.2659732, 1.2067492, 3.0899424, 3.5156229, 1.0], t2) * ex
+    i1s = xs * np.polyval([0.00032411, 0.00301532, 0.02658733, 0.15084934, 0.51498869, 0.87890594, 0.5], t2) * ex
+    xl = np.maximum(x, 3.75); u = 3.75 / xl; sq = np.sqrt(xl)
+    i0l = np.polyval([0.00392377, -0.01647633, 0.02635537, -0.02057706, 0.00916281, -0.00157565,
+                      0.00225319, 0.01328592, 0.39894228], u) / sq
+    i1l = np.polyval([-0.00420059, 0.01787654, -0.02895312, 0.02282967, -0.01031555, 0.00163801,
+                      -0.00362018, -0.03988024, 0.39894228], u) / sq
+    small = x <= 3.75
+    return np.where(small, i0s, i0l), np.where(small, i1s, i1l)
+
+def _bessel_k01e(x):
+    """e^x·K0(x), e^x·K1(x)，x > 0（Abramowitz & Stegun 9.8.5–9.8.8）。"""
+    x = np.maximum(np.asarray(x, float), 1e-300)
+    xs = np.minimum(x, 2.0); y = (xs / 2)**2
+    i0e, i1e = _bessel_i01e(xs); ex = np.exp(xs)
+    lg = np.log(xs / 2)
+    k0s = (-lg * i0e * ex + np.polyval([0.00000740, 0.00010750, 0.00262698, 0.03488590, 0.23069756,
+                                        0.42278420, -0.57721566], y)) * ex
+    k1s = (lg * i1e * ex + np.polyval([-0.00004686, -0.00110404, -0.01919402, -0.18156897, -0.67278579,
+                                       0.15443144, 1.0], y) / xs) * ex
+    xl = np.maximum(x, 2.0); u = 2.0 / xl; sq = np.sqrt(xl)
+    k0l = np.polyval([0.00053208, -0.00251540, 0.00587872, -0.01062446, 0.02189568, -0.07832358, 1.25331414], u) / sq
+    k1l = np.polyval([-0.00068245, 0.00325614, -0.00780353, 0.01504268, -0.03655620, 0.23498619, 1.25331414], u) / sq
+    small = x <= 2.0
+    return np.where(small, k0s, k0l), np.where(small, k1s, k1l)
+
+def ctlm_exact_rt(d_um, R2_um, Rs, Lt_um, with_jac=False):
+    """Exact CTLM 總電阻（Ω），可 broadcast。with_jac=True 另回傳 ∂RT/∂ln Rs、∂RT/∂ln Lt。"""
+    r0 = np.asarray(R2_um, float) - np.asarray(d_um, float)
+    R = np.asarray(R2_um, float)
+    Lt = np.asarray(Lt_um, float)
+    i0, i1 = _bessel_i01e(r0 / Lt); k0, k1 = _bessel_k01e(R / Lt)
+    rho, kap = i0 / i1, k0 / k1
+    k = np.asarray(Rs, float) / (2 * np.pi)
+    rt = k * ((Lt / r0) * rho + np.log(R / r0) + (Lt / R) * kap)
+    if not with_jac:
+        return rt
+    # d/dlnLt[(Lt/r0)·I0/I1] = ρ²−1、d/dlnLt[(Lt/R)·K0/K1] = 1−κ²（Bessel 遞迴關係）
+    return rt, np.stack([rt, k * (rho**2 - kap**2)], axis=-1)
+
+def pad_sets(sets):
+    """[(xs, ys), ...] → 以 NaN 補齊的 (D, Y) 陣列，形狀 (n_sets, max_points)。"""
+    sets = [(np.asarray(x, float), np.asarray(y, float)) for x, y in sets]
+    n = max([x.size for x, _ in sets] + [1])
+    D = np.full((len(sets), n), np.nan); Y = np.full((len(sets), n), np.nan)
+    for k, (x, y) in enumerate(sets):
+        D[k, :x.size] = x; Y[k, :y.size] = y
+    return D, Y
+
+def _solve2(A, b):
+    """整批 2×2 線性系統 A·x = b（A: (n,2,2), b: (n,2)）。"""
+    det = A[:, 0, 0]*A[:, 1, 1] - A[:, 0, 1]*A[:, 1, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.stack([(A[:, 1, 1]*b[:, 0] - A[:, 0, 1]*b[:, 1]) / det,
+                         (A[:, 0, 0]*b[:, 1] - A[:, 1, 0]*b[:, 0]) / det], axis=-1)
+
+def rho_exact_batch(D, Y, R2_um, W=None, max_iter=100, tol=1e-10):
+    """整批 exact CTLM 擬合（Levenberg–Marquardt，參數 ln Rs、ln Lt）。
+    D, Y: (n_sets, n_points)（D 可為共用的 (1, n_points)），NaN / d≤0 / d≥R2 / W=0 的點不計；R2_um 可為純量或 (n_sets,)。
+    起始值由加權 Method-1 整批求得。回傳 dict：Rs, Lt_um, rhoc, r2, iters, ok（皆為 (n_sets,) 陣列）。"""
+    D, Y = np.broadcast_arrays(np.atleast_2d(np.asarray(D, float)), np.atleast_2d(np.asarray(Y, float)))
+    R2 = np.broadcast_to(np.reshape(np.asarray(R2_um, float), (-1, 1)), D.shape)
+    W = np.ones_like(D) if W is None else np.broadcast_to(np.asarray(W, float), D.shape)
+    valid = np.isfinite(D) & np.isfinite(Y) & (D > 0) & (D < R2) & np.isfinite(W) & (W > 0)
+    W = np.where(valid, W, 0.0); D = np.where(valid, D, R2 / 2); Y = np.where(valid, Y, 0.0)
+    npts = valid.sum(axis=1)
+
+    # Method-1 起始值：y = A·ln(R/r0) + B·(1/r0 + 1/R)，A = Rs/2π、B/A = Lt（μm）
+    r0 = R2 - D
+    X = np.stack([np.log(R2 / r0), 1 / r0 + 1 / R2], axis=-1)
+    A1 = _solve2(np.einsum('bn,bni,bnj->bij', W, X, X), np.einsum('bn,bni,bn->bi', W, X, Y))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Rs0 = 2 * np.pi * A1[:, 0]; Lt0 = A1[:, 1] / A1[:, 0]
+        Rs_only = 2 * np.pi * np.sum(W * X[..., 0] * Y, 1) / np.sum(W * X[..., 0]**2, 1)
+    bad_lt = ~(np.isfinite(Lt0) & (Lt0 > 0) & np.isfinite(Rs0) & (Rs0 > 0))
+    Rs0 = np.where(bad_lt, Rs_only, Rs0); Lt0 = np.where(bad_lt, 0.01 * R2[:, 0], Lt0)
+    ok = (npts >= 2) & np.isfinite(Rs0) & (Rs0 > 0)
+    theta = np.stack([np.log(np.where(ok, Rs0, 1.0)), np.log(np.where(ok, Lt0, 1.0))], axis=-1)
+
+    def cost_of(th, a):
+        with np.errstate(all='ignore'):
+            rt = ctlm_exact_rt(D[a], R2[a], np.exp(th[:, :1]), np.exp(th[:, 1:]))
+            c = np.sum(W[a] * (rt - Y[a])**2, axis=1)
+        return np.where(np.isfinite(c), c, np.inf)
+
+    cost = cost_of(theta, slice(None))
+    lam = np.full(len(D), 1e-3)
+    active = ok.copy(); iters = np.zeros(len(D), int)
+    for _ in range(max_iter):
+        if not active.any(): break
+        a = np.flatnonzero(active)
+        with np.errstate(all='ignore'):
+            rt, J = ctlm_exact_rt(D[a], R2[a], np.exp(theta[a, :1]), np.exp(theta[a, 1:]), with_jac=True)
+        r = rt - Y[a]; w = W[a]
+        JTJ = np.einsum('bn,bni,bnj->bij', w, J, J)
+        g = np.einsum('bn,bni,bn->bi', w, J, r)
+        damp = JTJ + lam[a, None, None] * JTJ * np.eye(2)
+        step = -_solve2(damp, g)
+        trial = theta[a] + np.where(np.isfinite(step), step, 0.0)
+        c_new = cost_of(trial, a)
+        better = c_new < cost[a]
+        done = (better & (cost[a] - c_new <= tol * cost[a])) | (np.abs(step).max(axis=1) < tol) \
+               | (lam[a] > 1e12) | (cost[a] == 0)
+        theta[a] = np.where(better[:, None], trial, theta[a])
+        cost[a] = np.where(better, c_new, cost[a])
+        lam[a] = np.where(better, lam[a] / 3, lam[a] * 4)
+        iters[a] += 1
+        active[a[done]] = False
+
+    Rs = np.exp(theta[:, 0]); Lt_um = np.exp(theta[:, 1])
+    ybar = np.sum(W * Y, 1) / np.maximum(np.sum(W, 1), 1e-300)
+    ss_tot = np.sum(W * (Y - ybar[:, None])**2, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(ss_tot > 0, 1 - cost / ss_tot, np.nan)
+    ok &= np.isfinite(cost) & np.isfinite(Rs) & np.isfinite(Lt_um)
+    nan = np.full(len(D), np.nan)
+    return dict(Rs=np.where(ok, Rs, nan), Lt_um=np.where(ok, Lt_um, nan),
+                rhoc=np.where(ok, Rs * (Lt_um * UM_TO_CM)**2, nan), r2=np.where(ok, r2, nan), iters=iters, ok=ok)
+
+def rho_exact(xs, ys, R2_um, weights=None):
+    """單組 exact CTLM 擬合，回傳 (Rs, Lt_um, rhoc, r2)；d ≥ R2 的點自動略過，有效點不足回傳 None。"""
+    W = None if weights is None else np.asarray(weights, float)[None]
+    r = rho_exact_batch(np.asarray(xs, float)[None], np.asarray(ys, float)[None], R2_um, W)
+    if not r["ok"][0]: return None
+    return float(r["Rs"][0]), float(r["Lt_um"][0]), float(r["rhoc"][0]), float(r["r2"][0])
+
+# 抗離群值擬合：R0 vs spacing 直線（整批，NaN 補齊），得到的權重再餵給 Method-1/2/Exact
+ROBUST_METHODS = ("OLS", "Huber", "Tukey", "Theil–Sen")
+HUBER_C, TUKEY_C = 1.345, 4.685
+LOO_K, LOO_MIN_REL = 3.5, 0.1  # 留一法：studentized residual > 3.5 且偏離預測值 > 10% 才標記
+
+def _wline(X, Y, W):
+    """整批加權直線 y = a·x + b（W=0 的點不計），回傳 a, b。"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sw = W.sum(1)
+        xm = (W*X).sum(1) / sw; ym = (W*Y).sum(1) / sw
+        dx = X - xm[:, None]
+        a = (W*dx*(Y - ym[:, None])).sum(1) / (W*dx*dx).sum(1)
+    return a, ym - a*xm
+
+def _row_nanmedian(A):
+    """逐列忽略 NaN 的中位數（比 np.nanmedian 對小陣列快很多）；整列 NaN 回傳 NaN。"""
+    S = np.sort(A, axis=1)  # NaN 排在最後
+    n = np.sum(~np.isnan(A), axis=1)
+    lo = np.take_along_axis(S, np.maximum((n - 1) // 2, 0)[:, None], 1)[:, 0]
+    hi = np.take_along_axis(S, np.maximum(n // 2 - (n == 0), 0)[:, None], 1)[:, 0]
+    return np.where(n > 0, 0.5 * (lo + hi), np.nan)
+
+def _robust_scale(R, valid, Y):
+    """每組有效點殘差的 1.4826·MAD（對殘差中位數）；下限 1e-6·median|Y|，
+    幾乎完全貼合的組不會因尺度趨近 0 而把好點當離群。"""
+    Rv = np.where(valid, R, np.nan)
+    mad = 1.4826 * _row_nanmedian(np.abs(Rv - _row_nanmedian(Rv)[:, None]))
+    floor = 1e-6 * _row_nanmedian(np.where(valid, np.abs(Y), np.nan))
+    return np.maximum(np.maximum(np.nan_to_num(mad), np.nan_to_num(floor)), 1e-12)
+
+def _prep_sets(X, Y, W):
+    X, Y = np.broadcast_arrays(np.atleast_2d(np.asarray(X, float)), np.atleast_2d(np.asarray(Y, float)))
+    W = np.ones(X.shape) if W is None else np.broadcast_to(np.asarray(W, float), X.shape)
+    valid = np.isfinite(X) & np.isfinite(Y) & np.isfinite(W) & (W > 0)
+    return np.where(valid, X, 0.0), np.where(valid, Y, 0.0), np.where(valid, W, 0.0), valid
+
+def robust_line_batch(X, Y, method="Huber", W=None, max_iter=50, tol=1e-7):
+    """整批直線擬合。method: OLS / Huber / Tukey（IRLS，MAD 尺度）/ Theil–Sen（成對斜率中位數）。
+    回傳 dict(a, b, r2, w)；w 為每點最後的權重（0 = 不採用），可直接當作 rho_method1/2/exact 的 weights。"""
+    X, Y, W0, valid = _prep_sets(X, Y, W)
+    if method == "Theil–Sen":
+        i, j = np.triu_indices(X.shape[1], 1)
+        dx = X[:, j] - X[:, i]
+        ok = valid[:, i] & valid[:, j] & (dx != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = _row_nanmedian(np.where(ok, (Y[:, j] - Y[:, i]) / dx, np.nan))
+            b = _row_nanmedian(np.where(valid, Y - a[:, None]*X, np.nan))
+        R = Y - (a[:, None]*X + b[:, None])
+        w = W0 * (np.abs(R) <= TUKEY_C * _robust_scale(R, valid, Y)[:, None])  # 下游擬合：遠離中位數直線的點不採用
+    elif method in ("Huber", "Tukey"):
+        if method == "Tukey":  # redescending：從 Huber 解出發，避免一開始就把好點全部丟掉
+            start = robust_line_batch(X, Y, "Huber", W0, max_iter, tol)
+            a, b = start["a"], start["b"]
+        else:
+            a, b = _wline(X, Y, W0)
+        for _ in range(max_iter):
+            R = Y - (a[:, None]*X + b[:, None])
+            u = R / _robust_scale(R, valid, Y)[:, None]
+            if method == "Huber":
+                au = np.abs(u)
+                w = W0 * np.where(au <= HUBER_C, 1.0, HUBER_C / np.maximum(au, 1e-300))
+            else:
+                w = W0 * np.where(np.abs(u) < TUKEY_C, (1 - (u / TUKEY_C)**2)**2, 0.0)
+            a_new, b_new = _wline(X, Y, w)
+            keep = ~np.isfinite(a_new)
+            a_new = np.where(keep, a, a_new); b_new = np.where(keep, b, b_new)
+            step = np.abs(a_new - a) + np.abs(b_new - b)
+            a, b = a_new, b_new
+            if not np.any(step > tol * (np.abs(a) * np.abs(X).max(1) + np.abs(b) + 1e-300)): break
+    else:
+        w = W0.copy()
+        a, b = _wline(X, Y, w)
+    R = Y - (a[:, None]*X + b[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ybar = (w*Y).sum(1) / w.sum(1)
+        ss_tot = (w*(Y - ybar[:, None])**2).sum(1)
+        r2 = np.where(ss_tot > 0, 1 - (w*R*R).sum(1) / ss_tot, np.nan)
+    return dict(a=a, b=b, r2=r2, w=w)
+
+def loo_flags_batch(X, Y, W=None, k=LOO_K, min_rel=LOO_MIN_REL):
+    """留一法離群點標記（整批）：點 i 對「其餘點擬合直線」的 externally studentized residual 超過 k，
+    且預測誤差 e_i/(1−h_ii) 大於預測值的 min_rel 倍才標記。有效點少於 4 的組不標記。"""
+    X, Y, W0, valid = _prep_sets(X, Y, W)
+    a, b = _wline(X, Y, W0)
+    n = valid.sum(1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sw = W0.sum(1, keepdims=True); xm = (W0*X).sum(1, keepdims=True) / sw
+        h = W0 * (1/sw + (X - xm)**2 / (W0*(X - xm)**2).sum(1, keepdims=True))
+        e = Y - (a[:, None]*X + b[:, None])
+        sse = (W0*e*e).sum(1, keepdims=True)
+        s_del = np.sqrt(np.maximum(sse - W0*e*e/(1 - h), 0) / (n - 3))  # 去掉點 i 後的殘差標準差
+        t = np.sqrt(W0) * e / (s_del * np.sqrt(1 - h))
+        d = e / (1 - h)
+        rel = np.abs(d) / np.abs(Y - d)
+    t = np.where(np.isfinite(t), np.abs(t), np.where(np.abs(e) > 0, np.inf, 0.0))
+    return valid & (n >= 4) & (t > k) & (np.nan_to_num(rel, nan=np.inf) > min_rel)
+
+def ctlm_outliers(D, Y, R2_um=None, method="OLS"):
+    """整批 CTLM 離群判斷，回傳 (weights, flags)，形狀同 D / Y；R2_um 可為純量或 (n_sets,)。
+    在 Method-2 的修正座標 Rt/C(d) 對 d 上判斷（CTLM 下為直線；R2 無效時退回原始 R0 對 d）。
+    OLS：weights 為 None（擬合不變），只標記；其他方法：穩健權重，且被留一法標記的點權重為 0。"""
+    D, Y = np.broadcast_arrays(np.atleast_2d(np.asarray(D, float)), np.atleast_2d(np.asarray(Y, float)))
+    Yc = Y
+    if R2_um is not None:  # 純量或每組一個（NaN = 該組沒有 R2，用原始 R0）
+        R2 = np.reshape(np.asarray(R2_um, float), (-1, 1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            C = (R2/D)*np.log(R2/(R2 - D))
+            Yc = np.where(np.isfinite(R2), np.where((D > 0) & (D < R2), Y / C, np.nan), Y)
+    flags = loo_flags_batch(D, Yc)
+    if method == "OLS":
+        return None, flags
+    w = robust_line_batch(D, Yc, method)["w"]
+    return np.where(flags, 0.0, w), flags
+
+
+# ---------- 圖表樣式（純值版本，Tk 以外的執行緒/行程也能用） ----------
+def panel_defaults(title="", xl="", yl=""):
+    return dict(title=title, xlabel=xl, ylabel=yl, x_auto=True, y_auto=True,
+                xmin="", xmax="", ymin="", ymax="", xscale="linear", yscale="linear",
+                dpi="300", figw="6", figh="4",
+                show_legend=True, legend_size="14", legend_ncol="1",
+                title_size="20", label_size="18")
+
+PANEL_OPT_KEYS = tuple(panel_defaults())
+
+def panel_values(panel):
+    """把 preview panel 的 tk 變數取成一般 dict（可 pickle）。"""
+    return {k: panel[k].get() for k in PANEL_OPT_KEYS}
+
+def style_axes(ax, o):
+    from matplotlib.ticker import AutoMinorLocator
+    ts = int(o['title_size'] or 12)
+    ls = int(o['label_size'] or 12)
+    ax.set_title(o['title'], fontsize=ts, fontweight='bold')
+    ax.set_xlabel(o['xlabel'], fontsize=ls, fontweight='bold')
+    ax.set_ylabel(o['ylabel'], fontsize=ls, fontweight='bold')
+    ax.set_xscale(o['xscale']); ax.set_yscale(o['yscale'])
+    if not o['x_auto']:
+        xmin = safe_float(o['xmin']); xmax = safe_float(o['xmax'])
+        if xmin is not None and xmax is not None: ax.set_xlim([xmin, xmax])
+    if not o['y_auto']:
+        ymin = safe_float(o['ymin']); ymax = safe_float(o['ymax'])
+        if ymin is not None and ymax is not None: ax.set_ylim([ymin, ymax])
+    ax.tick_params(which='both', direction='in', length=8, width=2, top=False, right=False, bottom=True, left=True, labelsize=14)
+    ax.tick_params(which='minor', length=4, width=1, direction='in', top=False, right=False, bottom=True, left=True)
+    ax.xaxis.set_minor_locator(AutoMinorLocator()); ax.yaxis.set_minor_locator(AutoMinorLocator())
+    ax.grid(which='major', linestyle='-', linewidth=0.5, color='darkgray')
+    for s in ['top','right','bottom','left']:
+        ax.spines[s].set_color('black'); ax.spines[s].set_linewidth(2)
+
+def apply_legend(ax, o, handles=None, labels=None, total=None):
+    """handles/labels 省略時取 ax 上的；total 比 handles 多（快速疊圖只建了前幾條 proxy）時
+    只列前 LEGEND_MAX_ENTRIES 條，最後一條寫「… +N more」；逐條畫的圖 legend 照舊全列。"""
+    if not o['show_legend']: return
+    if handles is None:
+        handles, labels = ax.get_legend_handles_labels()
+    handles, labels = list(handles), list(labels)
+    total = max(total or 0, len(handles))
+    if total > len(handles):
+        from matplotlib.lines import Line2D
+        keep = min(len(handles), LEGEND_MAX_ENTRIES - 1)
+        handles = handles[:keep] + [Line2D([], [], linestyle="none")]
+        labels = labels[:keep] + [f"… +{total - keep} more"]
+    if not handles: return
+    fsz = int(o['legend_size'] or 10)
+    ncol = int(o['legend_ncol'] or 2)
+    leg = ax.legend(handles, labels, ncol=ncol, fancybox=True, loc='best', prop={'weight':'bold','size':fsz})
+    leg.get_frame().set_edgecolor('black'); leg.get_frame().set_linewidth(2)
+
+# ---------- 大量曲線疊圖（一個 LineCollection + 一個 PathCollection） ----------
+FAST_OVERLAY_MIN = 40     # 曲線數達到這個值才改用 collection；少量時維持逐條 ax.plot，輸出外觀不變
+LEGEND_MAX_ENTRIES = 12
+
+def plot_overlay_fast(ax, series, lw=1.2, ms=3, marker_edge=False):
+    """series: [(X, Y, label, color, line_on, marker_on)]。
+
+    所有線段放進單一 LineCollection，所有 marker 放進單一 scatter；legend 只建前
+    LEGEND_MAX_ENTRIES 個 proxy。回傳 (handles, labels, total) 交給 apply_legend。
+    """
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import to_rgba_array
+    from matplotlib.lines import Line2D
+    segs, seg_colors = [], []
+    mx, my, mcolors, mcounts = [], [], [], []
+    for X, Y, _lab, clr, line_on, mark_on in series:
+        X = np.asarray(X, float); Y = np.asarray(Y, float)
+        Y = np.where(np.isfinite(Y), Y, np.nan)
+        if line_on:
+            segs.append(np.column_stack([X, Y])); seg_colors.append(clr)
+        if mark_on:
+            mx.append(X); my.append(Y); mcolors.append(clr); mcounts.append(len(X))
+    if segs:
+        ax.add_collection(LineCollection(segs, colors=seg_colors, linewidths=lw), autolim=True)
+    if mx:
+        ax.scatter(np.concatenate(mx), np.concatenate(my), s=ms**2,
+                   c=np.repeat(to_rgba_array(mcolors), mcounts, axis=0),
+                   edgecolors='black' if marker_edge else 'face', linewidths=1.0 if marker_edge else 0)
+    ax.autoscale_view()
+    shown = series[:LEGEND_MAX_ENTRIES]
+    handles = [Line2D([], [], color=clr, linewidth=lw if line_on else 0, marker='o' if mark_on else None,
+                      markersize=ms, markeredgecolor='black' if (mark_on and marker_edge) else clr)
+               for _X, _Y, _lab, clr, line_on, mark_on in shown]
+    return handles, [lab for _X, _Y, lab, *_ in shown], len(series)
+
+def scatter_points_fast(ax, xs, ys, labels, colors, reserve=0):
+    """R–Spacing 點一次畫成單一 PathCollection；回傳前幾點的 legend proxy（保留 reserve 個位置給 fit 線）。"""
+    from matplotlib.lines import Line2D
+    ax.scatter(xs, ys, c=list(colors), edgecolors='black')
+    n = max(LEGEND_MAX_ENTRIES - 1 - reserve, 0)
+    handles = [Line2D([], [], linestyle="none", marker='o', markerfacecolor=c, markeredgecolor='black', markersize=7)
+               for c in list(colors)[:n]]
+    return handles, list(labels)[:n]
+
+# ---------- 游標讀值 / 點選（像素空間索引） ----------
+class CurvePicker:
+    """series: [(X, Y, tag)]。把所有曲線點畫進一張與 axes 同大小的像素格（每格記 curve / 點的索引，
+    後畫的蓋掉先畫的，和畫面上的上下順序一致）；查詢只看游標周圍 (2r+1)² 格，與曲線數、點數無關。
+    軸範圍或大小（含 resize）改變時在下一次查詢前重建。"""
+
+    def __init__(self, ax, series):
+        self.ax = ax; self.series = series
+        self._key = None
+
+    def _build(self):
+        x0, y0, w, h = self.ax.bbox.bounds
+        W, H = max(int(np.ceil(w)), 1), max(int(np.ceil(h)), 1)
+        self.origin = (x0, y0)
+        self.cid = np.full((H, W), -1, np.int32); self.pidx = np.zeros((H, W), np.int32)
+        trans = self.ax.transData
+        A = trans.get_matrix() if trans.is_affine else None
+        scaled = A is not None and A[0, 1] == 0 and A[1, 0] == 0  # 線性軸：x、y 各自縮放平移即可
+        for k, (X, Y, _tag) in enumerate(self.series):
+            X = np.asarray(X, float); Y = np.asarray(Y, float)
+            with np.errstate(all="ignore"):
+                if scaled:
+                    gx = X * A[0, 0] + (A[0, 2] - x0); gy = Y * A[1, 1] + (A[1, 2] - y0)
+                else:
+                    P = trans.transform(np.column_stack([X, Y])); gx = P[:, 0] - x0; gy = P[:, 1] - y0
+                idx = np.flatnonzero((gx >= 0) & (gx <= W) & (gy >= 0) & (gy <= H))  # 落在右 / 上邊界的點也收進最後一格
+            if not idx.size: continue
+            cells = np.minimum(gy[idx].astype(np.intp), H - 1) * W + np.minimum(gx[idx].astype(np.intp), W - 1)  # ≥0，截尾 = floor
+            self.cid.flat[cells] = k; self.pidx.flat[cells] = idx
+
+    def query(self, x, y, radius=8):
+        """螢幕座標 (x, y) 附近 radius 像素內最近的資料點 → (tag, X, Y)；沒有則 None。"""
+        key = (tuple(self.ax.viewLim.bounds), tuple(self.ax.bbox.bounds))
+        if key != self._key:
+            self._build(); self._key = key
+        H, W = self.cid.shape
+        gx = int(x - self.origin[0]); gy = int(y - self.origin[1])
+        xa, xb = max(gx - radius, 0), min(gx + radius + 1, W)
+        ya, yb = max(gy - radius, 0), min(gy + radius + 1, H)
+        if xa >= xb or ya >= yb: return None
+        iy, ix = np.nonzero(self.cid[ya:yb, xa:xb] >= 0)
+        if not iy.size: return None
+        d2 = (ix + xa - gx)**2 + (iy + ya - gy)**2
+        k = int(np.argmin(d2))
+        if d2[k] > radius * radius: return None
+        cy, cx = iy[k] + ya, ix[k] + xa
+        X, Y, tag = self.series[self.cid[cy, cx]]
+        p = self.pidx[cy, cx]
+        return tag, float(X[p]), float(Y[p])
+
+# ---------- Sweep 縮圖（sparkline：背景執行緒 render，記憶體 + 磁碟 LRU） ----------
+SPARK_W, SPARK_H = 96, 22
+SPARK_RGB = (0x58, 0xa6, 0xff)
+SPARK_IMAGES = 512          # 主執行緒最多留幾張 PhotoImage（捲遠的列換回空白）
+SPARK_DISK_MB = 64
+SPARK_CACHE_DIR = Path(os.environ.get("TRINITY_CACHE") or Path.home() / ".cache" / "trinity_capres") / "sparklines"
+
+def render_sparkline(V, Y, w=SPARK_W, h=SPARK_H, rgb=SPARK_RGB):
+    """(V, Y) → h×w RGBA uint8（透明底）。點多時先依取樣順序分段留 min / max（尖峰不會被抽掉），
+    再沿折線以不超過 1 px 的間距描點；Y 依本身範圍縮放，0 在範圍內時畫一條淡基準線。"""
+    V = np.asarray(V, float); Y = np.asarray(Y, float)
+    ok = np.isfinite(V) & np.isfinite(Y); V, Y = V[ok], Y[ok]
+    img = np.zeros((h, w, 4), np.uint8)
+    if V.size < 2: return img
+    if V.size > 4 * w:
+        k = -(-V.size // (2 * w)); nb = -(-V.size // k)
+        B = np.pad(Y, (0, nb * k - Y.size), mode="edge").reshape(nb, k)
+        base = np.arange(nb) * k
+        keep = np.unique(np.minimum(np.concatenate([base + B.argmin(1), base + B.argmax(1)]), V.size - 1))
+        V, Y = V[keep], Y[keep]
+    v0, v1, y0, y1 = V.min(), V.max(), Y.min(), Y.max()
+    sx = (w - 1) / (v1 - v0) if v1 > v0 else 0.0
+    sy = (h - 3) / (y1 - y0) if y1 > y0 else 0.0
+    x = (V - v0) * sx; y = (h - 2) - (Y - y0) * sy
+    if y0 < 0 < y1: img[int(round((h - 2) + y0 * sy)), :] = (128, 128, 128, 90)
+    dx, dy = np.diff(x), np.diff(y)
+    n = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.intp) + 1
+    seg = np.repeat(np.arange(n.size), n)
+    t = (np.arange(seg.size) - np.repeat(np.cumsum(n) - n, n)) / n[seg]
+    px = np.append(x[:-1][seg] + t * dx[seg], x[-1]); py = np.append(y[:-1][seg] + t * dy[seg], y[-1])
+    img[np.clip(np.rint(py).astype(np.intp), 0, h - 1), np.clip(np.rint(px).astype(np.intp), 0, w - 1)] = (*rgb, 255)
+    return img
+
+def png_rgba(img):
+    """h×w×4 uint8 → PNG bytes（不需要 PIL；Tk 8.6 的 PhotoImage 可直接讀）。"""
+    import struct, zlib
+    h, w = img.shape[:2]
+    raw = np.zeros((h, 1 + 4 * w), np.uint8); raw[:, 1:] = img.reshape(h, -1)  # 每列 filter 0
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + chunk(b"IEND", b""))
+
+def spark_key(V, Y, w=SPARK_W, h=SPARK_H):
+    """縮圖的內容鍵（資料 + 尺寸），同一條曲線在不同 session / 檔名下也能命中磁碟快取。"""
+    import hashlib
+    k = hashlib.blake2b(f"spark1:{w}x{h}:{len(V)}".encode(), digest_size=16)
+    k.update(np.ascontiguousarray(V, float).tobytes()); k.update(np.ascontiguousarray(Y, float).tobytes())
+    return k.hexdigest()
+
+class SparklineCache:
+    """內容鍵 → PNG bytes：前面是記憶體 LRU，後面是磁碟（一張一檔，依存取時間淘汰，總量上限 disk_mb）。
+    只在 SparklineRenderer 的背景執行緒使用；磁碟不能寫時退回只用記憶體。"""
+    def __init__(self, root=SPARK_CACHE_DIR, mem=4096, disk_mb=SPARK_DISK_MB):
+        self.root, self.mem, self.cap = (Path(root) if root else None), _LRUCache(mem), disk_mb * 1024 * 1024
+        self._files = None  # OrderedDict 名稱 → 大小（舊 → 新），第一次用到磁碟時掃描
+
+    def _index(self):
+        if self._files is None:
+            from collections import OrderedDict
+            self.root.mkdir(parents=True, exist_ok=True)
+            st = sorted(((p.stat().st_mtime, p.name, p.stat().st_size) for p in self.root.glob("*.png")))
+            self._files = OrderedDict((n, sz) for _, n, sz in st); self._bytes = sum(self._files.values())
+        return self._files
+
+    def get(self, key):
+        png = self.mem.get(key)
+        if png is not None or self.root is None: return png
+        name = key + ".png"
+        try:
+            files = self._index()
+            if name not in files: return None
+            p = self.root / name; png = p.read_bytes(); os.utime(p)
+        except OSError:
+            return None
+        files.move_to_end(name); self.mem.put(key, png)
+        return png
+
+    def put(self, key, png):
+        self.mem.put(key, png)
+        if self.root is None: return
+        name = key + ".png"
+        try:
+            files = self._index()
+            tmp = self.root / f".{name}.{os.getpid()}.tmp"
+            tmp.write_bytes(png); os.replace(tmp, self.root / name)
+            self._bytes += len(png) - files.pop(name, 0); files[name] = len(png)
+            while self._bytes > self.cap and len(files) > 1:
+                old, sz = files.popitem(last=False); self._bytes -= sz
+                (self.root / old).unlink(missing_ok=True)
+        except OSError:
+            self.root = None
+
+class SparklineRenderer:
+    """一條 daemon 執行緒：submit(row, V, Y) → 查快取或 render → PNG，主執行緒用 results() 取回（不碰 Tk）。
+    wanted 是主執行緒目前要的列，已捲出畫面的工作直接跳過；reset() 換資料時讓舊工作全部作廢。"""
+    def __init__(self, cache=None):
+        import queue
+        self.cache = cache if cache is not None else SparklineCache()
+        self.jobs, self.done = queue.Queue(), queue.Queue()
+        self.gen, self.wanted, self._thread = 0, frozenset(), None
+
+    def reset(self):
+        self.gen += 1; self.wanted = frozenset()
+
+    def submit(self, row, V, Y):
+        if self._thread is None:
+            import threading
+            self._thread = threading.Thread(target=self._run, name="sparklines", daemon=True); self._thread.start()
+        self.jobs.put((self.gen, row, V, Y))
+
+    def _run(self):
+        while True:
+            gen, row, V, Y = self.jobs.get()
+            if gen != self.gen or row not in self.wanted:
+                self.done.put((gen, row, None)); continue      # None：沒做，之後看得到時再排
+            try:
+                key = spark_key(V, Y); png = self.cache.get(key)
+                if png is None:
+                    png = png_rgba(render_sparkline(V, Y)); self.cache.put(key, png)
+            except Exception:
+                png = b""                                       # 空 bytes：畫不出來，不再重試
+            self.done.put((gen, row, png))
+
+    def results(self):
+        """[(row, png)]，只含目前世代的結果。"""
+        import queue
+        out = []
+        while True:
+            try: gen, row, png = self.done.get_nowait()
+            except queue.Empty: return out
+            if gen == self.gen: out.append((row, png))
+
+
+# ---------- 離線繪圖（Agg，不經 pyplot，可在 worker process 執行） ----------
+OVERLAY_KINDS = {
+    "iv": ("I–V Curves", "Voltage (V)", "Current (A)"),
+    "rv": ("Differential Resistance R(V)", "Voltage (V)", "Resistance (Ω)"),
+    "cv": ("C–V (per frequency)", "Voltage (V)", "Capacitance (F)"),
+    "rs": ("R0 vs Spacing", "Spacing d (μm)", "Resistance R0 (Ω)"),
+}
+
+def render_overlay(curves, kind, outfile, opts=None, window=0.5, spacings=None, rules=None):
+    """把 curves 畫成單張 overlay 圖（iv / rv / cv / rs）並存檔，回傳輸出路徑。
+    rs：沒給 spacings 時依分組規則（DEFAULT_GROUP_RULES + rules）取 spacing，取不到的曲線略過。"""
+    o = panel_defaults(*OVERLAY_KINDS[kind]); o.update(opts or {})
+    dpi = int(o['dpi'] or 300)
+    fig, ax = new_subplots(safe_float(o['figw'], 6), safe_float(o['figh'], 4), dpi)
+    ycol = "C" if kind == "cv" else "I"
+    items = [c for c in curves if c.get(ycol) is not None]
+    n = len(items); leg = ()
+    if kind == "rs":
+        xs, ys, labs, clrs = [], [], [], []
+        compiled = compile_group_rules(dict(DEFAULT_GROUP_RULES, **(rules or {})))
+        for k, c in enumerate(items):
+            sp = spacings[k] if spacings and k < len(spacings) else extract_group_fields(c, compiled)["spacing"]
+            if sp is None or not sp > 0: continue
+            R0 = compute_r0_at_zero(c["V"], c["I"], window=window)
+            if not np.isfinite(R0): continue
+            xs.append(float(sp)); ys.append(float(R0)); labs.append(c["label"]); clrs.append(rainbow_color(k, n))
+        fast = len(xs) >= FAST_OVERLAY_MIN
+        if fast:
+            pt_handles, pt_labels = scatter_points_fast(ax, xs, ys, labs, clrs, reserve=1)
+        else:
+            for x, y, lab, clr in zip(xs, ys, labs, clrs):
+                ax.scatter(x, y, label=lab, color=clr, edgecolors='black')
+        if len(xs) >= 2:
+            a, b = np.polyfit(xs, ys, 1)
+            xfit = np.linspace(min(xs), max(xs), 200)
+            ax.plot(xfit, a*xfit + b, color="black", linewidth=1.2, linestyle="--", label="fit")
+        if fast:
+            fit_h, fit_l = ax.get_legend_handles_labels()
+            leg = (pt_handles + fit_h, pt_labels + fit_l, len(xs) + len(fit_h))
+    else:
+        series = [(*(compute_rv(c["V"], c["I"]) if kind == "rv" else (c["V"], c[ycol])), c["label"], rainbow_color(k, n), True, False)
+                  for k, c in enumerate(items)]
+        lw = 1.5 if kind == "iv" else 1.2
+        if n >= FAST_OVERLAY_MIN:
+            leg = plot_overlay_fast(ax, series, lw=lw)
+        else:
+            for V, Y, lab, clr, _l, _m in series:
+                ax.plot(V, Y, label=lab, color=clr, linewidth=lw)
+    style_axes(ax, o); apply_legend(ax, o, *leg)
+    fig.tight_layout(); fig.savefig(outfile, dpi=dpi)
+    return str(outfile)
+
+# ---------- 多頁 PDF 報告（串流：逐頁 render → 寫入 → 釋放） ----------
+REPORT_PAGE_SIZE = (11.69, 8.27)  # A4 橫式 (inch)
+REPORT_TABLE_ROWS = 30
+
+def bounded_map(fn, iterable, executor=None, lookahead=8):
+    """保持順序的 map，但在途工作最多 lookahead 個，總量再大記憶體也不會跟著長。"""
+    if executor is None:
+        for a in iterable:
+            yield fn(a)
+        return
+    from collections import deque
+    q = deque()
+    for a in iterable:
+        q.append(executor.submit(fn, a))
+        if len(q) >= lookahead:
+            yield q.popleft().result()
+    while q:
+        yield q.popleft().result()
+
+def die_fit_summary(job):
+    """job = (name, items, window, R2_um)；items 需含 V / I / spacing。回傳精簡的擬合結果。"""
+    name, items, window, R2_um = job
+    pts = []
+    for it in items:
+        if it.get("spacing") is None: continue
+        R0 = compute_r0_at_zero(it["V"], it["I"], window=window)
+        if np.isfinite(R0): pts.append((float(it["spacing"]), float(R0), it["label"], it["color"]))
+    xs = np.array([p[0] for p in pts]); ys = np.array([p[1] for p in pts])
+    ols = None
+    if xs.size >= 2:
+        a, b = np.polyfit(xs, ys, 1)
+        ss_tot = np.sum((ys - ys.mean())**2)
+        ols = (float(a), float(b), 1 - np.sum((ys - (a*xs + b))**2)/ss_tot if ss_tot > 0 else np.nan)
+    fit = _fit_result(rho_method1(xs, ys, R2_um) if R2_um is not None else None,
+                      rho_method2(xs, ys, R2_um) if R2_um is not None else None,
+                      rho_exact(xs, ys, R2_um) if R2_um is not None else None, ols[2] if ols else np.nan)
+    return dict(name=name, pts=pts, ols=ols, **fit)
+
+def die_page_payload(job, summary=None):
+    """單一 die 頁面所需資料（I–V、R–V、R0 點與擬合），在背景執行緒先算好；
+    summary 為摘要頁已算過的 die_fit_summary(job)，省略時才重算。"""
+    summary = dict(summary or die_fit_summary(job))
+    items = job[1]
+    summary["iv"] = [(it["label"], it["color"], it["V"], it["I"]) for it in items]
+    summary["rv"] = [(it["label"], it["color"], *compute_rv(it["V"], it["I"])) for it in items]
+    return summary
+
+def _fmt_fit_line(tag, f):
+    if f is None: return f"{tag}: fail (check 0<d<R2 & points)"
+    return f"{tag}: Rs={f['Rs']:.6g} Ω/□, Lt={f['Lt_um']:.6g} μm, ρc={f['rhoc']:.6g} Ω·cm²"
+
+def _plot_report_curves(ax, curves, lw):
+    """curves: [(label, color, X, Y)]；數量多時走 plot_overlay_fast，回傳 legend 參數。"""
+    if len(curves) >= FAST_OVERLAY_MIN:
+        return plot_overlay_fast(ax, [(X, Y, lab, clr, True, False) for lab, clr, X, Y in curves], lw=lw)
+    for lab, clr, X, Y in curves:
+        ax.plot(X, Y, label=lab, color=clr, linewidth=lw)
+    return ()
+
+def render_summary_pages(rows, title):
+    """rows: die_fit_summary 的結果；每頁 REPORT_TABLE_ROWS 列，逐頁 yield Figure。"""
+    cols = ["Die", "#pts", "Rs₁ (Ω/□)", "Lt₁ (μm)", "ρc₁ (Ω·cm²)", "Rs₂ (Ω/□)", "Lt₂ (μm)", "ρc₂ (Ω·cm²)", "ρc exact (Ω·cm²)", "R² (OLS)"]
+    def g(f, k): return f"{f[k]:.4g}" if f is not None else "—"
+    npages = max(1, -(-len(rows) // REPORT_TABLE_ROWS))
+    for pg in range(npages):
+        chunk = rows[pg*REPORT_TABLE_ROWS:(pg+1)*REPORT_TABLE_ROWS]
+        cells = [[r["name"], str(len(r["pts"])),
+                  g(r["method1"], "Rs"), g(r["method1"], "Lt_um"), g(r["method1"], "rhoc"),
+                  g(r["method2"], "Rs"), g(r["method2"], "Lt_um"), g(r["method2"], "rhoc"), g(r["exact"], "rhoc"),
+                  f"{r['ols'][2]:.4f}" if r["ols"] else "—"] for r in chunk] or [["—"]*len(cols)]
+        fig = new_figure(REPORT_PAGE_SIZE)
+        ax = fig.add_subplot(111); ax.axis("off")
+        ax.set_title(f"{title} — summary ({pg+1}/{npages})", fontsize=16, fontweight="bold")
+        tbl = ax.table(cellText=cells, colLabels=cols, loc="upper center", cellLoc="center")
+        tbl.auto_set_font_size(False); tbl.set_fontsize(9); tbl.scale(1, 1.25)
+        yield fig
+
+def render_die_page(payload, opts):
+    """opts: {"iv": ..., "rv": ..., "rs": ...} 各自的 panel 值；2×2：I–V、R–V、R–Spacing、擬合文字。"""
+    fig = new_figure(REPORT_PAGE_SIZE)
+    axs = fig.subplots(2, 2)
+    name = payload["name"]
+    for ax, kind, curves in ((axs[0, 0], "iv", payload["iv"]), (axs[0, 1], "rv", payload["rv"])):
+        leg = _plot_report_curves(ax, curves, 1.5 if kind == "iv" else 1.2)
+        o = dict(opts[kind]); o["title"] = f"{o['title']} — {name}"
+        style_axes(ax, o); apply_legend(ax, o, *leg)
+    ax = axs[1, 0]
+    for x, y, lab, clr in payload["pts"]:
+        ax.scatter(x, y, label=lab, color=clr, edgecolors='black')
+    if payload["ols"]:
+        a, b, _r2 = payload["ols"]; xs = [p[0] for p in payload["pts"]]
+        xfit = np.linspace(min(xs), max(xs), 200)
+        ax.plot(xfit, a*xfit + b, color="black", linewidth=1.2, linestyle="--", label="fit")
+    o = dict(opts["rs"]); o["title"] = f"{o['title']} — {name}"
+    style_axes(ax, o); apply_legend(ax, o)
+    ax = axs[1, 1]; ax.axis("off")
+    lines = [f"Die: {name}", f"R0 points: {len(payload['pts'])}"]
+    if payload["ols"]:
+        a, b, r2 = payload["ols"]
+        lines.append(f"R0 vs Spacing: a={a:.6g} Ω/μm, b={b:.6g} Ω, R²={r2:.4f}")
+    lines.append(_fmt_fit_line("Method-1", payload["method1"]))
+    lines.append(_fmt_fit_line("Method-2", payload["method2"]))
+    lines.append(_fmt_fit_line("Exact (Bessel)", payload["exact"]))
+    ax.text(0.02, 0.95, "\n".join(lines), va="top", ha="left", fontsize=11, transform=ax.transAxes, wrap=True)
+    fig.tight_layout()
+    return fig
+
+def render_cv_page(freq_label, curves, opts):
+    """同一頻率的所有 C–V 曲線疊圖成一頁。curves: [(label, color, V, C)]"""
+    fig = new_figure(REPORT_PAGE_SIZE)
+    ax = fig.add_subplot(111)
+    leg = _plot_report_curves(ax, curves, 1.2)
+    o = dict(opts); o["title"] = f"{o['title']} — {freq_label}"
+    style_axes(ax, o); apply_legend(ax, o, *leg)
+    fig.tight_layout()
+    return fig
+
+def write_pdf_report(outfile, dies, cv_groups, opts, window=0.5, R2_um=None, title=APP_TITLE,
+                     workers=None, progress=None):
+    """dies: [(name, items)] 或 [(name, items, R2_um)]（該 die 自己的 R2）；cv_groups: [(freq_label, [(label, color, V, C)])]。
+
+    頁面資料（R0、擬合、R–V）在執行緒池中以有限 lookahead 先行計算，主執行緒依序
+    render → PdfPages.savefig → 釋放 figure；PDF 本身是單一串流檔，頁面寫入必須循序。
+    回傳頁數。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from matplotlib.backends.backend_pdf import PdfPages
+    workers = workers or min(4, os.cpu_count() or 1)
+    jobs = lambda: ((d[0], d[1], window, d[2] if len(d) > 2 and d[2] is not None else R2_um) for d in dies)
+    pages = 0
+    with ThreadPoolExecutor(max_workers=workers) as ex, \
+         PdfPages(outfile, metadata={"Title": title, "Creator": APP_TITLE}) as pdf:
+        def emit(fig):
+            nonlocal pages
+            pdf.savefig(fig); fig.clear(); pages += 1
+            if progress: progress(pages)
+        summary = list(bounded_map(die_fit_summary, jobs(), ex, lookahead=4*workers))
+        for fig in render_summary_pages(summary, title):
+            emit(fig)
+        for payload in bounded_map(lambda js: die_page_payload(*js), zip(jobs(), summary), ex, lookahead=2*workers):
+            emit(render_die_page(payload, opts))
+        for freq_label, curves in cv_groups:
+            emit(render_cv_page(freq_label, curves, opts["cv"]))
+    return pages
+
+# ---------- 共享記憶體傳輸（curve 陣列不經 pickle：worker 之間只傳 segment 名稱與 offset） ----------
+SHM_PREFIX = "trinity_"
+SHM_MIN_BYTES = 256 * 1024  # 小於這個量的一批直接 pickle，省掉建立 segment 的系統呼叫
+SHM_RESULTS = os.name != "nt"  # Windows 的 segment 在最後一個 handle 關掉時就消失，worker 建的無法交給主程序
+_CURVE_ARRAYS = ("V", "I", "C")
+_SHM_OPEN = {}  # name → 本程序開著的 SharedMemory
+_SHM_OWNED = set()  # 其中由本程序負責 unlink 的（fork 出的子程序不繼承）
+_SHM_ROOTS = None  # name → 該 segment 的 root view（WeakValueDictionary）
+_SHM_HOOKED = False
+
+def _shm_install_cleanup():
+    """第一次建立 / 接手 segment 時掛上 atexit 與 SIGTERM / SIGHUP；被 kill -9 時由 resource tracker
+    與下次啟動的 shm_sweep_stale 收拾。"""
+    global _SHM_HOOKED
+    if _SHM_HOOKED: return
+    _SHM_HOOKED = True
+    import atexit, signal, threading
+    atexit.register(_shm_cleanup_all)
+    if hasattr(os, "register_at_fork"): os.register_at_fork(after_in_child=_SHM_OWNED.clear)
+    if threading.current_thread() is not threading.main_thread(): return
+    for sig in (getattr(signal, "SIGTERM", None), getattr(signal, "SIGHUP", None)):
+        if sig is None: continue
+        prev = signal.getsignal(sig)
+        def handler(signum, frame, prev=prev):
+            _shm_cleanup_all()
+            if callable(prev): return prev(signum, frame)
+            signal.signal(signum, signal.SIG_DFL); os.kill(os.getpid(), signum)
+        try: signal.signal(sig, handler)
+        except (ValueError, OSError): pass
+
+def _shm_close(shm):
+    try: shm.close()
+    except BufferError:
+        # finalizer 在 root 解構途中執行，buffer 還沒放掉：只關 fd，mapping 由 mmap 物件自己回收時釋放
+        shm._mmap = None; shm.close()
+
+def _shm_release(name):
+    shm = _SHM_OPEN.pop(name, None)
+    if shm is None: return
+    if name in _SHM_OWNED:
+        _SHM_OWNED.discard(name)
+        try: shm.unlink()
+        except FileNotFoundError: pass
+    _shm_close(shm)
+
+def _shm_cleanup_all():
+    for name in list(_SHM_OWNED):
+        _shm_release(name)
+    shm_sweep_stale(own=True)
+
+def shm_sweep_stale(own=False):
+    """移除建立者已不在的 segment（/dev/shm 可列舉時，即 Linux）；own=True 時也移除本程序名下的
+    （worker 建好、主程序還沒接手就中斷的）。回傳移除數。"""
+    from multiprocessing import shared_memory
+    base = Path("/dev/shm")
+    if not base.is_dir(): return 0
+    n = 0
+    for p in base.glob(SHM_PREFIX + "*"):
+        try: pid = int(p.name[len(SHM_PREFIX):].split("_", 1)[0])
+        except ValueError: continue
+        if pid == os.getpid():
+            if not own or p.name in _SHM_OPEN: continue
+        else:
+            try: os.kill(pid, 0); continue  # 還活著
+            except ProcessLookupError: pass
+            except OSError: continue
+        try:
+            s = shared_memory.SharedMemory(name=p.name); s.unlink(); s.close(); n += 1
+        except OSError:
+            pass
+    return n
+
+def shm_prepare_pool():
+    """建立 process pool 之前呼叫：先在主程序啟動 resource tracker，fork 出的 worker 才會共用同一個
+    （worker 建、主程序 unlink 的 segment 登記才對得起來，主程序被 kill -9 時也由它清掉）。"""
+    if os.name == "posix":
+        from multiprocessing import resource_tracker
+        resource_tracker.ensure_running()
+
+def shm_export_curves(curves, owner_pid=None):
+    """把 curves 的 V / I / C 複製進一個新 segment，回傳 metas：去掉陣列的 curve dict，
+    "_shm" = (segment 名稱, {key: (byte offset, n)})，可以便宜地 pickle 給別的程序。
+    owner_pid：名稱上標記的擁有者（worker 替主程序建立時傳主程序 pid；本程序不負責 unlink）。"""
+    import secrets
+    from multiprocessing import shared_memory
+    sizes = [{k: len(c[k]) for k in _CURVE_ARRAYS if c.get(k) is not None} for c in curves]
+    nbytes = max(8, 8 * sum(n for s in sizes for n in s.values()))
+    shm = shared_memory.SharedMemory(name=f"{SHM_PREFIX}{owner_pid or os.getpid()}_{secrets.token_hex(4)}",
+                                     create=True, size=nbytes)
+    root = np.ndarray((nbytes // 8,), np.float64, buffer=shm.buf)
+    metas, off = [], 0
+    for c, s in zip(curves, sizes):
+        m = {k: v for k, v in c.items() if k not in _CURVE_ARRAYS}
+        loc = {}
+        for k, n in s.items():
+            root[off // 8: off // 8 + n] = c[k]; loc[k] = (off, n); off += 8 * n
+        m["_shm"] = (shm.name, loc); metas.append(m)
+    del root
+    if owner_pid in (None, os.getpid()):
+        _shm_install_cleanup(); _SHM_OPEN[shm.name] = shm; _SHM_OWNED.add(shm.name)
+    else:
+        shm.close()
+    return metas
+
+def shm_import_curves(metas, adopt=False):
+    """metas（shm_export_curves 的結果，也可混有一般 curve dict）→ curves，陣列是 segment 上的零複製 view。
+    adopt=True：本程序接手 segment，最後一個 view 被回收時 unlink；否則只在 view 用完時關閉 handle。"""
+    global _SHM_ROOTS
+    import weakref
+    from multiprocessing import shared_memory
+    if _SHM_ROOTS is None: _SHM_ROOTS = weakref.WeakValueDictionary()
+    out = []
+    for m in metas:
+        if "_shm" not in m:
+            out.append(m); continue
+        name, loc = m["_shm"]
+        root = _SHM_ROOTS.get(name)
+        if root is None:
+            # 同一個 segment 在本程序只有一個 root；所有 view 的 base 都是它，它被回收 = 沒人在用
+            shm = _SHM_OPEN.get(name) or shared_memory.SharedMemory(name=name)
+            root = _SHM_ROOTS[name] = np.frombuffer(shm.buf, np.uint8)
+            _SHM_OPEN[name] = shm
+            if adopt:
+                _shm_install_cleanup(); _SHM_OWNED.add(name)
+            weakref.finalize(root, _shm_release, name)
+        c = dict(m)
+        for k, (off, n) in loc.items():
+            c[k] = root[off: off + 8 * n].view(np.float64)
+        out.append(c)
+    return out
+
+def shm_refs(curves):
+    """送往 worker 的形式：已在 segment 上的 curve 只傳 metas，其餘原樣（pickle）。"""
+    return [{k: v for k, v in c.items() if k not in _CURVE_ARRAYS} if "_shm" in c else c for c in curves]
+
+# ---------- 本機分析服務（asyncio + process pool） ----------
+SERVER_MAX_BODY = 8 * 1024 * 1024
+
+def _jsonable(x):
+    if isinstance(x, dict): return {str(k): _jsonable(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)): return [_jsonable(v) for v in x]
+    if isinstance(x, np.ndarray): return _jsonable(x.tolist())
+    if isinstance(x, (np.floating, float)):
+        return float(x) if np.isfinite(x) else None
+    if isinstance(x, np.integer): return int(x)
+    return x
+
+def _file_key(path):
+    st = os.stat(path)
+    return (str(Path(path).resolve()), st.st_mtime_ns, st.st_size)
+
+def _curve_summary(c, arrays=False):
+    ycol = "I" if c.get("I") is not None else "C"
+    d = dict(label=c["label"], type=c["type"], n=int(len(c["V"])),
+             v_range=[np.min(c["V"]), np.max(c["V"])], y_range=[np.min(c[ycol]), np.max(c[ycol])])
+    if arrays:
+        d["V"] = c["V"]; d[ycol] = c[ycol]
+    return d
+
+def _fit_result(m1, m2, ex=None, r2_1=np.nan):
+    """r2_1：Method-1 的擬合度，取 R0 對 spacing 直線的 r²（_line_r2）。"""
+    out = {"method1": None, "method2": None, "exact": None}
+    if m1 is not None:
+        out["method1"] = dict(Rs=m1[0], Lt_um=m1[1], rhoc=m1[2], r2=r2_1)
+    if m2 is not None:
+        Rs, Lt_um, rhoc, (m, c, r2) = m2
+        out["method2"] = dict(Rs=Rs, Lt_um=Lt_um, rhoc=rhoc, m=m, c=c, r2=r2)
+    if ex is not None:
+        out["exact"] = dict(Rs=ex[0], Lt_um=ex[1], rhoc=ex[2], r2=ex[3])
+    return out
+
+# worker 端工作（必須是模組層級函式，才能被 pickle 到 process pool）
+def _parse_many(paths, shm_owner=None):
+    """shm_owner（主程序 pid）有給且量夠大時，整批陣列放進一個 segment，只回傳 metas。"""
+    out = []
+    for p in paths:
+        try:
+            out.append((p, read_curves_from_file(Path(p)), None))
+        except Exception as e:
+            out.append((p, None, f"{type(e).__name__}: {e}"))
+    flat = [c for _p, cs, _e in out if cs for c in cs]
+    if shm_owner and SHM_RESULTS and 16 * sum(c["V"].size for c in flat) >= SHM_MIN_BYTES:
+        metas = iter(shm_export_curves(flat, shm_owner))
+        out = [(p, [next(metas) for _c in cs] if cs else cs, e) for p, cs, e in out]
+    return out
+
+def _adopt_parse_results(results):
+    """_parse_many 的結果在主程序接手：metas → segment 上的 curves（所有 view 都回收時 unlink）。"""
+    curves = iter(shm_import_curves([c for _p, cs, _e in results if cs for c in cs], adopt=True))
+    return [(p, [next(curves) for _c in cs] if cs else cs, e) for p, cs, e in results]
+
+def _r0_job(curves, window):
+    curves = shm_import_curves(curves)
+    return [float(compute_r0_at_zero(c["V"], c["I"], window=window)) for c in curves]
+
+def _fit_job(xs, ys, R2_um):
+    xs = np.asarray(xs, float); ys = np.asarray(ys, float)
+    return _fit_result(rho_method1(xs, ys, R2_um), rho_method2(xs, ys, R2_um), rho_exact(xs, ys, R2_um), _line_r2(xs, ys))
+
+def _render_job(curves, kind, outfile, opts, window, spacings, rules):
+    return render_overlay(shm_import_curves(curves), kind, outfile, opts, window, spacings, rules)
+
+
+class _LRUCache:
+    def __init__(self, maxsize=128):
+        from collections import OrderedDict
+        self.maxsize = maxsize
+        self._d = OrderedDict()
+
+    def get(self, key):
+        v = self._d.get(key)
+        if v is not None: self._d.move_to_end(key)
+        return v
+
+    def put(self, key, value):
+        self._d[key] = value; self._d.move_to_end(key)
+        while len(self._d) > self.maxsize: self._d.popitem(last=False)
+
+    def __len__(self): return len(self._d)
+
+
+class AnalysisServer:
+    """本機 JSON 分析服務。
+
+    HTTP/1.1（localhost 或 Unix socket），POST /<op> 或 POST / 帶 {"op": ...}：
+      parse  {"paths": [...], "arrays": false}
+      r0     {"paths": [...], "window": 0.5}
+      fit    {"items": [{"path": ..., "spacing": 10}, ...] 或 "paths": [...], "R2": 100, "window": 0.5,
+              "rules": {...}}（沒給 spacing 時依分組規則取，取不到或 ≤ 0 回 400）
+      render {"paths": [...], "kind": "iv|rv|cv|rs", "out": "x.png", "opts": {...}, "rules": {...}}
+              （rs 沒給 "spacings" 時 spacing 同 fit 取自分組規則，取不到的曲線不畫）
+      batch  {"requests": [{...}, {...}]}
+      stats  （GET /stats 亦可）
+    解析與擬合丟到 process pool；同時到達的 parse 會合併成一批，
+    重複的檔案（路徑 + mtime + size）直接由 LRU 回傳。
+    等待中的請求超過 max_pending 時回 503，讓呼叫端稍後重試。
+    """
+
+    def __init__(self, *, workers=None, cache_size=128, max_pending=64, batch_window=0.02, batch_max=32):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.cache = _LRUCache(cache_size)
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self.stats = dict(requests=0, rejected=0, cache_hits=0, parsed=0, parse_batches=0)
+        self._pool = None
+        self._slots = None
+        self._pending = 0
+        self._inflight = {}
+        self._batch = []
+        self._batch_handle = None
+
+    # --- process pool ---
+    async def _submit(self, fn, *args):
+        import asyncio
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    # --- parse 批次 + LRU ---
+    async def get_curves(self, paths):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        futs = []
+        for p in paths:
+            key = _file_key(p)
+            hit = self.cache.get(key)
+            if hit is not None:
+                self.stats["cache_hits"] += 1
+                f = loop.create_future(); f.set_result(hit); futs.append(f); continue
+            f = self._inflight.get(key)
+            if f is None:
+                f = loop.create_future(); self._inflight[key] = f
+                self._batch.append((key, str(p)))
+                if len(self._batch) >= self.batch_max:
+                    self._flush_batch()
+                elif self._batch_handle is None:
+                    self._batch_handle = loop.call_later(self.batch_window, self._flush_batch)
+            futs.append(f)
+        return await asyncio.gather(*futs)
+
+    def _flush_batch(self):
+        import asyncio
+        if self._batch_handle is not None:
+            self._batch_handle.cancel(); self._batch_handle = None
+        batch, self._batch = self._batch, []
+        if batch:
+            self.stats["parse_batches"] += 1
+            asyncio.ensure_future(self._run_parse_batch(batch))
+
+    async def _run_parse_batch(self, batch):
+        try:
+            results = _adopt_parse_results(await self._submit(_parse_many, [p for _k, p in batch], os.getpid()))
+        except Exception as e:
+            results = [(p, None, f"{type(e).__name__}: {e}") for _k, p in batch]
+        for (key, _p), (p, curves, err) in zip(batch, results):
+            fut = self._inflight.pop(key, None)
+            if err is None:
+                self.cache.put(key, curves); self.stats["parsed"] += 1
+                if fut is not None and not fut.done(): fut.set_result(curves)
+            elif fut is not None and not fut.done():
+                fut.set_exception(ValueError(f"{p}: {err}"))
+
+    # --- ops ---
+    async def op_parse(self, req):
+        paths = req.get("paths") or []
+        arrays = bool(req.get("arrays", False))
+        per_file = await self.get_curves(paths)
+        return {"files": [dict(path=str(p), curves=[_curve_summary(c, arrays) for c in cs])
+                          for p, cs in zip(paths, per_file)]}
+
+    async def op_r0(self, req):
+        paths = req.get("paths") or []
+        window = float(req.get("window", 0.5))
+        per_file = await self.get_curves(paths)
+        iv = [(str(p), c) for p, cs in zip(paths, per_file) for c in cs if c.get("I") is not None]
+        r0 = await self._submit(_r0_job, shm_refs([c for _p, c in iv]), window) if iv else []
+        return {"r0": [dict(path=p, label=c["label"], R0=v) for (p, c), v in zip(iv, r0)]}
+
+    async def op_fit(self, req):
+        items = req.get("items") or [{"path": p} for p in (req.get("paths") or [])]
+        R2_um = safe_float(req.get("R2"))
+        if R2_um is None: raise ValueError("R2 (μm) is required")
+        window = float(req.get("window", 0.5))
+        compiled = compile_group_rules(dict(DEFAULT_GROUP_RULES, **(req.get("rules") or {})))
+        per_file = await self.get_curves([it["path"] for it in items])
+        pts = []
+        for i, (it, cs) in enumerate(zip(items, per_file)):
+            for c in cs:
+                if c.get("I") is None: continue
+                # 沒給 spacing 時用分組規則（與 CTLM 分組 / --aggregate 相同），不從標籤猜第一個數字
+                sp = safe_float(it["spacing"]) if it.get("spacing") is not None else extract_group_fields(c, compiled)["spacing"]
+                if sp is None or not sp > 0:
+                    raise ValueError(f"items[{i}] ({it['path']}, {c['label']!r}): spacing missing or not > 0")
+                pts.append((str(it["path"]), c, sp))
+        r0 = await self._submit(_r0_job, shm_refs([c for _p, c, _s in pts]), window) if pts else []
+        points = [dict(path=p, label=c["label"], spacing=sp, R0=v)
+                  for (p, c, sp), v in zip(pts, r0) if np.isfinite(v)]
+        xs = [q["spacing"] for q in points]; ys = [q["R0"] for q in points]
+        fit = await self._submit(_fit_job, xs, ys, R2_um)
+        return dict(points=points, **fit)
+
+    async def op_render(self, req):
+        paths = req.get("paths") or []
+        kind = str(req.get("kind", "iv")).lower()
+        if kind not in OVERLAY_KINDS: raise ValueError(f"unknown kind: {kind!r}")
+        out = req.get("out")
+        if not out: raise ValueError("'out' is required")
+        per_file = await self.get_curves(paths)
+        curves = [c for cs in per_file for c in cs]
+        outfile = await self._submit(_render_job, shm_refs(curves), kind, str(out), req.get("opts") or {},
+                                     float(req.get("window", 0.5)), req.get("spacings"), req.get("rules"))
+        return {"out": outfile}
+
+    async def op_stats(self, _req):
+        return dict(self.stats, cache_size=len(self.cache), pending=self._pending, workers=self.workers,
+                    shm_segments=len(_SHM_OWNED))
+
+    async def dispatch(self, req):
+        import asyncio
+        op = str(req.get("op", "")).lower()
+        if op == "batch":
+            return {"results": await asyncio.gather(*(self._dispatch_safe(r) for r in req.get("requests") or []))}
+        handler = {"parse": self.op_parse, "r0": self.op_r0, "fit": self.op_fit,
+                   "render": self.op_render, "stats": self.op_stats}.get(op)
+        if handler is None: raise ValueError(f"unknown op: {op!r}")
+        return await handler(req)
+
+    async def _dispatch_safe(self, req):
+        try:
+            return dict(ok=True, **await self.dispatch(req))
+        except Exception as e:
+            return dict(ok=False, error=f"{type(e).__name__}: {e}")
+
+    # --- HTTP ---
+    async def _handle_http(self, reader, writer):
+        import asyncio, json
+        status, payload = 200, None
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=30)
+            request_line, *hdr_lines = head.decode("latin-1").split("\r\n")
+            method, target, _ver = request_line.split(" ", 2)
+            headers = {k.strip().lower(): v.strip() for k, _, v in (h.partition(":") for h in hdr_lines if h)}
+            n = int(headers.get("content-length") or 0)
+            if n > SERVER_MAX_BODY:
+                status, payload = 413, dict(ok=False, error="request body too large")
+            else:
+                body = await reader.readexactly(n) if n else b""
+                req = json.loads(body.decode("utf-8")) if body.strip() else {}
+                path_op = target.split("?", 1)[0].strip("/")
+                if path_op: req.setdefault("op", path_op)
+                if method not in ("GET", "POST"):
+                    status, payload = 405, dict(ok=False, error="use GET or POST")
+                elif self._pending >= self.max_pending:
+                    self.stats["rejected"] += 1
+                    status, payload = 503, dict(ok=False, error="server busy, retry later")
+                else:
+                    self.stats["requests"] += 1; self._pending += 1
+                    try:
+                        payload = await self._dispatch_safe(req)
+                    finally:
+                        self._pending -= 1
+                    if not payload["ok"]: status = 400
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            writer.close(); return
+        except Exception as e:
+            status, payload = 400, dict(ok=False, error=f"{type(e).__name__}: {e}")
+        data = json.dumps(_jsonable(payload), ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 405: "Method Not Allowed", 413: "Payload Too Large",
+                  503: "Service Unavailable"}[status]
+        hdr = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=utf-8\r\n"
+               f"Content-Length: {len(data)}\r\nConnection: close\r\n")
+        if status == 503: hdr += "Retry-After: 1\r\n"
+        try:
+            writer.write(hdr.encode("latin-1") + b"\r\n" + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_socket=None):
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+        shm_prepare_pool()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = asyncio.Semaphore(self.workers * 2)
+        try:
+            if unix_socket:
+                server = await asyncio.start_unix_server(self._handle_http, path=unix_socket)
+                where = unix_socket
+            else:
+                server = await asyncio.start_server(self._handle_http, host, port)
+                where = f"http://{host}:{port}"
+            print(f"{APP_TITLE} server listening on {where} ({self.workers} workers)", flush=True)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+
+def run_server(host="127.0.0.1", port=8765, unix_socket=None, workers=None):
+    import asyncio
+    n = shm_sweep_stale()
+    if n: print(f"Removed {n} stale shared-memory segment(s) left by a crashed run", flush=True)
+    try:
+        asyncio.run(AnalysisServer(workers=workers).serve(host, port, unix_socket))
+    except KeyboardInterrupt:
+        pass
+
+
+# ---------- 離線批次彙總（out-of-core：parse → R0 → fit 在 worker，主程序只留精簡結果） ----------
+AGG_METRICS = ("rhoc", "Rs", "Lt_um")
+AGG_PERCENTILES = (5, 25, 50, 75, 95)
+
+class LogHistogram:
+    """固定對數分箱的直方圖（每 decade bpd 個 bin）：可合併、記憶體固定，分位數誤差約半個 bin（bpd=50 時 < 2.5%）。
+    ≤0 / 非有限值只計入 n_bad。"""
+    LO, HI = -15, 15  # log10 範圍；超出的值放進頭尾 bin（min / max 另外記錄）
+
+    def __init__(self, bpd=50):
+        self.bpd = bpd
+        self.counts = np.zeros((self.HI - self.LO) * bpd, np.int64)
+        self.n = 0; self.n_bad = 0
+        self.min = np.inf; self.max = -np.inf
+
+    def add(self, values):
+        v = np.asarray(values, float).ravel()
+        ok = np.isfinite(v) & (v > 0)
+        self.n_bad += int(v.size - ok.sum())
+        v = v[ok]
+        if not v.size: return
+        idx = np.clip(((np.log10(v) - self.LO) * self.bpd).astype(np.int64), 0, self.counts.size - 1)
+        self.counts += np.bincount(idx, minlength=self.counts.size)
+        self.n += int(v.size); self.min = min(self.min, float(v.min())); self.max = max(self.max, float(v.max()))
+
+    def merge(self, other):
+        self.counts += other.counts; self.n += other.n; self.n_bad += other.n_bad
+        self.min = min(self.min, other.min); self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """q ∈ [0, 1]；bin 內以對數線性內插，並夾在實際 min / max 之間。"""
+        if not self.n: return np.nan
+        c = np.cumsum(self.counts)
+        t = q * self.n
+        i = int(np.searchsorted(c, t, side="left")); i = min(i, c.size - 1)
+        prev = c[i - 1] if i else 0
+        frac = (t - prev) / self.counts[i] if self.counts[i] else 0.0
+        x = 10 ** (self.LO + (i + frac) / self.bpd)
+        return float(min(max(x, self.min), self.max))
+
+    def to_json(self):
+        nz = np.flatnonzero(self.counts)
+        return dict(bpd=self.bpd, n=self.n, n_bad=self.n_bad, min=self.min if self.n else None,
+                    max=self.max if self.n else None, idx=nz.tolist(), cnt=self.counts[nz].tolist())
+
+    @classmethod
+    def from_json(cls, d):
+        h = cls(d["bpd"])
+        h.counts[d["idx"]] = d["cnt"]; h.n = d["n"]; h.n_bad = d["n_bad"]
+        if h.n: h.min, h.max = d["min"], d["max"]
+        return h
+
+class LotStats:
+    """單一 lot（或全部）的可合併統計：計數 + 每個 (method, metric) 一個 LogHistogram。"""
+    COUNTS = ("files", "errors", "curves", "dies", "valid", "pass")
+
+    def __init__(self):
+        self.c = dict.fromkeys(self.COUNTS, 0)
+        self.h = {(m, k): LogHistogram() for m in WAFER_METHODS for k in AGG_METRICS}
+
+    def merge(self, other):
+        for k in self.COUNTS: self.c[k] += other.c[k]
+        for k, h in self.h.items(): h.merge(other.h[k])
+        return self
+
+    def yield_(self):
+        return self.c["pass"] / self.c["dies"] if self.c["dies"] else np.nan
+
+    def to_json(self):
+        return dict(c=self.c, h={f"{m}|{k}": h.to_json() for (m, k), h in self.h.items()})
+
+    @classmethod
+    def from_json(cls, d):
+        s = cls(); s.c.update(d["c"])
+        for key, hd in d["h"].items():
+            s.h[tuple(key.split("|"))] = LogHistogram.from_json(hd)
+        return s
+
+def _iter_lot_files(root, pattern="*.csv", exclude=None):
+    """依 lot 排序逐一 yield (lot, 相對路徑)；lot = root 底下第一層資料夾（root 本身的檔案歸在 root 的名稱）。
+    每次只列一個 lot 的檔案，不會一次把整棵樹放進記憶體；exclude 資料夾（輸出目錄）整個跳過。"""
+    root = Path(root); exclude = Path(exclude).resolve() if exclude else None
+    top = sorted(p for p in root.glob(pattern) if p.is_file())
+    for p in top:
+        yield root.name, p.relative_to(root).as_posix()
+    for lot in sorted(p for p in root.iterdir() if p.is_dir() and p.resolve() != exclude):
+        for p in sorted(lot.rglob(pattern)):
+            if p.is_file(): yield lot.name, p.relative_to(root).as_posix()
+
+def _aggregate_job(job):
+    """worker：一批檔案 → [(lot, rel, recs, err)]；recs = [[die, structure, spacing, R0, R2], ...]（只有 I–V）。"""
+    root, files, rules, window = job
+    compiled = compile_group_rules(rules)
+    out = []
+    for lot, rel in files:
+        try:
+            recs = []
+            for c in read_curves_from_file(Path(root) / rel):
+                if c.get("I") is None: continue
+                f = extract_group_fields(c, compiled)
+                die = list(f["die"]) if isinstance(f["die"], tuple) else f["die"]
+                recs.append([die, f["structure"], f["spacing"], float(compute_r0_at_zero(c["V"], c["I"], window=window)), f["R2"]])
+            out.append((lot, rel, recs, None))
+        except Exception as e:
+            out.append((lot, rel, None, f"{type(e).__name__}: {e}"))
+    return out
+
+def _reduce_lot(lot, recs, cfg, stats, writer):
+    """一個 lot 的所有 R0 紀錄 → 逐 (die, structure) 擬合 → 寫 die 列、累加進 stats。"""
+    groups = {}
+    for die, st, sp, R0, R2 in recs:
+        g = groups.setdefault((tuple(die) if isinstance(die, list) else die, st), [[], [], R2])
+        if g[2] is None: g[2] = R2
+        if sp is not None and np.isfinite(R0): g[0].append(sp); g[1].append(R0)
+    keys = list(groups)
+    R2s = [g[2] if g[2] is not None else (np.nan if cfg["R2"] is None else cfg["R2"]) for g in groups.values()]
+    fits = fit_ctlm_sets([(g[0], g[1]) for g in groups.values()], R2s, cfg["fit"])
+    lo, hi = cfg["spec_min"], cfg["spec_max"]
+    for key, r in zip(keys, fits):
+        row = [lot, group_name((key[0], None)), key[1] or "", r["n"], r["R2"], r["flagged"]]
+        for meth in WAFER_METHODS:
+            f = r[METHOD_KEYS[meth]]
+            for k in AGG_METRICS:
+                v = f[k] if f else np.nan
+                stats.h[(meth, k)].add([v]); row.append(v)
+        rc = r[METHOD_KEYS[cfg["spec_method"]]]
+        rc = rc["rhoc"] if rc else np.nan
+        ok = np.isfinite(rc)
+        stats.c["dies"] += 1; stats.c["valid"] += int(ok)
+        stats.c["pass"] += int(ok and (lo is None or rc >= lo) and (hi is None or rc <= hi))
+        writer.writerow(["" if v is None else (f"{v:.6g}" if isinstance(v, float) else v) for v in row])
+
+def _write_json_atomic(path, obj):
+    import json
+    tmp = Path(str(path) + ".tmp")
+    tmp.write_text(json.dumps(obj), encoding="utf-8")
+    os.replace(tmp, path)
+
+def aggregate_lots(root, outdir=None, pattern="*.csv", rules=None, window=0.5, R2_um=None, fit="OLS",
+                   spec_method="Exact", spec_min=None, spec_max=None, percentiles=AGG_PERCENTILES,
+                   workers=None, chunk=32, restart=False, log=print):
+    """串流整個資料樹：worker process 做 parse → R0，主程序每完成一個 lot 就擬合並只保留
+    die 列（dies.csv）與可合併的直方圖；記憶體上限約為一個 lot 的 R0 紀錄。
+
+    可續跑：開始前先寫 state.json（設定 + dies.csv 標頭位置），每個處理完的檔案把精簡 R0 紀錄附加到
+    files.jsonl，每個完成的 lot 把統計寫進 state.json（原子性取代）；中斷後用相同參數重跑會跳過
+    已完成的 lot 與檔案（包括第一個 lot 中途中斷的情況）。
+    回傳 {lot: LotStats}，另有 "ALL"。"""
+    import csv, json
+    from concurrent.futures import ProcessPoolExecutor
+    root = Path(root)
+    outdir = Path(outdir) if outdir else root / "trinity_aggregate"
+    outdir.mkdir(parents=True, exist_ok=True)
+    rules = dict(DEFAULT_GROUP_RULES, **(rules or {}))
+    compile_group_rules(rules)  # regex 錯誤在開始前就丟出
+    cfg = dict(root=str(root.resolve()), pattern=pattern, rules=rules, window=window, R2=R2_um, fit=fit,
+               spec_method=spec_method, spec_min=spec_min, spec_max=spec_max)
+    state_p, files_p, dies_p = outdir / "state.json", outdir / "files.jsonl", outdir / "dies.csv"
+
+    # 設定不同時要求 restart 才清掉舊紀錄；沒有 state.json 時保留 files.jsonl 續用，dies.csv 從頭重寫
+    state = json.loads(state_p.read_text(encoding="utf-8")) if state_p.exists() else None
+    if state is not None and state["cfg"] != cfg and not restart:
+        raise ValueError(f"{state_p} was written with different settings; use restart=True (--restart) to start over")
+    if restart:
+        for p in (files_p, dies_p): p.unlink(missing_ok=True)
+        state = None
+    if state is None:
+        state = dict(cfg=cfg, lots_done={}, dies_bytes=0)
+    lots = {lot: LotStats.from_json(d) for lot, d in state["lots_done"].items()}
+
+    # 已完成 lot 之後 dies.csv 多寫的列（上次中斷在寫入途中）截掉；未完成 lot 的檔案紀錄重新載入
+    header = ["lot", "die", "structure", "n", "R2_um", "flagged"] + [f"{m}_{k}" for m in WAFER_METHODS for k in AGG_METRICS]
+    if dies_p.exists():
+        with open(dies_p, "r+b") as f: f.truncate(state["dies_bytes"])
+    pending, done_files = {}, set()
+    if files_p.exists():
+        keep = []
+        for line in files_p.read_text(encoding="utf-8").splitlines():
+            try: r = json.loads(line)
+            except ValueError: continue  # 中斷時寫了一半的那行
+            if r["lot"] in lots: continue
+            keep.append(line); done_files.add(r["file"])
+            pending.setdefault(r["lot"], []).append(r)
+        files_p.write_text("".join(l + "\n" for l in keep), encoding="utf-8")
+    if lots or done_files:
+        log(f"Resuming: {len(lots)} lots done, {len(done_files)} files of unfinished lots already parsed")
+
+    def todo():
+        for lot, rel in _iter_lot_files(root, pattern, outdir):
+            if lot not in lots and rel not in done_files: yield lot, rel
+
+    def jobs():
+        batch = []
+        for item in todo():
+            batch.append(item)
+            if len(batch) >= chunk:
+                yield (str(root), batch, rules, window); batch = []
+        if batch: yield (str(root), batch, rules, window)
+
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    ex = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    t0 = time.perf_counter(); nfiles = 0; cur = None
+    fjs = open(files_p, "a", encoding="utf-8")
+    fcsv = open(dies_p, "a", newline="", encoding="utf-8")
+    writer = csv.writer(fcsv)
+    if state["dies_bytes"] == 0:
+        writer.writerow(header); fcsv.flush()
+        state["dies_bytes"] = dies_p.stat().st_size
+    _write_json_atomic(state_p, state)  # 開始處理前就寫：第一個 lot 中途中斷也能續跑
+
+    def finish(lot):
+        st = LotStats()
+        recs = []
+        for r in pending.pop(lot, []):
+            st.c["files"] += 1
+            if r["err"]: st.c["errors"] += 1; continue
+            st.c["curves"] += len(r["recs"]); recs += r["recs"]
+        _reduce_lot(lot, recs, cfg, st, writer)
+        fcsv.flush(); fjs.flush()
+        lots[lot] = st
+        state["lots_done"][lot] = st.to_json(); state["dies_bytes"] = dies_p.stat().st_size
+        _write_json_atomic(state_p, state)
+        log(f"  lot {lot}: {st.c['files']} files, {st.c['dies']} dies, yield {st.yield_():.1%}")
+
+    try:
+        for results in bounded_map(_aggregate_job, jobs(), ex, lookahead=2*workers):
+            for lot, rel, recs, err in results:
+                if cur is not None and lot != cur and cur in pending: finish(cur)
+                cur = lot
+                r = dict(lot=lot, file=rel, recs=recs or [], err=err)
+                fjs.write(json.dumps(r) + "\n")
+                pending.setdefault(lot, []).append(r)
+                nfiles += 1
+                if nfiles % 1000 == 0:
+                    log(f"  {nfiles} files, {nfiles / (time.perf_counter() - t0):.0f} files/s")
+        for lot in list(pending): finish(lot)  # 續跑時載入、但這次沒有新檔案的 lot
+    finally:
+        if ex is not None: ex.shutdown(cancel_futures=True)
+        fjs.close(); fcsv.close()
+
+    lots["ALL"] = LotStats()
+    for lot, st in lots.items():
+        if lot != "ALL": lots["ALL"].merge(st)
+    _write_aggregate_summary(outdir, lots, percentiles)
+    log(f"Aggregated {lots['ALL'].c['files']} files ({nfiles} this run) in {time.perf_counter() - t0:.1f} s → {outdir}")
+    return lots
+
+def _write_aggregate_summary(outdir, lots, percentiles=AGG_PERCENTILES):
+    """summary.csv：每個 (lot, method, metric) 的分位數；lots.csv：每個 lot 的計數與良率。"""
+    import csv
+    with open(Path(outdir) / "summary.csv", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["lot", "method", "metric", "n", "min"] + [f"p{q:g}" for q in percentiles] + ["max"])
+        for lot, st in lots.items():
+            for (m, k), h in st.h.items():
+                w.writerow([lot, m, k, h.n] + [f"{v:.6g}" for v in
+                           (h.min if h.n else np.nan, *(h.quantile(q / 100) for q in percentiles), h.max if h.n else np.nan)])
+    with open(Path(outdir) / "lots.csv", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["lot", *LotStats.COUNTS, "yield"])
+        for lot, st in lots.items():
+            w.writerow([lot] + [st.c[k] for k in LotStats.COUNTS] + [f"{st.yield_():.6g}"])
+
+# ---------- 欄式匯出（Parquet / npz；逐塊寫出，不會組成一張大表） ----------
+EXPORT_FORMATS = ("auto", "parquet", "npz")
+EXPORT_CHUNK_ROWS = 1 << 20
+# 點表是完整的長表：曲線層級的 freq_hz / locus 逐點重複（locus 存成 8-byte ASCII，和 f8 一樣大，npz 也能逐塊寫出）
+POINT_COLUMNS = (("curve_id", "i8"), ("point", "i4"), ("V", "f8"), ("Y", "f8"), ("freq_hz", "f8"), ("locus", "S8"))
+CURVE_COLUMNS = (("curve_id", "i8"), ("lot", "str"), ("src", "str"), ("label", "str"), ("type", "str"),
+                 ("freq_hz", "f8"), ("locus", "str"), ("n_points", "i8"), ("die", "str"), ("die_x", "f8"),
+                 ("die_y", "f8"), ("structure", "str"), ("spacing_um", "f8"), ("R2_um", "f8"), ("R0_ohm", "f8"))
+DIE_COLUMNS = (("lot", "str"), ("die", "str"), ("die_x", "f8"), ("die_y", "f8"), ("structure", "str"), ("n", "i8"),
+               ("R2_um", "f8"), ("flagged", "i8")) + tuple((f"{m}_{k}", "f8") for m in WAFER_METHODS
+                                                             for k in AGG_METRICS + ("r2",))
+
+def _pyarrow_parquet():
+    """pyarrow.parquet（選用相依）；沒裝時回傳 None。"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    return pq
+
+def _table_chunk(cols, columns):
+    """{欄: list / 陣列} → 依 columns 轉好型別（數值欄的 None → NaN）。"""
+    return {n: [("" if v is None else str(v)) for v in cols[n]] if k == "str" else np.asarray(cols[n], "<" + k)
+            for n, k in columns}
+
+class _ParquetTable:
+    """每次 write 一個 row group。"""
+    def __init__(self, path, columns):
+        import pyarrow as pa
+        types = {"i8": pa.int64(), "i4": pa.int32(), "f8": pa.float64(), "str": pa.string(), "S8": pa.string()}
+        self.pa, self.path = pa, Path(path)
+        self.bytes_cols = [n for n, k in columns if k == "S8"]
+        self.schema = pa.schema([(n, types[k]) for n, k in columns])
+        self.w = _pyarrow_parquet().ParquetWriter(str(self.path), self.schema, compression="zstd")
+
+    def write(self, cols):
+        cols = dict(cols, **{n: self.pa.array(cols[n], self.pa.binary()).cast(self.pa.string()) for n in self.bytes_cols})
+        self.w.write_table(self.pa.table(cols, schema=self.schema))
+
+    def close(self, ok=True):
+        self.w.close()
+        if not ok: self.path.unlink(missing_ok=True)
+
+class _NpzTable:
+    """數值欄逐塊附加到各自的暫存檔，close 時補上 .npy 表頭串進 zip（不壓縮，np.load 直接讀）；
+    字串欄（每條曲線 / 每個 die 一列，量小）留在記憶體。"""
+    def __init__(self, path, columns):
+        self.path, self.columns, self.n = Path(path), columns, 0
+        self.tmp = {n: open(self.path.with_name(f".{self.path.name}.{n}.tmp"), "w+b") for n, k in columns if k != "str"}
+        self.strs = {n: [] for n, k in columns if k == "str"}
+
+    def write(self, cols):
+        for n, k in self.columns:
+            if k == "str": self.strs[n] += cols[n]
+            else: self.tmp[n].write(cols[n].tobytes())
+        self.n += len(cols[self.columns[0][0]])
+
+    def close(self, ok=True):
+        import shutil, zipfile
+        try:
+            if ok:
+                with zipfile.ZipFile(self.path, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+                    for n, k in self.columns:
+                        with zf.open(n + ".npy", "w", force_zip64=True) as f:
+                            if k == "str":
+                                np.lib.format.write_array(f, np.array(self.strs[n], dtype=str))
+                                continue
+                            np.lib.format.write_array_header_1_0(f, {"descr": np.dtype("<" + k).str,
+                                                                     "fortran_order": False, "shape": (self.n,)})
+                            self.tmp[n].seek(0); shutil.copyfileobj(self.tmp[n], f, 1 << 22)
+        finally:
+            for t in self.tmp.values():
+                t.close(); Path(t.name).unlink(missing_ok=True)
+
+def export_columnar(curves, outdir, fmt="auto", rules=None, window=0.5, R2_um=None, method="OLS",
+                    chunk_rows=EXPORT_CHUNK_ROWS, log=None):
+    """curves（可以是 generator，逐條處理）→ outdir 下三張表：
+    points：curve_id, point, V, Y（I–V 的 I [A] 或 C–V 的 C [F]，看 curves.type）, freq_hz, locus；
+    curves：每條曲線一列（lot、來源檔、label、type、頻率、locus、分組欄位、R0）；
+    dies：每個 (lot, die, structure) 一列，三種方法的 ρc / Rs / Lt / R²（與 Wafer map、--aggregate 相同的擬合）。
+    fmt：'parquet'（需要 pyarrow）、'npz' 或 'auto'（有 pyarrow 就用 Parquet）。點每累積 chunk_rows 筆
+    寫出一塊（Parquet 的一個 row group），記憶體用量與總點數無關。回傳 {表名: (路徑, 列數)}。"""
+    if fmt == "auto": fmt = "parquet" if _pyarrow_parquet() else "npz"
+    if fmt not in ("parquet", "npz"): raise ValueError(f"unknown export format {fmt!r}; expected one of {EXPORT_FORMATS}")
+    if fmt == "parquet" and _pyarrow_parquet() is None:
+        raise ValueError("Parquet export needs pyarrow (pip install pyarrow); use the npz format instead")
+    compiled = compile_group_rules(dict(DEFAULT_GROUP_RULES, **(rules or {})))
+    outdir = Path(outdir); outdir.mkdir(parents=True, exist_ok=True)
+    Table = _ParquetTable if fmt == "parquet" else _NpzTable
+    specs = {"points": POINT_COLUMNS, "curves": CURVE_COLUMNS, "dies": DIE_COLUMNS}
+    tabs, counts, ok = {}, dict.fromkeys(specs, 0), False
+    pts, rows, groups = [], {n: [] for n, _ in CURVE_COLUMNS}, {}
+
+    def flush_points():
+        tabs["points"].write(_table_chunk({
+            "curve_id": np.concatenate([np.full(len(V), i, np.int64) for i, V, *_ in pts]),
+            "point": np.concatenate([np.arange(len(V), dtype=np.int32) for _, V, *_ in pts]),
+            "V": np.concatenate([p[1] for p in pts]), "Y": np.concatenate([p[2] for p in pts]),
+            "freq_hz": np.concatenate([np.full(len(V), fq, float) for _, V, _, fq, _ in pts]),
+            "locus": np.concatenate([np.full(len(V), lc, "S8") for _, V, _, _, lc in pts])}, POINT_COLUMNS))
+        counts["points"] += sum(len(p[1]) for p in pts); pts.clear()
+        if log: log(f"Columnar export: {counts['points']:,} points")
+
+    def flush_curves():
+        tabs["curves"].write(_table_chunk(rows, CURVE_COLUMNS))
+        counts["curves"] += len(rows["curve_id"])
+        for v in rows.values(): v.clear()
+
+    try:
+        for n, cols in specs.items(): tabs[n] = Table(outdir / f"{n}.{fmt}", cols)
+        buffered = 0
+        for cid, c in enumerate(curves):
+            iv = c.get("I") is not None
+            V = np.asarray(c["V"], float); Y = np.asarray(c["I"] if iv else c["C"], float)
+            fq = safe_float(c.get("freq"), np.nan); lc = str(c.get("locus") or "")[:8].encode("ascii", "replace")
+            pts.append((cid, V, Y, fq, lc)); buffered += len(V)
+            if buffered >= chunk_rows: flush_points(); buffered = 0
+            f = extract_group_fields(c, compiled)
+            die, lot = f["die"], c.get("lot")
+            R0 = compute_r0_at_zero(V, Y, window=window) if iv else np.nan
+            for k, v in zip(rows, (cid, lot, c.get("src"), c["label"], c.get("type"), c.get("freq"), c.get("locus"),
+                                   len(V), None if die is None else group_name((die, None)),
+                                   *(die if isinstance(die, tuple) else (None, None)),
+                                   f["structure"], f["spacing"], f["R2"], R0)):
+                rows[k].append(v)
+            if len(rows["curve_id"]) >= chunk_rows: flush_curves()
+            if iv:
+                g = groups.setdefault((lot, die, f["structure"]), [[], [], f["R2"]])
+                if g[2] is None: g[2] = f["R2"]
+                if f["spacing"] is not None and np.isfinite(R0): g[0].append(f["spacing"]); g[1].append(float(R0))
+        if pts: flush_points()
+        if rows["curve_id"]: flush_curves()
+
+        R2s = [g[2] if g[2] is not None else (np.nan if R2_um is None else R2_um) for g in groups.values()]
+        fits = fit_ctlm_sets([(g[0], g[1]) for g in groups.values()], R2s, method)
+        dies = {n: [] for n, _ in DIE_COLUMNS}
+        for (lot, die, st), r in zip(groups, fits):
+            vals = [lot, None if die is None else group_name((die, None)), *(die if isinstance(die, tuple) else (None, None)),
+                    st, r["n"], r["R2"], r["flagged"]]
+            for m in WAFER_METHODS:
+                f = r[METHOD_KEYS[m]] or {}
+                vals += [f.get(k) for k in AGG_METRICS + ("r2",)]
+            for k, v in zip(dies, vals): dies[k].append(v)
+        tabs["dies"].write(_table_chunk(dies, DIE_COLUMNS)); counts["dies"] = len(fits)
+        ok = True
+    finally:
+        for t in tabs.values(): t.close(ok)
+    return {n: (outdir / f"{n}.{fmt}", counts[n]) for n in specs}
+
+def read_columnar(path):
+    """export_columnar 寫出的一張表 → {欄: ndarray}（.parquet 需要 pyarrow）。"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        t = _pyarrow_parquet().read_table(str(path))
+        return {n: t.column(n).to_numpy() for n in t.column_names}
+    out = {}
+    with np.load(path) as z:
+        for n in z.files:
+            a = z[n]; out[n] = np.char.decode(a, "ascii") if a.dtype.kind == "S" else a
+    return out
+
+
+# ---------- Stage 計時（UI 勾選或 TRINITY_PROFILE=1 開啟） ----------
+class _Stage:
+    __slots__ = ("prof", "name", "args", "t0")
+
+    def __init__(self, prof, name, args):
+        self.prof, self.name, self.args = prof, name, args
+
+    def __enter__(self):
+        self.prof.depth += 1
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter()
+        p = self.prof; p.depth -= 1
+        if len(p.events) < p.MAX_EVENTS:
+            p.events.append((self.name, self.t0 - p.t0, t1 - self.t0, p.depth, self.args))
+        return False
+
+class StageProfiler:
+    """with prof.stage("name"): ... 記錄巢狀 stage 的起點與耗時；關閉時 stage() 幾乎沒有成本。
+    summary() 給 status log 用，chrome_trace() 可用 chrome://tracing 或 Perfetto 開啟。"""
+    MAX_EVENTS = 200_000
+
+    def __init__(self, enabled=False):
+        from contextlib import nullcontext
+        self.enabled = enabled
+        self.events = []   # (name, start_s, dur_s, depth, args)
+        self.depth = 0
+        self.t0 = time.perf_counter()
+        self._mark = 0
+        self._null = nullcontext()
+
+    def stage(self, name, **args):
+        return _Stage(self, name, args) if self.enabled else self._null
+
+    def wrap(self, name, fn):
+        """包一個 callable（例如 canvas.draw），開啟時才計時。"""
+        def wrapper(*a, **kw):
+            with self.stage(name):
+                return fn(*a, **kw)
+        return wrapper
+
+    def summary(self):
+        """自上次 summary() 以來各 stage 的總耗時（依第一次出現的順序），沒有新事件回傳 None。"""
+        new = self.events[self._mark:]; self._mark = len(self.events)
+        if not new: return None
+        agg = {}
+        for name, _t, dur, _d, _a in sorted(new, key=lambda e: e[1]):
+            tot, n = agg.get(name, (0.0, 0))
+            agg[name] = (tot + dur, n + 1)
+        return " · ".join(f"{name} {tot * 1000:.1f} ms" + (f" ×{n}" if n > 1 else "")
+                          for name, (tot, n) in agg.items())
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        ev = [dict(name=name, ph="X", ts=round(t * 1e6, 1), dur=round(dur * 1e6, 1), pid=pid, tid=1,
+                   args=args or {}) for name, t, dur, _d, args in self.events]
+        return dict(traceEvents=ev, displayTimeUnit="ms")
+
+    def write_trace(self, path):
+        import json
+        path = Path(path); path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.chrome_trace()), encoding="utf-8")
+        return path
+
+def profiled(name=None):
+    """App 方法用的 decorator：self.prof 開啟時把整個呼叫記成一個 stage；最外層結束後排程輸出 summary。"""
+    def deco(fn):
+        label = name or fn.__name__
+        def wrapper(self, *a, **kw):
+            prof = self.prof
+            if not prof.enabled:
+                return fn(self, *a, **kw)
+            with prof.stage(label):
+                out = fn(self, *a, **kw)
+            if prof.depth == 0:
+                self._profile_flush_soon()
+            return out
+        wrapper.__name__ = fn.__name__; wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return deco
 
 
 def make_scrollable(parent):
@@ -299,6 +2250,19 @@ def make_scrollable(parent):
     return canvas, inner
 
 
+# 預覽 resize：拖曳期間沿用上一張點陣圖，停下 RESIZE_SETTLE_MS 後才照新尺寸重畫一次；
+# 尺寸變化超過 RELAYOUT_FRAC 才重跑 tight_layout
+RESIZE_SETTLE_MS = 120
+RELAYOUT_FRAC = 0.08
+
+def fit_keep_ratio(W, H, aspect):
+    """在 W×H 的區域內置中放入寬高比 aspect 的最大矩形，回傳 (x, y, w, h)。"""
+    tw = W; th = int(tw / aspect)
+    if th > H:
+        th = H; tw = int(th * aspect)
+    return (W - tw) // 2, (H - th) // 2, tw, th
+
+
 # --------------- Main App ---------------
 class App(tk.Tk):
     def __init__(self, base_font=None):
@@ -348,18 +2312,34 @@ class App(tk.Tk):
         self.title(APP_TITLE)
 
         self.curves: List[Dict] = []
-        self.rows = []
+        self.rows = []; self._picked_row = None
+        self.spark = SparklineRenderer(); self._spark_lbls = []; self._spark_imgs = {}
+        self._spark_pending, self._spark_failed = set(), set()
+        self._spark_after = self._spark_poll_id = None
         self.csv_path: Optional[Path] = None
         self.file_list: List[Path] = []
         self.outdir: Optional[Path] = None
         self.data_mode: Optional[str] = None
+        self._wafer = None
+        self._gindex = None
+        self._cond = None; self._cond_cache = _LRUCache(256)   # 每個條件的擬合結果，鍵含該條件的曲線與設定
+        self.prof = StageProfiler(enabled=bool(os.environ.get("TRINITY_PROFILE")))
+        self._prof_pending = False
 
-        Splash(self)
-        self.after(1200, self._post_splash)
+        self._splash = Splash(self)
+        self._splash.update()  # 先把 splash 畫出來，再做真正的初始化
+        self.after_idle(self._post_splash)
 
     def _post_splash(self):
-        self.deiconify()
         self._build_ui()
+        self._splash.close()
+        self.deiconify()
+        self.update_idletasks()
+        startup_ms = (time.perf_counter() - _STARTUP_T0) * 1000
+        self.log(f"Startup: {startup_ms:.0f} ms")
+        if os.environ.get("TRINITY_STARTUP_EXIT"):  # benchmarks/bench_startup.py
+            print(f"startup_ms={startup_ms:.1f}", flush=True)
+            self.after(1, self.destroy); return
         self.after(120, self.startup_wizard)
 
     # ----- 開場精靈 -----
@@ -407,15 +2387,22 @@ class App(tk.Tk):
         ttk.Button(fr, text="多選檔案", command=pick_files).pack(fill="x", pady=4)
         ttk.Button(fr, text="選擇資料夾", command=pick_folder).pack(fill="x", pady=4)
 
+    @profiled()
     def load_curves_from_selection(self):
         try:
-            if self.data_mode == 'single_csv_multi':
-                curves = read_curves_single_csv(self.csv_path)
-            else:
-                curves = read_curves_multi_files(self.file_list)
+            with self.prof.stage("parse", files=len(self.file_list)):
+                if self.data_mode == 'single_csv_multi':
+                    curves = read_curves_single_csv(self.csv_path)
+                else:
+                    curves = read_curves_multi_files(self.file_list)
         except Exception as e:
             messagebox.showerror("讀取失敗", str(e)); return
         self.curves = curves
+        self._wafer = None; self._gindex = None; self._cond = None
+        if self.preview_wafer.get('frame') is not None:
+            self._set_blank(self.preview_wafer['frame'], "Press “Build map”")
+        if self.preview_cond.get('frame') is not None:  # 上一批資料的條件結果不能沿用到新資料
+            self._set_blank(self.preview_cond['frame'], "Press “Analyze”"); self.cond_text.delete("1.0", "end")
         self._populate_rows()
         self.update_all_previews()
         self.log(f"Mode: {self.data_mode}, loaded {len(self.curves)} curves")
@@ -446,20 +2433,35 @@ class App(tk.Tk):
             ttk.Entry(row, textvariable=self.global_vars[i], width=10).grid(row=0, column=2*i+1, padx=(2,8))
         ttk.Button(gb, text="Apply to table", command=self.update_all_previews).pack(anchor="e", pady=(6,0))
 
+        # CTLM 分組規則：regex 比對檔名；'label:regex' 比對 label；'header:Key[:regex]' 比對表頭
+        grp = ttk.LabelFrame(left, text="CTLM grouping rules (file-name regex · label:… · header:Key[:regex])", padding=6)
+        grp.pack(fill="x", pady=(0,6))
+        self.group_rules = {f: tk.StringVar(value=DEFAULT_GROUP_RULES[f]) for f in GROUP_FIELDS}
+        for k, f in enumerate(GROUP_FIELDS):
+            ttk.Label(grp, text=f.capitalize() if f != "R2" else "R2 (μm)").grid(row=k//2, column=(k%2)*2, sticky="e")
+            ttk.Entry(grp, textvariable=self.group_rules[f], width=30).grid(row=k//2, column=(k%2)*2+1, sticky="w", padx=(4,12), pady=1)
+        self.use_group_rules = tk.BooleanVar(value=False)
+        bar = ttk.Frame(grp); bar.grid(row=2, column=0, columnspan=4, sticky="ew", pady=(4,0))
+        ttk.Checkbutton(bar, text="Spacing / R2 from rules (instead of Global#)", variable=self.use_group_rules,
+                        command=self.update_all_previews).pack(side="left")
+        ttk.Button(bar, text="Index groups", command=self.index_groups).pack(side="right")
+
         tbl_frame = ttk.LabelFrame(left, text="Sweeps", padding=6)
         tbl_frame.pack(fill="both", expand=True)
         canvas = tk.Canvas(tbl_frame, highlightthickness=0)
         self.tbl = ttk.Frame(canvas)
         scroll = ttk.Scrollbar(tbl_frame, orient="vertical", command=canvas.yview)
-        canvas.configure(yscrollcommand=scroll.set)
+        # 捲動 / 改變大小都會呼叫 yscrollcommand：順便排程看得到的列的縮圖
+        canvas.configure(yscrollcommand=lambda *a: (scroll.set(*a), self._spark_refresh_soon()))
         scroll.pack(side="right", fill="y"); canvas.pack(side="left", fill="both", expand=True)
-        self.tbl_id = canvas.create_window((0,0), window=self.tbl, anchor="nw")
+        self.tbl_id = canvas.create_window((0,0), window=self.tbl, anchor="nw"); self.tbl_canvas = canvas
         self.tbl.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
         canvas.bind("<Configure>", lambda e: canvas.itemconfig(self.tbl_id, width=e.width))
 
-        self.col_widths = [6, 4, 7, 18, 22, 12, 8, 8, 18, 18]
+        self.col_widths = [6, 4, 7, 18, 22, 12, 8, 8, 18, 18, 13]
         hdr = ttk.Frame(self.tbl); hdr.grid(row=0, column=0, sticky="ew")
-        heads = ["Use","#","Follow","Global#","Label","Color","Line","Marker","V Range","Y Range"]
+        heads = ["Use","#","Follow","Global#","Label","Color","Line","Marker","V Range","Y Range","Preview"]
+        self._spark_blank = tk.PhotoImage(width=SPARK_W, height=SPARK_H)
         for j, w in enumerate(self.col_widths):
             ttk.Label(hdr, text=heads[j], width=w, anchor="w").grid(row=0, column=j, sticky="w")
 
@@ -467,29 +2469,99 @@ class App(tk.Tk):
         for c, w in enumerate(self.col_widths):
             self.rows_container.grid_columnconfigure(c, minsize=int(w*8))
 
-        # right notebook
+        # right notebook（分頁內容在第一次被選到時才建立）
         right_outer = ttk.Frame(main); main.add(right_outer, weight=1)
         _, right = make_scrollable(right_outer)  # right 變成可捲動的內層框
-        nb = ttk.Notebook(right); nb.pack(fill="both", expand=True)
+        self.nb = nb = ttk.Notebook(right); nb.pack(fill="both", expand=True)
+        self._tabs = {}
+
+        # 各分頁的設定變數先建好（計算/匯出會用到），widget 延後
+        self.preview_iv = self._make_panel("I–V Curves", "Voltage (V)", "Current (A)")
+        self.preview_rv = self._make_panel("Differential Resistance R(V)", "Voltage (V)", "Resistance (Ω)")
+        self.preview_rs = self._make_panel("R0 vs Spacing", "Spacing d (μm)", "Resistance R0 (Ω)")
+        self.preview_corr = self._make_panel("Original vs Corrected Rt(d)", "Spacing d (μm)", "Resistance (Ω)")
+        self.preview_cv = self._make_panel("C–V (per frequency)", "Voltage (V)", "Capacitance (F)")
+        self.preview_wafer = self._make_panel("Wafer map", "Die X", "Die Y")
+        self.preview_wdie = self._make_panel("Die R0 vs Spacing", "Spacing d (μm)", "Resistance R0 (Ω)")
+        self.r0_window = tk.StringVar(value="0.5")
+        self.fit_method = tk.StringVar(value="OLS")
+        self.corr_text = tk.StringVar(value="")
+        self.wafer_structure = tk.StringVar(value="(all)"); self._wstruct_cb = None
+        self.wafer_metric = tk.StringVar(value=WAFER_METRICS[0][0]); self.wafer_method = tk.StringVar(value="Method-1")
+        self.wafer_info = tk.StringVar(value="")
+        self.preview_cond = self._make_panel("Arrhenius", "1000 / T (1/K)", "ρc (Ω·cm²)")
+        self.preview_cond["yscale"].set("log")
+        self.cond_rule = tk.StringVar(value=CONDITION_RULE); self.cond_unit = tk.StringVar(value="°C")
+        self.cond_method = tk.StringVar(value="Exact")
+
+        self.tab_iv = self._add_tab("I–V", self._build_tab_iv, lambda: self._draw_preview(self.preview_iv, self._draw_iv))
+        self.tab_rv = self._add_tab("R–V", self._build_tab_rv, lambda: self._draw_preview(self.preview_rv, self._draw_rv))
+        self.tab_rs = self._add_tab("R–Spacing", self._build_tab_rs, lambda: self._draw_preview(self.preview_rs, self._draw_rs))
+        self.tab_corr = self._add_tab("R–Spacing Correlation", self._build_tab_corr,
+                                      lambda: self._draw_preview(self.preview_corr, self._draw_corr))
+        self.tab_cv = self._add_tab("C–V", self._build_tab_cv, lambda: self._draw_preview(self.preview_cv, self._draw_cv))
+        self.tab_wafer = self._add_tab("Wafer Map", self._build_tab_wafer)
+        self.tab_cond = self._add_tab("Conditions", self._build_tab_cond)
+        nb.bind("<<NotebookTabChanged>>", lambda _e: self._refresh_current_tab())
 
+        # bottom
+        btns = ttk.Frame(self, padding=8); btns.pack(fill="x")
+        ttk.Button(btns, text="Select all", command=self.select_all).pack(side="left")
+        ttk.Button(btns, text="Clear", command=self.clear_all).pack(side="left", padx=(6,0))
+        ttk.Button(btns, text="Refresh previews", command=self.update_all_previews).pack(side="left", padx=(6,0))
+        self.fast_overlay = tk.BooleanVar(value=True)
+        ttk.Checkbutton(btns, text=f"Fast overlay (≥{FAST_OVERLAY_MIN} curves)", variable=self.fast_overlay,
+                        command=self.update_all_previews).pack(side="left", padx=(12,0))
+        self.profile_var = tk.BooleanVar(value=self.prof.enabled)
+        ttk.Checkbutton(btns, text="Profile", variable=self.profile_var,
+                        command=self._toggle_profile).pack(side="left", padx=(12,0))
+        ttk.Button(btns, text="cProfile refresh", command=self.profile_refresh).pack(side="left", padx=(6,0))
+        ttk.Button(btns, text="Export", command=self.export_all).pack(side="right")
+        ttk.Button(btns, text="Export PDF report", command=self.export_pdf_report).pack(side="right", padx=(0,6))
+        ttk.Button(btns, text="Export data", command=self.export_columnar).pack(side="right", padx=(0,6))
+        self.status = tk.Text(self, height=5); self.status.pack(fill="both", padx=8, pady=(0,8))
+        self._refresh_current_tab()
+
+    # ----- 分頁（延遲建立 + 只重畫看得到的分頁） -----
+    def _add_tab(self, text, build, draw=None):
+        frame = ttk.Frame(self.nb); self.nb.add(frame, text=text)
+        self._tabs[str(frame)] = dict(build=build, draw=draw, built=False, dirty=True)
+        return frame
+
+    @profiled("refresh")
+    def _refresh_current_tab(self):
+        t = self._tabs.get(self.nb.select())
+        if t is None: return
+        if not t["built"]:
+            t["build"](); t["built"] = True
+        if t["dirty"] and t["draw"] is not None:
+            t["dirty"] = False
+            t["draw"]()
+
+    def _draw_preview(self, panel, draw):
+        if not self.curves:
+            self._set_blank(panel['frame'], "請載入資料"); return
+        _, display = self.current_selection()
+        draw(panel, display)
 
-        # I–V
-        self.tab_iv = ttk.Frame(nb); nb.add(self.tab_iv, text="I–V")
-        self.preview_iv = self._build_preview_panel(self.tab_iv, "I–V Curves", "Voltage (V)", "Current (A)")
+    def _build_tab_iv(self):
+        self._build_preview_panel(self.tab_iv, self.preview_iv)
 
-        # R–V
-        self.tab_rv = ttk.Frame(nb); nb.add(self.tab_rv, text="R–V")
-        self.preview_rv = self._build_preview_panel(self.tab_rv, "Differential Resistance R(V)", "Voltage (V)", "Resistance (Ω)")
+    def _build_tab_rv(self):
+        self._build_preview_panel(self.tab_rv, self.preview_rv)
         rv_cfg = ttk.LabelFrame(self.tab_rv, text="R0 fit window (|V| ≤ window)", padding=6)
         rv_cfg.pack(fill="x", padx=8, pady=(0,8))
-        self.r0_window = tk.StringVar(value="0.5")
         ttk.Label(rv_cfg, text="window (V)").pack(side="left")
         ttk.Entry(rv_cfg, textvariable=self.r0_window, width=8).pack(side="left", padx=(4,10))
         ttk.Button(rv_cfg, text="Refresh previews", command=self.update_all_previews).pack(side="right")
 
-        # R–Spacing
-        self.tab_rs = ttk.Frame(nb); nb.add(self.tab_rs, text="R–Spacing")
-        self.preview_rs = self._build_preview_panel(self.tab_rs, "R0 vs Spacing", "Spacing d (μm)", "Resistance R0 (Ω)")
+    def _build_tab_rs(self):
+        rs_cfg = ttk.Frame(self.tab_rs, padding=(8,6,8,0)); rs_cfg.pack(fill="x")
+        ttk.Label(rs_cfg, text="Fit").pack(side="left")
+        cb = ttk.Combobox(rs_cfg, values=list(ROBUST_METHODS), textvariable=self.fit_method, width=10, state="readonly")
+        cb.pack(side="left", padx=(4,10)); cb.bind("<<ComboboxSelected>>", lambda _e: self.update_all_previews())
+        ttk.Label(rs_cfg, text="Outliers are flagged by leave-one-out; robust fits also exclude them").pack(side="left")
+        self._build_preview_panel(self.tab_rs, self.preview_rs)
 
         # --- Rt(R0) 清單（可滾動） ---
         rt_frame = ttk.LabelFrame(self.tab_rs, text="各點 Rt(R0) 清單", padding=6)
@@ -516,34 +2588,58 @@ class App(tk.Tk):
         scr = ttk.Scrollbar(wrap, orient="vertical", command=self.result_text.yview); scr.pack(side="right", fill="y")
         self.result_text.configure(yscrollcommand=scr.set)
 
-        # Correlation
-        self.tab_corr = ttk.Frame(nb); nb.add(self.tab_corr, text="R–Spacing Correlation")
-        self.preview_corr = self._build_preview_panel(self.tab_corr, "Original vs Corrected Rt(d)", "Spacing d (μm)", "Resistance (Ω)")
-        self.corr_text = tk.StringVar(value="")
+    def _build_tab_corr(self):
+        self._build_preview_panel(self.tab_corr, self.preview_corr)
         ttk.Label(self.tab_corr, textvariable=self.corr_text).pack(anchor="w", padx=8, pady=(0,8))
 
-        # C–V
-        self.tab_cv = ttk.Frame(nb); nb.add(self.tab_cv, text="C–V")
-        self.preview_cv = self._build_preview_panel(self.tab_cv, "C–V (per frequency)", "Voltage (V)", "Capacitance (F)")
-
-        # bottom
-        btns = ttk.Frame(self, padding=8); btns.pack(fill="x")
-        ttk.Button(btns, text="Select all", command=self.select_all).pack(side="left")
-        ttk.Button(btns, text="Clear", command=self.clear_all).pack(side="left", padx=(6,0))
-        ttk.Button(btns, text="Refresh previews", command=self.update_all_previews).pack(side="left", padx=(6,0))
-        ttk.Button(btns, text="Export", command=self.export_all).pack(side="right")
-        self.status = tk.Text(self, height=5); self.status.pack(fill="both", padx=8, pady=(0,8))
-
-    def _build_preview_panel(self, parent, title, xl, yl):
+    def _build_tab_cv(self):
+        self._build_preview_panel(self.tab_cv, self.preview_cv)
+
+    def _build_tab_wafer(self):
+        wcfg = ttk.LabelFrame(self.tab_wafer, text="Die map (selected I–V sweeps; die / structure from the grouping rules)", padding=6)
+        wcfg.pack(fill="x", padx=8, pady=(8,4))
+        ttk.Label(wcfg, text="Structure").grid(row=0,column=0,sticky="e")
+        self._wstruct_cb = ttk.Combobox(wcfg, values=self._structures(), textvariable=self.wafer_structure, width=14, state="readonly")
+        self._wstruct_cb.grid(row=0,column=1,sticky="w",padx=(4,12))
+        ttk.Button(wcfg, text="Build map", command=self.build_wafer_map).grid(row=0,column=4,sticky="e")
+        ttk.Label(wcfg, text="Metric").grid(row=1,column=0,sticky="e",pady=(4,0))
+        cb = ttk.Combobox(wcfg, values=[m for m, _ in WAFER_METRICS], textvariable=self.wafer_metric, width=14, state="readonly")
+        cb.grid(row=1,column=1,sticky="w",padx=(4,12),pady=(4,0)); cb.bind("<<ComboboxSelected>>", lambda _e: self._update_wafer_metric())
+        cb = ttk.Combobox(wcfg, values=list(WAFER_METHODS), textvariable=self.wafer_method, width=10, state="readonly")
+        cb.grid(row=1,column=3,sticky="w",padx=(4,12),pady=(4,0)); cb.bind("<<ComboboxSelected>>", lambda _e: self._update_wafer_metric())
+        self._build_preview_panel(self.tab_wafer, self.preview_wafer)
+        ttk.Label(self.tab_wafer, textvariable=self.wafer_info).pack(anchor="w", padx=8, pady=(0,4))
+        self._build_preview_panel(self.tab_wafer, self.preview_wdie)
+        self._set_blank(self.preview_wafer['frame'], "Press “Build map”")
+
+    def _build_tab_cond(self):
+        cfg = ttk.LabelFrame(self.tab_cond, text="Conditions (all loaded I–V sweeps; rule: file-name regex · label:… · header:Key[:regex])", padding=6)
+        cfg.pack(fill="x", padx=8, pady=(8,4))
+        ttk.Label(cfg, text="Condition").grid(row=0,column=0,sticky="e")
+        ttk.Entry(cfg, textvariable=self.cond_rule, width=30).grid(row=0,column=1,sticky="w",padx=(4,12))
+        ttk.Label(cfg, text="Unit").grid(row=0,column=2,sticky="e")
+        cb = ttk.Combobox(cfg, values=list(CONDITION_UNITS), textvariable=self.cond_unit, width=6, state="readonly")
+        cb.grid(row=0,column=3,sticky="w",padx=(4,12)); cb.bind("<<ComboboxSelected>>", lambda _e: self._show_conditions())
+        ttk.Label(cfg, text="Method").grid(row=0,column=4,sticky="e")
+        cb = ttk.Combobox(cfg, values=list(WAFER_METHODS), textvariable=self.cond_method, width=10, state="readonly")
+        cb.grid(row=0,column=5,sticky="w",padx=(4,12)); cb.bind("<<ComboboxSelected>>", lambda _e: self._show_conditions())
+        ttk.Button(cfg, text="Analyze", command=self.analyze_conditions).grid(row=0,column=6,sticky="e")
+        ttk.Button(cfg, text="Save tables", command=self.save_condition_tables).grid(row=0,column=7,sticky="e",padx=(6,0))
+        self._build_preview_panel(self.tab_cond, self.preview_cond)
+        wrap = ttk.Frame(self.tab_cond); wrap.pack(fill="both", padx=8, pady=(0,8))
+        self.cond_text = tk.Text(wrap, height=12, wrap="none"); self.cond_text.pack(side="left", fill="both", expand=True)
+        scr = ttk.Scrollbar(wrap, orient="vertical", command=self.cond_text.yview); scr.pack(side="right", fill="y")
+        self.cond_text.configure(yscrollcommand=scr.set)
+        self._set_blank(self.preview_cond['frame'], "Press “Analyze”")
+
+    def _make_panel(self, title, xl, yl):
         p = {}
+        for k, v in panel_defaults(title, xl, yl).items():
+            p[k] = tk.BooleanVar(value=v) if isinstance(v, bool) else tk.StringVar(value=v)
+        return p
+
+    def _build_preview_panel(self, parent, p):
         top = ttk.LabelFrame(parent, text="Figure settings", padding=6); top.pack(fill="x", padx=8, pady=(8,6))
-        p['title'] = tk.StringVar(value=title); p['xlabel'] = tk.StringVar(value=xl); p['ylabel'] = tk.StringVar(value=yl)
-        p['x_auto'] = tk.BooleanVar(value=True); p['y_auto'] = tk.BooleanVar(value=True)
-        p['xmin'] = tk.StringVar(); p['xmax'] = tk.StringVar(); p['ymin'] = tk.StringVar(); p['ymax'] = tk.StringVar()
-        p['xscale'] = tk.StringVar(value="linear"); p['yscale'] = tk.StringVar(value="linear")
-        p['dpi'] = tk.StringVar(value="300"); p['figw'] = tk.StringVar(value="6"); p['figh'] = tk.StringVar(value="4")
-        p['show_legend'] = tk.BooleanVar(value=True); p['legend_size'] = tk.StringVar(value="14"); p['legend_ncol'] = tk.StringVar(value="1")
-        p['title_size'] = tk.StringVar(value="20"); p['label_size'] = tk.StringVar(value="18")
         r1 = ttk.Frame(top); r1.pack(fill="x")
         ttk.Label(r1, text="Title").grid(row=0,column=0,sticky="e"); ttk.Entry(r1,textvariable=p['title'],width=38).grid(row=0,column=1,sticky="w",padx=4)
         ttk.Label(r1, text="X label").grid(row=0,column=2,sticky="e"); ttk.Entry(r1,textvariable=p['xlabel'],width=18).grid(row=0,column=3,sticky="w",padx=4)
@@ -577,31 +2673,13 @@ class App(tk.Tk):
         return p
 
     def style_axes(self, ax, panel):
-        ts = int(panel['title_size'].get() or 12)
-        ls = int(panel['label_size'].get() or 12)
-        ax.set_title(panel['title'].get(), fontsize=ts, fontweight='bold')
-        ax.set_xlabel(panel['xlabel'].get(), fontsize=ls, fontweight='bold')
-        ax.set_ylabel(panel['ylabel'].get(), fontsize=ls, fontweight='bold')
-        ax.set_xscale(panel['xscale'].get()); ax.set_yscale(panel['yscale'].get())
-        if not panel['x_auto'].get():
-            xmin = safe_float(panel['xmin'].get()); xmax = safe_float(panel['xmax'].get())
-            if xmin is not None and xmax is not None: ax.set_xlim([xmin, xmax])
-        if not panel['y_auto'].get():
-            ymin = safe_float(panel['ymin'].get()); ymax = safe_float(panel['ymax'].get())
-            if ymin is not None and ymax is not None: ax.set_ylim([ymin, ymax])
-        ax.tick_params(which='both', direction='in', length=8, width=2, top=False, right=False, bottom=True, left=True, labelsize=14)
-        ax.tick_params(which='minor', length=4, width=1, direction='in', top=False, right=False, bottom=True, left=True)
-        ax.xaxis.set_minor_locator(AutoMinorLocator()); ax.yaxis.set_minor_locator(AutoMinorLocator())
-        ax.grid(which='major', linestyle='-', linewidth=0.5, color='darkgray')
-        for s in ['top','right','bottom','left']:
-            ax.spines[s].set_color('black'); ax.spines[s].set_linewidth(2)
+        style_axes(ax, panel_values(panel))
+
+    def _legend(self, ax, panel, handles=None, labels=None, total=None):
+        apply_legend(ax, panel_values(panel), handles, labels, total)
 
-    def _legend(self, ax, panel):
-        if panel['show_legend'].get():
-            fsz = int(panel['legend_size'].get() or 10)
-            ncol = int(panel['legend_ncol'].get() or 2)
-            leg = ax.legend(ncol=ncol, fancybox=True, loc='best', prop={'weight':'bold','size':fsz})
-            leg.get_frame().set_edgecolor('black'); leg.get_frame().set_linewidth(2)
+    def _fast_overlay(self, items):
+        return self.fast_overlay.get() and len(items) >= FAST_OVERLAY_MIN
 
     # ----- sweeps 表 -----
     def _populate_rows(self):
@@ -612,6 +2690,8 @@ class App(tk.Tk):
         for ch in self.rows_container.winfo_children():
             ch.destroy()
         self.rows.clear()
+        self.spark.reset(); self._spark_lbls = []; self._spark_imgs = {}
+        self._spark_pending.clear(); self._spark_failed.clear()
         n = len(self.curves)
         for idx, c in enumerate(self.curves, start=1):
             var_use = tk.BooleanVar(value=True if idx <= 9 else False)
@@ -639,7 +2719,67 @@ class App(tk.Tk):
                 yr = f"[{np.min(c['C']):.3e}, {np.max(c['C']):.3e}]"
             ttk.Label(self.rows_container, text=f"[{np.min(V):.3f}, {np.max(V):.3f}]", width=self.col_widths[8], anchor="w").grid(row=idx, column=8, sticky="w")
             ttk.Label(self.rows_container, text=yr, width=self.col_widths[9], anchor="w").grid(row=idx, column=9, sticky="w")
+            sp = ttk.Label(self.rows_container, image=self._spark_blank); sp.grid(row=idx, column=10, sticky="w")
+            self._spark_lbls.append(sp)
             self.rows.append((var_use, var_follow, var_g, var_label, var_color, var_line, var_mark, idx))
+        self._picked_row = None
+        self._spark_refresh_soon()
+
+    def select_sweep_row(self, row):
+        """標示 sweeps 表第 row 列（0 起算）並捲動到看得見的位置。"""
+        cells = self.rows_container.grid_slaves(row=row + 1, column=1)
+        if not cells: return
+        ttk.Style(self).configure("Picked.TLabel", background="#ffd54f", foreground="black")
+        if self._picked_row is not None:
+            for w in self.rows_container.grid_slaves(row=self._picked_row + 1, column=1): w.configure(style="TLabel")
+        cells[0].configure(style="Picked.TLabel"); self._picked_row = row
+        self.update_idletasks()
+        h = max(self.tbl.winfo_height(), 1)
+        self.tbl_canvas.yview_moveto(max(self.rows_container.winfo_y() + cells[0].winfo_y() - 40, 0) / h)
+
+    # ----- sweeps 縮圖：只排看得到的列，render 在背景執行緒，這裡只把 PNG 換成 PhotoImage -----
+    def _spark_refresh_soon(self):
+        if self._spark_after is None:
+            self._spark_after = self.after(60, self._spark_refresh)
+
+    def _spark_rows(self):
+        """目前看得到的 sweeps 列（0 起算），上下各多預取半個畫面。"""
+        n = len(self._spark_lbls)
+        if not n: return range(0)
+        _, y0, _, rh = self.rows_container.grid_bbox(0, 1)
+        top = self.tbl_canvas.canvasy(0) - self.rows_container.winfo_y() - y0
+        h = self.tbl_canvas.winfo_height(); rh = max(rh, 1)
+        return range(max(int((top - h / 2) // rh), 0), min(int((top + 1.5 * h) // rh) + 1, n))
+
+    def _spark_refresh(self):
+        self._spark_after = None
+        rows = self._spark_rows()
+        self.spark.wanted = frozenset(rows)
+        for r in rows:
+            if r in self._spark_imgs or r in self._spark_pending or r in self._spark_failed: continue
+            c = self.curves[r]
+            self._spark_pending.add(r); self.spark.submit(r, c["V"], c["I"] if c.get("I") is not None else c["C"])
+        if self._spark_pending and self._spark_poll_id is None:
+            self._spark_poll_id = self.after(30, self._spark_poll)
+
+    def _spark_poll(self):
+        import base64
+        self._spark_poll_id = None
+        for row, png in self.spark.results():
+            self._spark_pending.discard(row)
+            if png is None:                     # 排程時已捲出畫面；若這期間又捲回來，refresh 當時它還在 pending，這裡補排
+                if row in self.spark.wanted: self._spark_refresh_soon()
+                continue
+            if not png: self._spark_failed.add(row); continue
+            img = tk.PhotoImage(data=base64.b64encode(png).decode("ascii"))
+            self._spark_imgs[row] = img; self._spark_lbls[row].configure(image=img)
+        if len(self._spark_imgs) > SPARK_IMAGES:   # 離畫面最遠的換回空白圖
+            rows = self._spark_rows(); mid = (rows.start + rows.stop) / 2
+            far = sorted(set(self._spark_imgs) - set(rows), key=lambda r: abs(r - mid), reverse=True)
+            for r in far[:len(self._spark_imgs) - SPARK_IMAGES]:
+                del self._spark_imgs[r]; self._spark_lbls[r].configure(image=self._spark_blank)
+        if self._spark_pending:
+            self._spark_poll_id = self.after(30, self._spark_poll)
 
     def on_choose_outdir(self):
         d = filedialog.askdirectory(title="選擇輸出資料夾")
@@ -654,13 +2794,57 @@ class App(tk.Tk):
     def log(self, msg):
         self.status.insert("end", msg + "\n"); self.status.see("end")
 
+    # ----- Stage 計時 / cProfile -----
+    def _out_dir(self):
+        return self.outdir or (self.csv_path.parent if self.csv_path else Path.cwd()) / "trinity_capres_out"
+
+    def _toggle_profile(self):
+        self.prof.enabled = self.profile_var.get()
+        self.log(f"Profile {'on' if self.prof.enabled else 'off'}")
+
+    def _profile_flush_soon(self):
+        # canvas 真正 draw 是在 draw_idle 之後，稍等一下再一起輸出
+        if self._prof_pending: return
+        self._prof_pending = True
+        self.after(150, self._profile_flush)
+
+    def _profile_flush(self):
+        self._prof_pending = False
+        line = self.prof.summary()
+        if line is None: return
+        self.log(f"[profile] {line}")
+        try:
+            self.prof.write_trace(os.environ.get("TRINITY_TRACE") or self._out_dir() / "trinity_trace.json")
+        except OSError as e:
+            self.log(f"[profile] trace not written: {e}")
+
+    def profile_refresh(self):
+        """用 cProfile 跑一次完整 refresh（含 canvas draw），輸出 .prof 並列出最耗時的函式。"""
+        import cProfile, pstats
+        pr = cProfile.Profile()
+        pr.enable()
+        try:
+            self.update_all_previews()
+            self.update_idletasks()
+        finally:
+            pr.disable()
+        out = self._out_dir(); out.mkdir(parents=True, exist_ok=True)
+        path = out / "refresh.prof"
+        pr.dump_stats(str(path))
+        st = pstats.Stats(pr).stats
+        top = sorted(st.items(), key=lambda kv: kv[1][3], reverse=True)[:6]
+        self.log(f"cProfile: {path}  (python -m pstats / snakeviz)")
+        for (fname, lineno, func), (_cc, nc, _tt, ct, _callers) in top:
+            self.log(f"  {ct * 1000:8.1f} ms  {nc:>6}×  {func} ({Path(fname).name}:{lineno})")
+
     # ----- 選取 -----
-    def current_selection(self):
+    @profiled()
+    def current_selection(self, all_rows=False):
         include = []; display = []
         globals_ = [v.get().strip() for v in self.global_vars]
         for i, row in enumerate(self.rows):
             use, follow, gidx, label, color, line_on, mark_on, idx = row
-            if not use.get(): continue
+            if not (all_rows or use.get()): continue
             include.append(idx)
             if follow.get():
                 try:
@@ -676,91 +2860,102 @@ class App(tk.Tk):
                 "I": self.curves[i].get("I", None),
                 "C": self.curves[i].get("C", None),
                 "label": disp_label, "color": clr, "gidx": gidx.get(),
-                "line": line_on.get(), "marker": mark_on.get()
+                "line": line_on.get(), "marker": mark_on.get(), "row": i
             }
             display.append(d)
         return include, display
 
     # ----- 計算 -----
     def compute_rv(self, V, I):
-        if I is None or len(V) < 3:
-            return V, np.full_like(V, np.nan)
-        dIdV = np.gradient(I, V, edge_order=2)
-        with np.errstate(divide='ignore', invalid='ignore'):
-            R = 1.0 / dIdV
-        return V, R
+        return compute_rv(V, I)
 
     def compute_r0_at_zero(self, V, I, window=0.5):
-        if I is None:
-            return np.nan
-        idx = np.where(np.abs(V) <= window)[0]
-        if len(idx) < 3:
-            order = np.argsort(np.abs(V)); idx = order[:max(3, min(7, len(V)))]
-        v = V[idx]; i = I[idx]
+        return compute_r0_at_zero(V, I, window=window)
+
+    def _spacing_of(self, d):
+        if self.use_group_rules.get():
+            sp = self._group_index()[1].get(d.get("row"), {}).get("spacing")
+            if sp is not None: return sp
+        spacing_label = self.global_vars[int(d["gidx"])-1].get().strip() if d.get("gidx") else d["label"]
+        return parse_numeric_from_label(spacing_label) or parse_numeric_from_label(d["label"])
+
+    # ---------- 分組規則 ----------
+    def _rules(self):
+        return {f: v.get() for f, v in self.group_rules.items()}
+
+    def _group_index(self):
+        """(groups, fields)，依 (curves, 規則) 快取；regex 錯誤時記 log 並回傳空索引。"""
+        rules = self._rules()
+        key = (id(self.curves), len(self.curves), tuple(sorted(rules.items())))
+        if self._gindex is not None and self._gindex[0] == key:
+            return self._gindex[1]
+        import re
         try:
-            a, _b = np.polyfit(v, i, 1)
-            if np.isclose(a, 0): return np.nan
-            return 1.0 / a
-        except Exception:
-            return np.nan
+            with self.prof.stage("group_index", curves=len(self.curves)):
+                res = index_ctlm_groups(self.curves, rules)
+        except re.error as e:
+            self.log(f"Grouping rule error: {e}"); res = ({}, {})
+        self._gindex = (key, res)
+        return res
+
+    def _structures(self):
+        groups = self._group_index()[0] if self.curves else {}
+        return ["(all)"] + sorted({st for _, st in groups if st})
+
+    def _r2_for(self, display):
+        """選取項目的 R2（μm）：規則給出唯一 R2 時用它，否則用上方 R2 欄位。"""
+        if self.use_group_rules.get():
+            fields = self._group_index()[1]
+            r2 = {fields[d["row"]]["R2"] for d in display if d.get("row") in fields} - {None}
+            if len(r2) == 1: return r2.pop()
+        return safe_float(self.r2_var.get())
+
+    def index_groups(self):
+        if not self.curves:
+            messagebox.showinfo("Info", "Load CSV files first."); return
+        self._gindex = None
+        groups, fields = self._group_index()
+        vals = list(fields.values())
+        dies = {f["die"] for f in vals} - {None}
+        structs = {f["structure"] for f in vals} - {None}
+        spacings = {f["spacing"] for f in vals} - {None}
+        self.log(f"Grouping: {len(groups)} groups · {len(dies)} dies · {len(structs)} structures · "
+                 f"{len(spacings)} spacings from {len(vals)} I–V curves")
+        miss_die = sum(f["die"] is None for f in vals); miss_sp = sum(f["spacing"] is None for f in vals)
+        if miss_die or miss_sp:
+            self.log(f"  unmatched: {miss_die} without die, {miss_sp} without spacing")
+        if self._wstruct_cb is not None:
+            self._wstruct_cb["values"] = self._structures()
+        self.update_all_previews()
 
-    def build_rs_points(self, display):
+    @profiled()
+    def build_rs_points(self, display, with_rows=False):
+        """回傳 (xs, ys, labels, colors)；with_rows=True 時再附上每點對應的 sweeps 列。"""
         window = safe_float(self.r0_window.get(), 0.5)
-        xs, ys, labs, clrs = [], [], [], []
+        xs, ys, labs, clrs, rows = [], [], [], [], []
         for d in display:
             if d.get("I") is None: continue
             R0 = self.compute_r0_at_zero(d["V"], d["I"], window=window)
-            spacing_label = self.global_vars[int(d["gidx"])-1].get().strip() if d.get("gidx") else d["label"]
-            spacing = parse_numeric_from_label(spacing_label) or parse_numeric_from_label(d["label"])
+            spacing = self._spacing_of(d)
             if spacing is None or np.isnan(R0): continue
             xs.append(float(spacing)); ys.append(float(R0)); labs.append(d["label"]); clrs.append(d['color'])
-        return xs, ys, labs, clrs
+            rows.append(d.get("row"))
+        return (xs, ys, labs, clrs, rows) if with_rows else (xs, ys, labs, clrs)
 
     # Model-1（內部長度用 cm）
-    def rho_method1(self, xs: np.ndarray, ys: np.ndarray, R2_um: float):
-        d_cm  = np.asarray(xs, float) * UM_TO_CM
-        R2_cm = float(R2_um) * UM_TO_CM
-        if np.any(d_cm <= 0) or np.any(d_cm >= R2_cm) or d_cm.size < 2:
-            return None
-        x1 = np.log(R2_cm / (R2_cm - d_cm))                 # 無因次
-        x2 = 1.0/(R2_cm - d_cm) + 1.0/R2_cm                 # 1/cm
-        X = np.column_stack([x1, x2])
-        try:
-            beta, *_ = np.linalg.lstsq(X, ys, rcond=None)
-        except Exception:
-            return None
-        A, B = beta  # A: Ω, B: Ω·cm
-        Rs = 2*np.pi*A                                   # Ω/□
-        rhoc = (2*np.pi*B)**2 / Rs if Rs != 0 else np.nan  # Ω·cm²
-        Lt_cm = np.sqrt(rhoc / Rs) if (np.isfinite(rhoc) and Rs > 0) else np.nan
-        Lt_um = Lt_cm / UM_TO_CM if np.isfinite(Lt_cm) else np.nan
-        return None if not np.isfinite(Lt_um) else (Rs, Lt_um, rhoc)
+    def rho_method1(self, xs: np.ndarray, ys: np.ndarray, R2_um: float, weights=None):
+        return rho_method1(xs, ys, R2_um, weights)
 
     # Model-2（correlation 線性化）
-    def rho_method2(self, xs: np.ndarray, ys: np.ndarray, R2_um: float):
-        d = np.asarray(xs, float); Rt = np.asarray(ys, float)
-        if d.size < 2 or np.any(d <= 0) or np.any(d >= R2_um):
-            return None
-        C = (R2_um/d)*np.log(R2_um/(R2_um - d))
-        ycorr = Rt / C
-        X = np.column_stack([d, np.ones_like(d)])
-        beta, *_ = np.linalg.lstsq(X, ycorr, rcond=None)
-        m, c = float(beta[0]), float(beta[1])
-        yfit = m*d + c
-        ss_res = np.sum((ycorr - yfit)**2); ss_tot = np.sum((ycorr - ycorr.mean())**2)
-        r2 = 1 - ss_res/ss_tot if ss_tot > 0 else np.nan
-        Rs = m * 2*np.pi*R2_um
-        Lt_um = c/(2*m) if m != 0 else np.nan
-        if not np.isfinite(Lt_um):
-            return None
-        rhoc = Rs * (Lt_um*UM_TO_CM)**2
-        return Rs, Lt_um, rhoc, (m, c, r2)
+    def rho_method2(self, xs: np.ndarray, ys: np.ndarray, R2_um: float, weights=None):
+        return rho_method2(xs, ys, R2_um, weights)
 
     # ----- 繪圖 -----
     def _set_blank(self, frame, text):
         for w in frame.winfo_children(): w.destroy()
         ttk.Label(frame, text=text).pack(anchor="center", expand=True)
 
+    @profiled()
     def _embed_figure_keep_ratio(self, panel, fig):
         """把 fig 以等比例縮放嵌入 panel['frame']，避免被擠壓變形。"""
         frm = panel['frame']
@@ -774,23 +2969,42 @@ class App(tk.Tk):
         container = ttk.Frame(frm)
         container.pack(fill="both", expand=True)
     
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
         canvas = FigureCanvasTkAgg(fig, master=container)
+        canvas.draw = self.prof.wrap("canvas_draw", canvas.draw)  # draw_idle 之後才真正畫，分開計時
         widget = canvas.get_tk_widget()
         widget.place(x=0, y=0, relwidth=0, relheight=0)
-    
+        # layout：上次 tight_layout 時的像素尺寸；shown：widget 目前的尺寸（= 最後一張點陣圖）
+        st = dict(after=None, size=None, shown=None,
+                  layout=(fig.get_figwidth() * fig.dpi, fig.get_figheight() * fig.dpi))
+
+        def settle():
+            st["after"] = None
+            if not container.winfo_exists(): return
+            x, y, tw, th = fit_keep_ratio(*st["size"], aspect)
+            if tw < 2 or th < 2: return
+            if (tw, th) == st["shown"]:
+                widget.place(x=x, y=y); return
+            with self.prof.stage("resize", w=tw, h=th):
+                lw, lh = st["layout"]
+                if abs(tw - lw) > RELAYOUT_FRAC * lw or abs(th - lh) > RELAYOUT_FRAC * lh:
+                    fig.set_size_inches(tw / fig.dpi, th / fig.dpi)
+                    with self.prof.stage("tight_layout"): fig.tight_layout()
+                    st["layout"] = (tw, th)
+                # widget 改尺寸時 FigureCanvasTk 自己的 <Configure> 會 set_size_inches + draw_idle，這裡不再重複
+                widget.place(x=x, y=y, width=tw, height=th)
+            st["shown"] = (tw, th)
+
         def on_resize(e):
-            W, H = e.width, e.height
-            tw = W
-            th = int(tw / aspect)
-            if th > H:
-                th = H
-                tw = int(th * aspect)
-            x = (W - tw) // 2
-            y = (H - th) // 2
-            widget.place(x=x, y=y, width=tw, height=th)
-            fig.set_size_inches(tw / fig.dpi, th / fig.dpi)
-            canvas.draw_idle()
-    
+            st["size"] = (e.width, e.height)
+            if st["shown"] is None:
+                settle(); return  # 第一次顯示不等
+            # 拖曳中：widget 尺寸不動（不重畫），上一張點陣圖只重新置中；停下來才 settle
+            sw, sh = st["shown"]
+            widget.place(x=max((e.width - sw) // 2, 0), y=max((e.height - sh) // 2, 0))
+            if st["after"] is not None: self.after_cancel(st["after"])
+            st["after"] = self.after(RESIZE_SETTLE_MS, settle)
+
         container.bind("<Configure>", on_resize)
         return canvas
 
@@ -798,106 +3012,171 @@ class App(tk.Tk):
 
 
     def update_all_previews(self):
-        if not self.curves:
-            for p in [self.preview_iv, self.preview_rv, self.preview_rs, self.preview_corr, self.preview_cv]:
-                self._set_blank(p['frame'], "請載入資料")
-            return
-        include, display = self.current_selection()
-        self._draw_iv(self.preview_iv, display)
-        self._draw_rv(self.preview_rv, display)
-        self._draw_rs(self.preview_rs, display)
-        self._draw_corr(self.preview_corr, display)
-        self._draw_cv(self.preview_cv, display)
+        # 所有分頁標記為待重畫，只立即重畫目前看得到的那一頁；其他分頁切過去時才畫
+        for t in self._tabs.values(): t["dirty"] = True
+        self._refresh_current_tab()
 
+    @profiled()
     def _draw_iv(self, panel, display):
         for w in panel['frame'].winfo_children(): w.destroy()
         items = [d for d in display if d.get("I") is not None]
         if not items:
             self._set_blank(panel['frame'], "No I–V curves"); return
         figw = safe_float(panel['figw'].get(), 6); figh = safe_float(panel['figh'].get(), 4)
-        fig, ax = plt.subplots(figsize=(figw, figh), dpi=100)
-        for d in items:
-            lw = 1.5 if d["line"] else 0; ms = 4 if d["marker"] else 0
-            ax.plot(d["V"], d["I"], label=d["label"], color=d["color"],
-                    linewidth=lw, marker='o' if d["marker"] else None, markersize=ms,
-                    markeredgewidth=1.0 if d["marker"] else 0, markeredgecolor='black' if d["marker"] else None,
-                    markerfacecolor=d["color"] if d["marker"] else None)
-        self.style_axes(ax, panel); self._legend(ax, panel)
-        fig.tight_layout()
-        self._embed_figure_keep_ratio(panel, fig)
+        fig, ax = new_subplots(figw, figh, 100)
+        leg = ()
+        if self._fast_overlay(items):
+            leg = plot_overlay_fast(ax, [(d["V"], d["I"], d["label"], d["color"], d["line"], d["marker"]) for d in items],
+                                    lw=1.5, ms=4, marker_edge=True)
+        else:
+            for d in items:
+                lw = 1.5 if d["line"] else 0; ms = 4 if d["marker"] else 0
+                ax.plot(d["V"], d["I"], label=d["label"], color=d["color"],
+                        linewidth=lw, marker='o' if d["marker"] else None, markersize=ms,
+                        markeredgewidth=1.0 if d["marker"] else 0, markeredgecolor='black' if d["marker"] else None,
+                        markerfacecolor=d["color"] if d["marker"] else None)
+        self.style_axes(ax, panel); self._legend(ax, panel, *leg)
+        with self.prof.stage("tight_layout"): fig.tight_layout()
+        canvas = self._embed_figure_keep_ratio(panel, fig)
+        self._attach_hover(canvas, ax, [(d["V"], d["I"], (d["row"], d["label"])) for d in items], ("V", "I"))
 
 
+    @profiled()
     def _draw_rv(self, panel, display):
         for w in panel['frame'].winfo_children(): w.destroy()
         items = [d for d in display if d.get("I") is not None]
         if not items:
             self._set_blank(panel['frame'], "No I–V curves"); return
         figw = safe_float(panel['figw'].get(), 6); figh = safe_float(panel['figh'].get(), 4)
-        fig, ax = plt.subplots(figsize=(figw, figh), dpi=100)
-        for d in items:
-            V, R = self.compute_rv(d["V"], d["I"])
-            lw = 1.2 if d["line"] else 0; ms = 3 if d["marker"] else 0
-            ax.plot(V, R, label=d["label"], color=d["color"],
-                    linewidth=lw, marker='o' if d["marker"] else None, markersize=ms)
-        self.style_axes(ax, panel); self._legend(ax, panel)
-        fig.tight_layout()
-        self._embed_figure_keep_ratio(panel, fig)
-
-    def _draw_rs(self, panel, display):
+        fig, ax = new_subplots(figw, figh, 100)
+        leg = ()
+        rv = [self.compute_rv(d["V"], d["I"]) for d in items]
+        if self._fast_overlay(items):
+            leg = plot_overlay_fast(ax, [(V, R, d["label"], d["color"], d["line"], d["marker"])
+                                         for d, (V, R) in zip(items, rv)], lw=1.2, ms=3)
+        else:
+            for d, (V, R) in zip(items, rv):
+                lw = 1.2 if d["line"] else 0; ms = 3 if d["marker"] else 0
+                ax.plot(V, R, label=d["label"], color=d["color"],
+                        linewidth=lw, marker='o' if d["marker"] else None, markersize=ms)
+        self.style_axes(ax, panel); self._legend(ax, panel, *leg)
+        with self.prof.stage("tight_layout"): fig.tight_layout()
+        canvas = self._embed_figure_keep_ratio(panel, fig)
+        self._attach_hover(canvas, ax, [(V, R, (d["row"], d["label"])) for d, (V, R) in zip(items, rv)], ("V", "R"))
+
+    @profiled()
+    def _draw_rs(self, panel, display, report=True):
+        """report=False 時只畫圖，不更新 Rt 清單與結果文字（wafer map 的 die 預覽用）。"""
         for w in panel['frame'].winfo_children(): w.destroy()
         items = [d for d in display if d.get("I") is not None]
-        xs, ys, labs, clrs = self.build_rs_points(items)
+        xs, ys, labs, clrs, rows = self.build_rs_points(items, with_rows=True)
         if not xs:
-            self._set_blank(panel['frame'], "No R0 points"); self._update_rt_list([]); self.result_text.delete("1.0","end"); return
+            self._set_blank(panel['frame'], "No R0 points")
+            if report: self._update_rt_list([]); self.result_text.delete("1.0","end")
+            return
+        R2_um = self._r2_for(items)
+        meth = self.fit_method.get() or "OLS"
+        weights, flags = ctlm_outliers(xs, ys, R2_um, meth)
+        weights = None if weights is None else weights[0]; flags = flags[0]
         figw = safe_float(panel['figw'].get(), 6); figh = safe_float(panel['figh'].get(), 4)
-        fig, ax = plt.subplots(figsize=(figw, figh), dpi=100)
-        for x, y, lab, clr in zip(xs, ys, labs, clrs):
-            ax.scatter(x, y, label=lab, color=clr, edgecolors='black')
-        # OLS: y = a x + b
+        fig, ax = new_subplots(figw, figh, 100)
+        fast = self._fast_overlay(xs)
+        if fast:
+            pt_handles, pt_labels = scatter_points_fast(ax, xs, ys, labs, clrs, reserve=2)
+        else:
+            for x, y, lab, clr in zip(xs, ys, labs, clrs):
+                ax.scatter(x, y, label=lab, color=clr, edgecolors='black')
+        if flags.any():
+            ax.scatter(np.asarray(xs)[flags], np.asarray(ys)[flags], s=180, facecolors='none', edgecolors='red',
+                       linewidths=2, zorder=3, label="flagged (LOO)")
+        # 直線 y = a x + b（OLS，或以穩健權重加權）
         xarr = np.asarray(xs, float); yarr = np.asarray(ys, float)
-        mask = np.isfinite(xarr) & np.isfinite(yarr); xarr = xarr[mask]; yarr = yarr[mask]
-        fit_summary = "insufficient points"
-        if xarr.size >= 2:
+        # 權重全為 0 時不退回 OLS：直線與下面的 Method-1/2/exact 一致，都當作沒有可用的點（同 _fit_die）
+        rejected = weights is not None and not weights.any()
+        w = np.ones_like(xarr) if weights is None else weights
+        fit_summary = f"[{meth}] all points rejected" if rejected else "insufficient points"
+        if np.count_nonzero(w) >= 2:
+            sw = np.sqrt(w)
             X = np.column_stack([xarr, np.ones_like(xarr)])
-            beta, *_ = np.linalg.lstsq(X, yarr, rcond=None)
+            beta, *_ = np.linalg.lstsq(X * sw[:, None], yarr * sw, rcond=None)
             a, b = float(beta[0]), float(beta[1])
             xfit = np.linspace(xarr.min(), xarr.max(), 200); yfit = a*xfit + b
-            ax.plot(xfit, yfit, color="black", linewidth=1.2, linestyle="--", label="fit")
-            ss_res = np.sum((yarr - (a*xarr + b))**2); ss_tot = np.sum((yarr - yarr.mean())**2)
+            ax.plot(xfit, yfit, color="black", linewidth=1.2, linestyle="--", label="fit" if meth == "OLS" else f"fit ({meth})")
+            ss_res = np.sum(w*(yarr - (a*xarr + b))**2); ss_tot = np.sum(w*(yarr - np.average(yarr, weights=w))**2)
             r2 = 1 - ss_res/ss_tot if ss_tot > 0 else np.nan
-            fit_summary = f"a={a:.6g} (Ω/μm), b={b:.6g} (Ω), R²={r2:.4f}"
-            
+            fit_summary = f"{'' if meth == 'OLS' else f'[{meth}] '}a={a:.6g} (Ω/μm), b={b:.6g} (Ω), R²={r2:.4f}"
+
         self.style_axes(ax, panel)
-        self._legend(ax, panel)
-        fig.tight_layout()
-        self._embed_figure_keep_ratio(panel, fig)
+        if fast:
+            fit_h, fit_l = ax.get_legend_handles_labels()
+            self._legend(ax, panel, pt_handles + fit_h, pt_labels + fit_l, len(xs) + len(fit_h))
+        else:
+            self._legend(ax, panel)
+        with self.prof.stage("tight_layout"): fig.tight_layout()
+        canvas = self._embed_figure_keep_ratio(panel, fig)
+        self._attach_hover(canvas, ax, [([x], [y], (r, lab)) for x, y, r, lab in zip(xs, ys, rows, labs)], ("d", "R0"))
+        if not report: return
 
-    
-        self._update_rt_list(list(zip(xs, ys, labs)))
-        R2_um = safe_float(self.r2_var.get())
+        self._update_rt_list(list(zip(xs, ys, labs)), flags, weights)
         lines = [f"[R0 vs Spacing] {fit_summary}"]
+        if flags.any():
+            lines.append("Flagged (leave-one-out): " + ", ".join(l for l, f in zip(labs, flags) if f)
+                         + ("" if meth == "OLS" else " — excluded from fits"))
         if R2_um is None:
             lines.append("R2 invalid, ρc unavailable.")
+        elif rejected:
+            lines.append(f"ρc unavailable: {meth} rejected all points.")
         else:
-            xarr = np.asarray(xs, float); yarr = np.asarray(ys, float)
-            m1 = self.rho_method1(xarr, yarr, R2_um)
+            with self.prof.stage("fit", points=len(xs)):
+                m1 = self.rho_method1(xarr, yarr, R2_um, weights)
+                m2 = self.rho_method2(xarr, yarr, R2_um, weights)
+                ex = rho_exact(xarr, yarr, R2_um, weights)
             if m1 is None: lines.append("Method-1: fail (check 0<d<R2 & points)")
             else:
                 Rs1, Lt1_um, rhoc1 = m1
                 lines.append(f"Method-1: Rs={Rs1:.6g} Ω/□, Lt={Lt1_um:.6g} μm, ρc={rhoc1:.6g} Ω·cm²")
-            m2 = self.rho_method2(xarr, yarr, R2_um)
             if m2 is None: lines.append("Method-2: fail (check 0<d<R2 & points)")
             else:
                 Rs2, Lt2_um, rhoc2, (m, c, r2c) = m2
                 lines.append(f"Method-2: Rs={Rs2:.6g} Ω/□, Lt={Lt2_um:.6g} μm, ρc={rhoc2:.6g} Ω·cm²; y={m:.3g}x+{c:.3g}, R²={r2c:.4f}")
+            if ex is None: lines.append("Exact (Bessel): fail (need ≥2 points with 0<d<R2)")
+            else:
+                Rs3, Lt3_um, rhoc3, r2e = ex
+                lines.append(f"Exact (Bessel): Rs={Rs3:.6g} Ω/□, Lt={Lt3_um:.6g} μm, ρc={rhoc3:.6g} Ω·cm², R²={r2e:.4f}")
+        lines += self._group_fit_lines(items)
         self.result_text.delete("1.0","end"); self.result_text.insert("end", "\n".join(lines) + "\n")
 
+    def _group_fit_lines(self, items, limit=12):
+        """規則分組開啟且選取跨多個 group 時，逐 group 的 exact fit 摘要。"""
+        if not self.use_group_rules.get(): return []
+        groups, _ = self._group_index()
+        rows = {d["row"] for d in items}
+        sub = {}
+        for key, g in groups.items():
+            sp = {s: [i for i in r if i in rows] for s, r in g["spacings"].items()}
+            sp = {s: r for s, r in sp.items() if r}
+            if sp: sub[key] = {"R2": g["R2"], "spacings": sp}
+        if len(sub) < 2: return []
+        with self.prof.stage("fit_groups", groups=len(sub)):
+            res = fit_ctlm_groups(self.curves, sub, safe_float(self.r0_window.get(), 0.5),
+                                  safe_float(self.r2_var.get()), self.fit_method.get() or "OLS")
+        keys = sorted(res, key=lambda k: group_name(k))
+        lines = [f"Per group ({len(keys)}, exact):"]
+        for key in keys[:limit]:
+            r = res[key]; ex = r["exact"]
+            fit = f"Rs={ex['Rs']:.4g} Ω/□, Lt={ex['Lt_um']:.4g} μm, ρc={ex['rhoc']:.4g} Ω·cm²" if ex else "fail"
+            lines.append(f"  {group_name(key)}: n={r['n']}, R2={r['R2'] if r['R2'] is not None else '—'} μm, {fit}"
+                         + (f", {r['flagged']} flagged" if r["flagged"] else ""))
+        if len(keys) > limit: lines.append(f"  … +{len(keys) - limit} more")
+        return lines
+
+    @profiled()
     def _draw_corr(self, panel, display):
         for w in panel['frame'].winfo_children(): w.destroy()
-        xs, ys, _, _ = self.build_rs_points([d for d in display if d.get("I") is not None])
+        xs, ys, labs, _, rows = self.build_rs_points([d for d in display if d.get("I") is not None], with_rows=True)
         if len(xs) < 2:
             self._set_blank(panel['frame'], "Need at least two R–Spacing points"); self.corr_text.set(""); return
-        R2_um = safe_float(self.r2_var.get())
+        R2_um = self._r2_for(display)
         if R2_um is None:
             self._set_blank(panel['frame'], "Please input R2"); self.corr_text.set(""); return
         d = np.asarray(xs, float); Rt = np.asarray(ys, float)
@@ -909,43 +3188,421 @@ class App(tk.Tk):
         ss_res = np.sum((Rt_corr - yfit)**2); ss_tot = np.sum((Rt_corr - Rt_corr.mean())**2)
         r2 = 1 - ss_res/ss_tot if ss_tot > 0 else np.nan
         figw = safe_float(panel['figw'].get(), 6); figh = safe_float(panel['figh'].get(), 4)
-        fig, ax = plt.subplots(figsize=(figw, figh), dpi=100)
+        fig, ax = new_subplots(figw, figh, 100)
         ax.scatter(d, Rt, label="Original Rt(d)", marker='s')
         ax.scatter(d, Rt_corr, label="Corrected Rt/C(d)", marker='o')
         xfit = np.linspace(np.min(d), np.max(d), 200)
         ax.plot(xfit, m*xfit + c, linestyle='--', color='black', label="Linear fit on corrected")
         self.style_axes(ax, panel); self._legend(ax, panel)
-        fig.tight_layout()
-        self._embed_figure_keep_ratio(panel, fig)
+        with self.prof.stage("tight_layout"): fig.tight_layout()
+        canvas = self._embed_figure_keep_ratio(panel, fig)
+        self._attach_hover(canvas, ax, [([x], [y], (r, lab)) for Y, tag in ((Rt, ""), (Rt_corr, " (corrected)"))
+                                        for x, y, r, lab in zip(d, Y, rows, (l + tag for l in labs))], ("d", "Rt"))
         Rs = m * 2*np.pi*R2_um
         Lt_um = c/(2*m) if m != 0 else np.nan
         rhoc = Rs * (Lt_um*UM_TO_CM)**2 if np.isfinite(Lt_um) else np.nan
         self.corr_text.set(f"Linearized: m={m:.6g}, c={c:.6g}, R²={r2:.4f} | Rs={Rs:.6g} Ω/□, Lt={Lt_um:.6g} μm, ρc={rhoc:.6g} Ω·cm²")
 
+    @profiled()
     def _draw_cv(self, panel, display):
         for w in panel['frame'].winfo_children(): w.destroy()
         items = [d for d in display if d.get("C") is not None]
         if not items:
             self._set_blank(panel['frame'], "No C–V curves"); return
         figw = safe_float(panel['figw'].get(), 6); figh = safe_float(panel['figh'].get(), 4)
-        fig, ax = plt.subplots(figsize=(figw, figh), dpi=100)
-        for d in items:
-            lw = 1.2 if d["line"] else 0; ms = 3 if d["marker"] else 0
-            ax.plot(d["V"], d["C"], label=d["label"], color=d["color"],
-                    linewidth=lw, marker='o' if d["marker"] else None, markersize=ms)
-        self.style_axes(ax, panel); self._legend(ax, panel)
-        fig.tight_layout()
+        fig, ax = new_subplots(figw, figh, 100)
+        leg = ()
+        if self._fast_overlay(items):
+            leg = plot_overlay_fast(ax, [(d["V"], d["C"], d["label"], d["color"], d["line"], d["marker"]) for d in items],
+                                    lw=1.2, ms=3)
+        else:
+            for d in items:
+                lw = 1.2 if d["line"] else 0; ms = 3 if d["marker"] else 0
+                ax.plot(d["V"], d["C"], label=d["label"], color=d["color"],
+                        linewidth=lw, marker='o' if d["marker"] else None, markersize=ms)
+        self.style_axes(ax, panel); self._legend(ax, panel, *leg)
+        with self.prof.stage("tight_layout"): fig.tight_layout()
+        canvas = self._embed_figure_keep_ratio(panel, fig)
+        self._attach_hover(canvas, ax, [(d["V"], d["C"], (d["row"], d["label"])) for d in items], ("V", "C"))
+
+    # ----- 游標讀值 / 點選 -----
+    def _attach_hover(self, canvas, ax, series, names):
+        """十字線 + 最近點讀值（blit，只重畫 axes 區域）；左鍵點曲線 → 選取 sweeps 表對應列。
+        series: [(X, Y, (row, label))]；names: (x 名稱, y 名稱)。"""
+        picker = CurvePicker(ax, series)
+        from matplotlib.lines import Line2D
+        # 用 add_artist 而非 axvline/plot：不會把 0 併進 dataLim 而改變自動縮放的範圍
+        kw = dict(color="gray", linewidth=0.8, linestyle=":", animated=True, visible=False)
+        vline = ax.add_artist(Line2D([0, 0], [0, 1], transform=ax.get_xaxis_transform(), **kw))
+        hline = ax.add_artist(Line2D([0, 1], [0, 0], transform=ax.get_yaxis_transform(), **kw))
+        dot = ax.add_artist(Line2D([], [], marker="o", linestyle="none", markersize=9, markerfacecolor="none",
+                                   markeredgecolor="red", markeredgewidth=1.5, animated=True, visible=False))
+        txt = ax.text(0.01, 0.99, "", transform=ax.transAxes, va="top", ha="left", fontsize=10, animated=True,
+                      visible=False, bbox=dict(boxstyle="round", fc="white", ec="gray", alpha=0.9))
+        arts = (vline, hline, dot, txt)
+        st = dict(bg=None)
+
+        def on_draw(_e):
+            st["bg"] = canvas.copy_from_bbox(ax.bbox)
+            for a in arts:
+                if a.get_visible(): ax.draw_artist(a)
+
+        def on_move(e):
+            if st["bg"] is None: return
+            hit = picker.query(e.x, e.y) if e.inaxes is ax else None
+            if hit is None and e.inaxes is not ax and not txt.get_visible(): return
+            canvas.restore_region(st["bg"])
+            if e.inaxes is ax:
+                if hit is not None:
+                    (_row, lab), x, y = hit
+                    dot.set_data([x], [y]); dot.set_visible(True)
+                    txt.set_text(f"{lab}\n{names[0]} = {x:.6g}\n{names[1]} = {y:.6g}")
+                else:
+                    x, y = e.xdata, e.ydata; dot.set_visible(False)
+                    txt.set_text(f"{names[0]} = {x:.4g}\n{names[1]} = {y:.4g}")
+                vline.set_xdata([x, x]); hline.set_ydata([y, y])
+                for a in arts[:2] + arts[3:]: a.set_visible(True)
+                for a in arts:
+                    if a.get_visible(): ax.draw_artist(a)
+            else:
+                for a in arts: a.set_visible(False)
+            canvas.blit(ax.bbox)
+
+        def on_click(e):
+            if e.button != 1 or e.inaxes is not ax: return
+            hit = picker.query(e.x, e.y)
+            if hit is None: return
+            (row, lab), x, y = hit
+            if row is None: return
+            self.select_sweep_row(row)
+            self.log(f"Picked #{row + 1} {lab}: {names[0]}={x:.6g}, {names[1]}={y:.6g}")
+
+        canvas.mpl_connect("draw_event", on_draw)
+        canvas.mpl_connect("motion_notify_event", on_move)
+        canvas.mpl_connect("button_press_event", on_click)
+        return picker
+
+    # ----- Wafer map -----
+    def _fit_die(self, xs, ys, R2_um, weights=None):
+        """單一 die：R0 vs spacing → Method-1 / Method-2，回傳各 metric（失敗為 nan）；Exact 由 build_wafer_map 整批填入。"""
+        nan = float("nan")
+        out = {m: dict(rhoc=nan, Rs=nan, Lt=nan, r2=nan) for m in WAFER_METHODS}
+        x = np.asarray(xs, float); y = np.asarray(ys, float)
+        w = np.ones_like(x) if weights is None else np.asarray(weights, float)
+        if np.count_nonzero(w) < 2: return out
+        out["Method-1"]["r2"] = _line_r2(x, y, weights)
+        if R2_um is None: return out
+        m1 = rho_method1(x, y, R2_um, weights)
+        if m1 is not None:
+            out["Method-1"].update(Rs=m1[0], Lt=m1[1], rhoc=m1[2])
+        m2 = rho_method2(x, y, R2_um, weights)
+        if m2 is not None:
+            out["Method-2"].update(Rs=m2[0], Lt=m2[1], rhoc=m2[2], r2=m2[3][2])
+        return out
+
+    def _group_dies(self, display):
+        """依分組規則把 I–V 項目分成 (die, structure) 組，與 --aggregate / 匯出的 dies 表相同；
+        wafer 分頁選了 structure 時只留該 structure。對不到 die 的組 die 為 None。"""
+        _, fields = self._group_index()
+        st = self.wafer_structure.get()
+        dies = {}
+        for d in display:
+            f = fields.get(d["row"])
+            if f is None: continue
+            if st and st != "(all)" and f["structure"] != st: continue
+            dies.setdefault((f["die"], f["structure"]), []).append(d)
+        return dies
+
+    @profiled()
+    def build_wafer_map(self):
+        panel = self.preview_wafer
+        self._wafer = None
+        if not self.curves:
+            self._set_blank(panel['frame'], "請載入資料"); return
+        _, display = self.current_selection()
+        try:
+            groups = self._group_dies(display)
+        except Exception as e:
+            messagebox.showerror("Die mapping", str(e)); return
+        groups = {k: items for k, items in groups.items() if isinstance(k[0], tuple)}  # 只有 (x, y) 能上 wafer map
+        if not groups:
+            self._set_blank(panel['frame'], "No die coordinates matched"); return
+        # 每格只能放一個值：不同 structure 不能混成同一組 CTLM 擬合
+        sts = sorted({st or "" for _, st in groups})
+        if len(sts) > 1:
+            self._set_blank(panel['frame'], f"{len(sts)} structures ({', '.join(sts[:4])}{', …' if len(sts) > 4 else ''}): "
+                                            "pick one in Structure"); return
+        dies = {xy: items for (xy, _), items in groups.items()}
+        pts = {xy: self.build_rs_points(items)[:2] for xy, items in dies.items()}
+        D, Y = pad_sets(pts.values())
+        R2s = [self._r2_for(items) for items in dies.values()]
+        R2 = np.array([np.nan if r is None else r for r in R2s], float)
+        fit_meth = self.fit_method.get() or "OLS"
+        with self.prof.stage("outliers", dies=len(pts)):
+            W, flags = ctlm_outliers(D, Y, R2, fit_meth)
+        fits = {xy: self._fit_die(xs, ys, R2s[k], None if W is None else W[k, :len(xs)])
+                for k, (xy, (xs, ys)) in enumerate(pts.items())}
+        if np.isfinite(R2).any():
+            with self.prof.stage("fit_exact", dies=len(pts)):
+                ex = rho_exact_batch(D, Y, R2, W)
+            for k, xy in enumerate(pts):
+                fits[xy]["Exact"].update(Rs=ex["Rs"][k], Lt=ex["Lt_um"][k], rhoc=ex["rhoc"][k], r2=ex["r2"][k])
+
+        # 每個 (method, metric) 一張 2D 陣列；切換 metric 只換 image 的資料
+        dx = np.array([x for x, _ in dies]); dy = np.array([y for _, y in dies])
+        x0, y0 = int(dx.min()), int(dy.min())
+        nx, ny = int(dx.max()) - x0 + 1, int(dy.max()) - y0 + 1
+        grids = {}
+        for meth in WAFER_METHODS:
+            for _lab, mk in WAFER_METRICS:
+                g = np.full((ny, nx), np.nan)
+                g[dy - y0, dx - x0] = [fits[xy][meth][mk] for xy in dies]
+                grids[(meth, mk)] = g
+
+        from matplotlib.patches import Rectangle
+        for w in panel['frame'].winfo_children(): w.destroy()
+        figw = safe_float(panel['figw'].get(), 6); figh = safe_float(panel['figh'].get(), 4)
+        fig, ax = new_subplots(figw, figh, 100)
+        im = ax.imshow(np.full((ny, nx), np.nan), origin="lower", interpolation="nearest", cmap="viridis",
+                       extent=(x0 - 0.5, x0 + nx - 0.5, y0 - 0.5, y0 + ny - 0.5), aspect="equal")
+        cbar = fig.colorbar(im, ax=ax)
+        hl = Rectangle((x0 - 0.5, y0 - 0.5), 1, 1, fill=False, edgecolor="red", linewidth=2, visible=False)
+        ax.add_patch(hl)
+        ann = ax.annotate("", xy=(x0, y0), xytext=(12, 12), textcoords="offset points", visible=False,
+                          bbox=dict(boxstyle="round", fc="white", ec="black", alpha=0.9))
+        self.style_axes(ax, panel)
+        with self.prof.stage("tight_layout"): fig.tight_layout()
+        canvas = self._embed_figure_keep_ratio(panel, fig)
+        self._wafer = dict(ax=ax, im=im, cbar=cbar, hl=hl, ann=ann, canvas=canvas, grids=grids,
+                           dies=dies, fits=fits, x0=x0, y0=y0, hover=None, after=None)
+        canvas.mpl_connect("motion_notify_event", self._on_wafer_hover)
+        canvas.mpl_connect("button_press_event", self._on_wafer_click)
+        self._update_wafer_metric()
+        self.log(f"Wafer map: {len(dies)} dies ({nx}×{ny} grid), fit {fit_meth}, "
+                 f"{int(flags.sum())} points flagged in {int(flags.any(1).sum())} dies")
+
+    def _wafer_sel(self):
+        lab = self.wafer_metric.get()
+        mk = dict(WAFER_METRICS).get(lab, "rhoc")
+        return self.wafer_method.get() or "Method-1", mk, lab
+
+    def _update_wafer_metric(self):
+        w = self._wafer
+        if w is None: return
+        meth, mk, lab = self._wafer_sel()
+        arr = w["grids"][(meth, mk)]
+        w["im"].set_data(arr)
+        finite = arr[np.isfinite(arr)]
+        if finite.size:
+            lo, hi = float(finite.min()), float(finite.max())
+            if lo == hi: lo, hi = lo - 0.5*abs(lo or 1), hi + 0.5*abs(hi or 1)
+            w["im"].set_clim(lo, hi)
+        w["cbar"].set_label(f"{lab} [{meth}]")
+        self.wafer_info.set(f"{len(w['dies'])} dies, {finite.size} with valid {lab}")
+        w["canvas"].draw_idle()
+
+    def _wafer_die_at(self, event):
+        w = self._wafer
+        if w is None or event.inaxes is not w["ax"] or event.xdata is None: return None
+        xy = (int(round(event.xdata)), int(round(event.ydata)))
+        return xy if xy in w["dies"] else None
+
+    def _on_wafer_hover(self, event):
+        w = self._wafer
+        if w is None: return
+        xy = self._wafer_die_at(event)
+        if xy == w["hover"]: return
+        w["hover"] = xy
+        if w["after"] is not None:
+            self.after_cancel(w["after"]); w["after"] = None
+        if xy is None:
+            w["hl"].set_visible(False); w["ann"].set_visible(False)
+        else:
+            meth, mk, lab = self._wafer_sel()
+            val = w["grids"][(meth, mk)][xy[1] - w["y0"], xy[0] - w["x0"]]
+            w["hl"].set_xy((xy[0] - 0.5, xy[1] - 0.5)); w["hl"].set_visible(True)
+            w["ann"].xy = xy
+            w["ann"].set_text(f"die ({xy[0]}, {xy[1]})\n{lab} = {val:.4g}" if np.isfinite(val) else f"die ({xy[0]}, {xy[1]})\n{lab} = —")
+            w["ann"].set_visible(True)
+            # die 的 R–Spacing 圖要重建 figure，等滑鼠停下來再畫
+            w["after"] = self.after(150, lambda: self._show_die(xy))
+        w["canvas"].draw_idle()
+
+    def _on_wafer_click(self, event):
+        w = self._wafer; xy = self._wafer_die_at(event)
+        if w is None or xy is None: return
+        if w["after"] is not None:
+            self.after_cancel(w["after"]); w["after"] = None
+        self._show_die(xy)
+
+    def _show_die(self, xy):
+        w = self._wafer
+        if w is None or xy not in w["dies"]: return
+        w["after"] = None
+        self.preview_wdie['title'].set(f"Die ({xy[0]}, {xy[1]}) R0 vs Spacing")
+        self._draw_rs(self.preview_wdie, w["dies"][xy], report=False)
+        f = w["fits"][xy]
+        self.wafer_info.set("  |  ".join(
+            f"{m}: Rs={f[m]['Rs']:.4g} Ω/□, Lt={f[m]['Lt']:.4g} μm, ρc={f[m]['rhoc']:.4g} Ω·cm², R²={f[m]['r2']:.4f}"
+            for m in WAFER_METHODS))
+
+    # ----- 多條件 / Arrhenius -----
+    def _curve_ident(self, c):
+        """跨重新載入仍相同的曲線識別：(來源檔 path, mtime, size) + label + 點數；沒有來源檔時用物件 id。"""
+        try:
+            src = _file_key(c["src"]) if c.get("src") else id(c)
+        except OSError:
+            src = id(c)
+        return (src, c["label"], len(c["V"]))
+
+    @profiled()
+    def analyze_conditions(self):
+        """依條件規則把所有 I–V 曲線分組；快取沒有的條件一起做 R0 → 批次擬合（fit_conditions），其餘沿用快取。
+        die / structure / spacing / R2 一律取自分組規則（不論是否勾選 Spacing / R2 from rules）。"""
+        import re
+        if not self.curves:
+            messagebox.showinfo("Info", "Load CSV files first."); return
+        try:
+            rule = compile_group_rules({"condition": self.cond_rule.get()}, ("condition",))
+        except re.error as e:
+            messagebox.showerror("Condition rule", str(e)); return
+        _, display = self.current_selection(all_rows=True)
+        fields = self._group_index()[1]
+        window = safe_float(self.r0_window.get(), 0.5); meth = self.fit_method.get() or "OLS"
+        R2d = safe_float(self.r2_var.get())
+        by_cond, unmatched, no_sp = {}, 0, 0
+        for d in display:
+            if d.get("I") is None: continue
+            c = self.curves[d["row"]]
+            cond = extract_group_fields(c, rule)["condition"]
+            if cond is None: unmatched += 1; continue
+            # spacing 一律用分組規則：各條件的檔案混在一起，Global# / 標籤第一個數字對不到正確 spacing
+            f = fields.get(d["row"]) or dict.fromkeys(GROUP_FIELDS)
+            if f["spacing"] is None or not f["spacing"] > 0: no_sp += 1; continue
+            by_cond.setdefault(cond, []).append((d, f["die"], f["structure"], f["spacing"], f["R2"]))
+        if not by_cond:
+            self._cond = None
+            self._set_blank(self.preview_cond['frame'], "No condition matched the rule" if not no_sp else
+                            "No curve has both a condition and a spacing from the grouping rules"); return
+        fits, stale = {}, {}
+        for cond, items in by_cond.items():
+            key = (cond, window, meth, R2d, tuple((self._curve_ident(self.curves[d["row"]]), die, st, sp, R2)
+                                                  for d, die, st, sp, R2 in items))
+            hit = self._cond_cache.get(key)
+            if hit is None: stale[cond] = (key, items)
+            else: fits[cond] = hit
+        if stale:
+            with self.prof.stage("condition_fits", conditions=len(stale)):
+                recs = [(cond, die, st, sp, compute_r0_at_zero(d["V"], d["I"], window=window), R2)
+                        for cond, (_, items) in stale.items() for d, die, st, sp, R2 in items]
+                new = fit_conditions(recs, R2d, meth)
+            for cond, (key, _) in stale.items():
+                fits[cond] = new.get(cond, {}); self._cond_cache.put(key, fits[cond])
+        self._cond = dict(fits={k: fits[k] for k in sorted(fits)}, curves={k: len(v) for k, v in by_cond.items()})
+        self.log(f"Conditions: {len(fits)} ({len(stale)} fitted, {len(fits) - len(stale)} from cache), "
+                 f"{sum(self._cond['curves'].values())} I–V curves, {unmatched} without a condition, "
+                 f"{no_sp} without a spacing")
+        self._show_conditions()
+
+    def _condition_results(self):
+        """目前方法下：[(cond, T_K, 中位數 summary)]、中位數 Arrhenius、逐 die Arrhenius {key: fit}。"""
+        meth, unit = self.cond_method.get() or "Exact", self.cond_unit.get()
+        rows = [(cond, condition_kelvin(cond, unit), condition_summary(f, meth)) for cond, f in self._cond["fits"].items()]
+        arr = fit_arrhenius([T for _, T, _ in rows], [s["rhoc"] for _, _, s in rows])
+        per_die = {}
+        for cond, T, _ in rows:
+            for key, f in self._cond["fits"][cond].items():
+                v = f[METHOD_KEYS[meth]]
+                per_die.setdefault(key, ([], []))
+                if v is not None: per_die[key][0].append(T); per_die[key][1].append(v["rhoc"])
+        per_die = {k: fit_arrhenius(*v) for k, v in per_die.items()}
+        return rows, arr, {k: v for k, v in per_die.items() if v is not None}
+
+    def _show_conditions(self):
+        if self._cond is None: return
+        meth, unit = self.cond_method.get() or "Exact", self.cond_unit.get()
+        rows, arr, per_die = self._condition_results()
+        panel = self.preview_cond
+        for w in panel['frame'].winfo_children(): w.destroy()
+        figw = safe_float(panel['figw'].get(), 6); figh = safe_float(panel['figh'].get(), 4)
+        fig = new_figure((figw, figh)); fig.set_dpi(100)
+        ax1, ax2 = fig.subplots(1, 2)
+        # 左：各條件的 die 分佈 + 中位數；右：Arrhenius（中位數與擬合線）
+        for k, (cond, _, s) in enumerate(rows):
+            v = [f[METHOD_KEYS[meth]]["rhoc"] for f in self._cond["fits"][cond].values() if f[METHOD_KEYS[meth]] is not None]
+            ax1.plot(np.full(len(v), cond), v, "o", color="0.6", markersize=3)
+        ax1.plot([c for c, _, _ in rows], [s["rhoc"] for _, _, s in rows], "o-", color="C0", label=f"median ({meth})")
+        ax1.set_yscale("log"); ax1.set_xlabel(f"Condition ({unit})" if unit != "other" else "Condition"); ax1.set_ylabel("ρc (Ω·cm²)")
+        ax1.legend(fontsize=9)
+        if arr is not None:
+            T = np.array([T for _, T, _ in rows]); rc = np.array([s["rhoc"] for _, _, s in rows])
+            ax2.plot(1000 / T, rc, "o", color="C0", label="median")
+            xf = np.linspace((1 / T).min(), (1 / T).max(), 50)
+            ax2.plot(1000 * xf, np.exp(arr["intercept"] + arr["slope"] * xf), "-", color="C3",
+                     label=f"φB = {arr['phiB_eV']:.4g} eV, R² = {arr['r2']:.4f}")
+            self.style_axes(ax2, panel); ax2.legend(fontsize=9)
+        else:
+            ax2.text(0.5, 0.5, "Arrhenius needs ≥ 2 temperatures\n(unit °C or K)", ha="center", va="center", transform=ax2.transAxes)
+            ax2.set_axis_off()
+        with self.prof.stage("tight_layout"): fig.tight_layout()
         self._embed_figure_keep_ratio(panel, fig)
 
+        t = self.cond_text; t.delete("1.0", "end")
+        t.insert("end", f"{'Condition':>12}{'T (K)':>10}{'curves':>8}{'dies':>6}{'Rs (Ω/□)':>14}{'Lt (μm)':>12}{'ρc (Ω·cm²)':>14}   [{meth}, median over dies]\n")
+        for cond, T, s in rows:
+            t.insert("end", f"{cond:>12.6g}{T:>10.2f}{self._cond['curves'][cond]:>8}{s['n']:>6}"
+                            f"{s['Rs']:>14.5g}{s['Lt_um']:>12.5g}{s['rhoc']:>14.5g}\n")
+        if arr is not None:
+            t.insert("end", f"\nArrhenius (median ρc): φB = {arr['phiB_eV']:.5g} eV, ρ0 = {arr['rho0']:.4g} Ω·cm², "
+                            f"R² = {arr['r2']:.5f}, {arr['n']} temperatures\n")
+        elif unit == "other":
+            t.insert("end", "\nUnit is 'other': no Arrhenius fit.\n")
+        if per_die:
+            phi = np.array([f["phiB_eV"] for f in per_die.values()])
+            t.insert("end", f"Per die: φB median {np.median(phi):.5g} eV (min {phi.min():.5g}, max {phi.max():.5g}, {phi.size} dies)\n")
+            for key in sorted(per_die, key=str):
+                f = per_die[key]
+                t.insert("end", f"  {group_name(key)}: φB = {f['phiB_eV']:.5g} eV, R² = {f['r2']:.4f} ({f['n']} temperatures)\n")
+
+    def save_condition_tables(self):
+        """conditions.csv（每個條件 × die × 方法）與 arrhenius.csv（中位數與逐 die 的 φB）寫到輸出資料夾。"""
+        import csv
+        if self._cond is None:
+            messagebox.showinfo("Info", "Press “Analyze” first."); return
+        outdir = self._out_dir(); outdir.mkdir(parents=True, exist_ok=True)
+        unit = self.cond_unit.get()
+        with open(outdir / "conditions.csv", "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["condition", "T_K", "die", "structure", "n", "R2_um", "flagged"]
+                       + [f"{m}_{k}" for m in WAFER_METHODS for k in AGG_METRICS])
+            for cond, fits in self._cond["fits"].items():
+                for (die, st), r in fits.items():
+                    row = [cond, condition_kelvin(cond, unit), group_name((die, None)), st or "", r["n"], r["R2"], r["flagged"]]
+                    for m in WAFER_METHODS:
+                        v = r[METHOD_KEYS[m]] or {}
+                        row += [v.get(k, np.nan) for k in AGG_METRICS]
+                    w.writerow(["" if v is None else (f"{v:.6g}" if isinstance(v, float) else v) for v in row])
+        meth = self.cond_method.get() or "Exact"
+        _, arr, per_die = self._condition_results()
+        with open(outdir / "arrhenius.csv", "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["scope", "method", "phiB_eV", "rho0_ohm_cm2", "r2", "n_temperatures"])
+            for name, a in ([("median", arr)] if arr else []) + [(group_name(k), a) for k, a in sorted(per_die.items(), key=lambda kv: str(kv[0]))]:
+                w.writerow([name, meth] + [f"{a[k]:.6g}" for k in ("phiB_eV", "rho0", "r2")] + [a["n"]])
+        self.log(f"Condition tables → {outdir / 'conditions.csv'}, {outdir / 'arrhenius.csv'}")
+
     # ----- Rt 清單 -----
-    def _update_rt_list(self, items: List[Tuple[float, float, str]]):
+    def _update_rt_list(self, items: List[Tuple[float, float, str]], flags=None, weights=None):
         self.rt_text.delete("1.0", "end")
         if not items:
             self.rt_text.insert("end", "No data\n"); return
-        self.rt_text.insert("end", f"{'Label/Spacing':<24}\tSpacing (μm)\tR0 (Ω)\n")
+        self.rt_text.tag_configure("flag", foreground="red")
+        self.rt_text.insert("end", f"{'Label/Spacing':<24}\tSpacing (μm)\tR0 (Ω)" + ("\tWeight" if weights is not None else "") + "\n")
         self.rt_text.insert("end", "-"*60 + "\n")
-        for spacing, R0, lab in items:
-            self.rt_text.insert("end", f"{lab:<24}\t{spacing:.6g}\t{R0:.6g}\n")
+        for k, (spacing, R0, lab) in enumerate(items):
+            line = f"{lab:<24}\t{spacing:.6g}\t{R0:.6g}" + (f"\t{weights[k]:.3f}" if weights is not None else "")
+            flagged = flags is not None and flags[k]
+            self.rt_text.insert("end", line + ("\t⚠ outlier (LOO)" if flagged else "") + "\n", "flag" if flagged else ())
 
     # ----- 批次與其他 -----
     def select_all(self):
@@ -958,20 +3615,16 @@ class App(tk.Tk):
             use.set(False)
         self.update_all_previews()
 
-    def _save_correlation_plot(self, d: np.ndarray, Rt: np.ndarray, R2_um: float, outfile: Path, panel_ref):
-        if len(d) < 2 or np.any(d <= 0) or np.any(d >= R2_um):
+    def _save_correlation_plot(self, d: np.ndarray, Rt: np.ndarray, R2_um: float, outfile: Path, panel_ref, weights=None):
+        res = rho_method2(d, Rt, R2_um, weights)
+        if res is None:
             return None
+        Rs, Lt_um, rhoc, (m, c, r2) = res
         C = (R2_um/d)*np.log(R2_um/(R2_um - d)); Rt_corr = Rt / C
-        X = np.column_stack([d, np.ones_like(d)]); beta, *_ = np.linalg.lstsq(X, Rt_corr, rcond=None)
-        m, c = float(beta[0]), float(beta[1]); yfit = m*d + c
-        ss_res = np.sum((Rt_corr - yfit)**2); ss_tot = np.sum((Rt_corr - Rt_corr.mean())**2)
-        r2 = 1 - ss_res/ss_tot if ss_tot > 0 else np.nan
-        Rs = m * 2*np.pi*R2_um; Lt_um = c/(2*m) if m != 0 else np.nan
-        if not np.isfinite(Lt_um): return None
-        rhoc = Rs * (Lt_um*UM_TO_CM)**2
+        from matplotlib.ticker import AutoMinorLocator
         dpi = int(panel_ref['dpi'].get() or 300)
         figw = safe_float(panel_ref['figw'].get(), 6); figh = safe_float(panel_ref['figh'].get(), 4)
-        fig, ax = plt.subplots(figsize=(figw, figh), dpi=dpi)
+        fig, ax = new_subplots(figw, figh, dpi)
         ax.scatter(d, Rt, label="Original Rt(d)", marker='s')
         ax.scatter(d, Rt_corr, label="Corrected Rt/C(d)", marker='o')
         xfit = np.linspace(np.min(d), np.max(d), 200)
@@ -984,14 +3637,22 @@ class App(tk.Tk):
         for s in ['top','right','bottom','left']:
             ax.spines[s].set_color('black'); ax.spines[s].set_linewidth(2)
         ax.grid(which='major', linestyle='-', linewidth=0.5, color='darkgray'); ax.legend()
-        fig.tight_layout(); fig.savefig(outfile, dpi=dpi); plt.close(fig)
+        fig.tight_layout(); fig.savefig(outfile, dpi=dpi)
         return Rs, Lt_um, rhoc, (m, c, r2)
 
     def _save_panel_fig(self, panel, display, outfile: Path, kind: str):
         dpi = int(panel['dpi'].get() or 300)
         figw = safe_float(panel['figw'].get(), 6); figh = safe_float(panel['figh'].get(), 4)
-        fig, ax = plt.subplots(figsize=(figw, figh), dpi=dpi)
-        if kind == "iv":
+        fig, ax = new_subplots(figw, figh, dpi)
+        leg = ()
+        ycol = "C" if kind == "cv" else "I"
+        items = [d for d in display if d.get(ycol) is not None]
+        if self._fast_overlay(items):
+            lw, ms = (1.5, 4) if kind == "iv" else (1.2, 3)
+            leg = plot_overlay_fast(ax, [((*self.compute_rv(d["V"], d["I"]),) if kind == "rv" else (d["V"], d[ycol]))
+                                         + (d["label"], d["color"], d["line"], d["marker"]) for d in items],
+                                    lw=lw, ms=ms, marker_edge=(kind == "iv"))
+        elif kind == "iv":
             for d in display:
                 if d.get("I") is None: continue
                 lw = 1.5 if d["line"] else 0; ms = 4 if d["marker"] else 0
@@ -1010,8 +3671,8 @@ class App(tk.Tk):
                 lw = 1.2 if d["line"] else 0; ms = 3 if d["marker"] else 0
                 ax.plot(d["V"], d["C"], label=d["label"], color=d["color"],
                         linewidth=lw, marker='o' if d["marker"] else None, markersize=ms)
-        self.style_axes(ax, panel); self._legend(ax, panel)
-        fig.tight_layout(); fig.savefig(outfile, dpi=dpi); plt.close(fig)
+        self.style_axes(ax, panel); self._legend(ax, panel, *leg)
+        fig.tight_layout(); fig.savefig(outfile, dpi=dpi)
 
     
     def export_all(self):
@@ -1020,35 +3681,175 @@ class App(tk.Tk):
         include, display = self.current_selection()
         if not include:
             messagebox.showwarning("提醒", "請至少勾選一個 sweep。"); return
-        outdir = self.outdir or (self.csv_path.parent if self.csv_path else Path.cwd()) / "trinity_capres_out"
-        outdir.mkdir(parents=True, exist_ok=True)
-        self._save_panel_fig(self.preview_iv, display, outdir / "IV_overlay_selected.png", "iv")
-        self._save_panel_fig(self.preview_rv, display, outdir / "RV_overlay_selected.png", "rv")
-        self._save_panel_fig(self.preview_cv, display, outdir / "CV_overlay_selected.png", "cv")
-        xs, ys, _, _ = self.build_rs_points([d for d in display if d.get("I") is not None])
-        R2_um = safe_float(self.r2_var.get())
-        summary = []
-        if xs and ys and R2_um is not None:
-            xarr = np.asarray(xs, float); yarr = np.asarray(ys, float)
-            m1 = self.rho_method1(xarr, yarr, R2_um)
-            if m1:
-                Rs, Lt_um, rhoc = m1
-                summary.append(f"Method1: Rs={Rs:.9g} Ω/□, Lt={Lt_um:.9g} μm, rho_c={rhoc:.9g} Ω·cm²")
-            else:
-                summary.append("Method1: fail (check 0<d<R2 & points)")
-            res2 = self._save_correlation_plot(np.asarray(xs, float), np.asarray(ys, float), R2_um, outdir / "R_spacing_correlation.png", self.preview_corr)
-            if res2:
-                Rs2, Lt2, rhoc2, (m, c, r2) = res2
-                summary.append(f"Method2: Rs={Rs2:.9g} Ω/□, Lt={Lt2:.9g} μm, rho_c={rhoc2:.9g} Ω·cm²; y={m:.6g}x+{c:.6g}, R^2={r2:.6g}")
+        with self.prof.stage("export_all", curves=len(include)):
+            outdir = self.outdir or (self.csv_path.parent if self.csv_path else Path.cwd()) / "trinity_capres_out"
+            outdir.mkdir(parents=True, exist_ok=True)
+            self._save_panel_fig(self.preview_iv, display, outdir / "IV_overlay_selected.png", "iv")
+            self._save_panel_fig(self.preview_rv, display, outdir / "RV_overlay_selected.png", "rv")
+            self._save_panel_fig(self.preview_cv, display, outdir / "CV_overlay_selected.png", "cv")
+            iv = [d for d in display if d.get("I") is not None]
+            xs, ys, _, _ = self.build_rs_points(iv)
+            R2_um = self._r2_for(iv)
+            summary = []
+            if xs and ys and R2_um is not None:
+                xarr = np.asarray(xs, float); yarr = np.asarray(ys, float)
+                meth = self.fit_method.get() or "OLS"
+                weights, flags = ctlm_outliers(xarr, yarr, R2_um, meth)
+                weights = None if weights is None else weights[0]
+                summary.append(f"Fit: {meth}; flagged (leave-one-out): {int(flags.sum())} point(s)")
+                m1 = self.rho_method1(xarr, yarr, R2_um, weights)
+                if m1:
+                    Rs, Lt_um, rhoc = m1
+                    summary.append(f"Method1: Rs={Rs:.9g} Ω/□, Lt={Lt_um:.9g} μm, rho_c={rhoc:.9g} Ω·cm²")
+                else:
+                    summary.append("Method1: fail (check 0<d<R2 & points)")
+                res2 = self._save_correlation_plot(np.asarray(xs, float), np.asarray(ys, float), R2_um, outdir / "R_spacing_correlation.png", self.preview_corr, weights)
+                if res2:
+                    Rs2, Lt2, rhoc2, (m, c, r2) = res2
+                    summary.append(f"Method2: Rs={Rs2:.9g} Ω/□, Lt={Lt2:.9g} μm, rho_c={rhoc2:.9g} Ω·cm²; y={m:.6g}x+{c:.6g}, R^2={r2:.6g}")
+                else:
+                    summary.append("Method2: fail (check 0<d<R2 & points)")
+                ex = rho_exact(xarr, yarr, R2_um, weights)
+                if ex:
+                    summary.append(f"Exact: Rs={ex[0]:.9g} Ω/□, Lt={ex[1]:.9g} μm, rho_c={ex[2]:.9g} Ω·cm², R^2={ex[3]:.6g}")
+                else:
+                    summary.append("Exact: fail (need >=2 points with 0<d<R2)")
             else:
-                summary.append("Method2: fail (check 0<d<R2 & points)")
-        else:
-            summary.append("Missing R0 or R2.")
-        (outdir / "rho_summary.txt").write_text("\n".join(summary), encoding="utf-8")
+                summary.append("Missing R0 or R2.")
+            (outdir / "rho_summary.txt").write_text("\n".join(summary), encoding="utf-8")
+        self._profile_flush()
         messagebox.showinfo("完成", f"輸出完成：\n{outdir}\n\n" + "\n".join(summary))
 
-if __name__ == "__main__":
+    def export_pdf_report(self):
+        """整批（所有已載入的 sweep，不限勾選）輸出成一份多頁 PDF。"""
+        if not self.curves:
+            messagebox.showwarning("提醒", "尚未載入資料。"); return
+        outdir = self.outdir or (self.csv_path.parent if self.csv_path else Path.cwd()) / "trinity_capres_out"
+        outdir.mkdir(parents=True, exist_ok=True)
+        p = filedialog.asksaveasfilename(title="儲存 PDF 報告", initialdir=str(outdir), initialfile="lot_report.pdf",
+                                         defaultextension=".pdf", filetypes=[("PDF","*.pdf")])
+        if not p: return
+        _, display = self.current_selection(all_rows=True)
+        try:
+            groups = self._group_dies(display)
+        except Exception as e:
+            messagebox.showerror("Die mapping", str(e)); return
+        # 每個 (die, structure) 一頁；對不到 die 的依 structure 各一頁
+        unmapped = {k: groups.pop(k) for k in [k for k in groups if k[0] is None]}
+        dies = [(group_name(k), groups[k]) for k in sorted(groups, key=lambda k: (isinstance(k[0], str), k[0], k[1] or ""))]
+        dies += [(" ".join(filter(None, ("unmapped" if dies else "all", st))), items)
+                 for (_, st), items in sorted(unmapped.items(), key=lambda kv: kv[0][1] or "")]
+        dies = [(name, [dict(d, spacing=self._spacing_of(d)) for d in items], self._r2_for(items)) for name, items in dies]
+        cv = {}
+        for d in display:
+            if d.get("C") is None: continue
+            c = self.curves[d["row"]]
+            cv.setdefault(c.get("freq") or c["label"], []).append(
+                (Path(c["src"]).stem if c.get("src") else d["label"], d["color"], d["V"], d["C"]))
+        cv_groups = [(_fmt_freq(k) if isinstance(k, float) else str(k), v)
+                     for k, v in sorted(cv.items(), key=lambda kv: (isinstance(kv[0], str), kv[0]))]
+        opts = {"iv": panel_values(self.preview_iv), "rv": panel_values(self.preview_rv),
+                "rs": panel_values(self.preview_rs), "cv": panel_values(self.preview_cv)}
+        def progress(n):
+            if n % 20 == 0:
+                self.log(f"PDF report: {n} pages written"); self.update_idletasks()
+        try:
+            n = write_pdf_report(p, dies, cv_groups, opts, window=safe_float(self.r0_window.get(), 0.5),
+                                 R2_um=safe_float(self.r2_var.get()),
+                                 title=self.csv_path.parent.name if self.csv_path else APP_TITLE, progress=progress)
+        except Exception as e:
+            messagebox.showerror("PDF 輸出失敗", str(e)); return
+        self.log(f"PDF report: {n} pages → {p}")
+        messagebox.showinfo("完成", f"輸出完成：\n{p}\n\n{n} pages")
+
+    def export_columnar(self):
+        """所有已載入的曲線（不限勾選，label 用表格上的）與逐 die 擬合結果 → 輸出資料夾下的 columnar/。"""
+        if not self.curves:
+            messagebox.showwarning("提醒", "尚未載入資料。"); return
+        out = self._out_dir() / "columnar"
+        labels = [r[3].get() for r in self.rows]
+        def log(msg):
+            self.log(msg); self.update_idletasks()
+        try:
+            with self.prof.stage("export_columnar", curves=len(self.curves)):
+                res = export_columnar((dict(c, label=l) for c, l in zip(self.curves, labels)), out,
+                                      rules=self._rules(), window=safe_float(self.r0_window.get(), 0.5),
+                                      R2_um=safe_float(self.r2_var.get()), method=self.fit_method.get() or "OLS", log=log)
+        except Exception as e:
+            messagebox.showerror("資料匯出失敗", str(e)); return
+        self._profile_flush()
+        lines = [f"{p.name}: {n:,} rows" for p, n in res.values()]
+        self.log("Columnar export → " + ", ".join(lines))
+        messagebox.showinfo("完成", f"輸出完成：\n{out}\n\n" + "\n".join(lines))
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description=APP_TITLE)
+    ap.add_argument("--serve", action="store_true", help="run the local JSON analysis server instead of the GUI")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix-socket", default=None, help="listen on a Unix socket instead of TCP")
+    ap.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count - 1)")
+    ag = ap.add_argument_group("lot aggregation (out-of-core, resumable)")
+    ag.add_argument("--aggregate", metavar="ROOT", default=None, help="stream every CSV under ROOT (one lot per sub-folder) and write lot statistics")
+    ag.add_argument("--out", default=None, help="output folder (default: ROOT/trinity_aggregate)")
+    ag.add_argument("--pattern", default="*.csv")
+    ag.add_argument("--rule", action="append", default=[], metavar="FIELD=RULE",
+                    help=f"grouping rule, FIELD in {', '.join(GROUP_FIELDS)} (repeatable)")
+    ag.add_argument("--R2", type=float, default=None, help="outer radius R2 (μm) when no R2 rule matches")
+    ag.add_argument("--window", type=float, default=0.5, help="|V| window for R0 (V)")
+    ag.add_argument("--fit", choices=ROBUST_METHODS, default="OLS")
+    ag.add_argument("--spec-method", choices=WAFER_METHODS, default="Exact")
+    ag.add_argument("--spec-min", type=float, default=None, help="ρc lower spec (Ω·cm²)")
+    ag.add_argument("--spec-max", type=float, default=None, help="ρc upper spec (Ω·cm²)")
+    ag.add_argument("--percentiles", default=",".join(map(str, AGG_PERCENTILES)))
+    ag.add_argument("--chunk", type=int, default=32, help="files per worker task")
+    ag.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and start over")
+    xg = ap.add_argument_group("columnar export (uses --out, --pattern, --rule, --R2, --window, --fit)")
+    xg.add_argument("--export", metavar="PATH", default=None,
+                    help="write points / curves / dies tables for one CSV or every CSV under a folder")
+    xg.add_argument("--format", choices=EXPORT_FORMATS, default="auto", help="auto = Parquet if pyarrow is installed, else npz")
+    args = ap.parse_args(argv)
+    if args.serve:
+        run_server(args.host, args.port, args.unix_socket, args.workers); return
+    rules = {}
+    for r in args.rule:
+        f, sep, rule = r.partition("=")
+        if not sep or f not in GROUP_FIELDS: ap.error(f"--rule expects FIELD=RULE with FIELD in {GROUP_FIELDS}: {r!r}")
+        rules[f] = rule
+    if args.export:
+        src = Path(args.export)
+        out = Path(args.out) if args.out else (src if src.is_dir() else src.parent) / "trinity_columnar"
+        files = [(src.parent.name, src)] if src.is_file() else \
+                ((lot, src / rel) for lot, rel in _iter_lot_files(src, args.pattern, out))
+        curves = (dict(c, lot=lot) for lot, p in files for c in read_curves_from_file(p))
+        try:
+            res = export_columnar(curves, out, args.format, rules, args.window, args.R2, args.fit,
+                                  log=lambda msg: print(msg, flush=True))
+        except ValueError as e:
+            ap.exit(2, f"error: {e}\n")
+        for p, n in res.values(): print(f"{n:>14,}  {p}")
+        return
+    if args.aggregate:
+        pcts = tuple(float(q) for q in args.percentiles.split(",") if q.strip())
+        try:
+            lots = aggregate_lots(args.aggregate, args.out, args.pattern, rules, args.window, args.R2, args.fit,
+                                  args.spec_method, args.spec_min, args.spec_max, pcts, args.workers, args.chunk, args.restart)
+        except KeyboardInterrupt:
+            print("Interrupted — rerun the same command to resume.", flush=True); return
+        except ValueError as e:
+            ap.exit(2, f"error: {e}\n")
+        print(f"{'lot':<24}{'dies':>8}{'valid':>8}{'ρc p50':>12}{'ρc p5':>12}{'ρc p95':>12}{'yield':>9}")
+        for lot, st in lots.items():
+            h = st.h[(args.spec_method, "rhoc")]
+            print(f"{lot:<24}{st.c['dies']:>8}{st.c['valid']:>8}{h.quantile(.5):>12.4g}{h.quantile(.05):>12.4g}"
+                  f"{h.quantile(.95):>12.4g}{st.yield_():>9.1%}")
+        return
     # Tweak base font size here (global UI scaling)
     BASE_FONT = ("Segoe UI", 14)  # change 13 → 14/16/18 if you want bigger UI
     App(base_font=BASE_FONT).mainloop()
 
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+    main()
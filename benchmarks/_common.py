@@ -0,0 +1,63 @@
+"""Shared helpers for the benchmark scripts (load the app module, JSON baselines)."""
+import importlib.util
+import json
+import platform
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = ROOT / "Trinity CapRes Analyzer.py"
+
+# 用 importlib 載入：檔名有空白，不能直接 import；不會執行 main()（GUI 不會啟動）
+LOAD_SNIPPET = (
+    "import importlib.util, sys, time\n"
+    "t0 = time.perf_counter()\n"
+    f"spec = importlib.util.spec_from_file_location('capres', {str(APP_PATH)!r})\n"
+    "m = importlib.util.module_from_spec(spec); sys.modules['capres'] = m; spec.loader.exec_module(m)\n"
+    "print(f'module_ms={(time.perf_counter() - t0) * 1000:.2f}')\n"
+)
+
+
+def load_app():
+    """Import the application module (GUI is not started)."""
+    if "capres" in sys.modules:
+        return sys.modules["capres"]
+    spec = importlib.util.spec_from_file_location("capres", APP_PATH)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules["capres"] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def environment():
+    return dict(python=platform.python_version(), platform=platform.platform(), machine=platform.machine())
+
+
+def write_json(path, results):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(dict(environment=environment(), results=results), indent=2), encoding="utf-8")
+
+
+def compare_to_baseline(results, baseline_path, threshold=0.25):
+    """results / baseline: {name: seconds or ms (same unit)}. Returns list of regressions (name, base, now, ratio)."""
+    base = json.loads(Path(baseline_path).read_text(encoding="utf-8"))["results"]
+    regressions = []
+    for name, now in results.items():
+        b = base.get(name)
+        if not b or now is None:
+            continue
+        ratio = now / b
+        if ratio > 1.0 + threshold:
+            regressions.append((name, b, now, ratio))
+    return regressions
+
+
+def report_regressions(regressions, threshold):
+    if not regressions:
+        print(f"OK: no regression above {threshold:.0%}")
+        return 0
+    print(f"REGRESSION (> {threshold:.0%} slower than baseline):")
+    for name, b, now, ratio in regressions:
+        print(f"  {name:<40} {b:10.4g} -> {now:10.4g}  (x{ratio:.2f})")
+    return 1
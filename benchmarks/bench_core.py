@@ -0,0 +1,172 @@
+"""Micro-benchmarks for the core pipeline on synthetic B1500 data (no GUI).
+
+    python benchmarks/bench_core.py                          # small + medium scales
+    python benchmarks/bench_core.py --scales small,medium,large --json out.json
+    python benchmarks/bench_core.py --baseline base.json     # fail (exit 1) if > threshold slower
+    python benchmarks/bench_core.py --only parse,render      # substring filter on case names
+
+Every case reports the median wall time of one call (seconds). Cases: CSV parsing (I–V blocks,
+multi-frequency C–V with and without Dimension1), sweep splitting, R(V), R0 extraction,
+ρc Method-1 / Method-2 fits, the batched exact CTLM fit, robust outlier weighting, multi-condition fits,
+the hover picker index, sweep-table sparklines, columnar export and headless overlay rendering.
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from _common import compare_to_baseline, load_app, report_regressions, write_json
+import synth_b1500 as synth
+
+# points per sweep, sweeps per file, curves for R(V)/R0/render, CTLM sets for the fits
+SCALES = {
+    "small":  dict(points=201,  sweeps=4,  curves=20,  sets=50),
+    "medium": dict(points=2001, sweeps=16, curves=100, sets=500),
+    "large":  dict(points=5001, sweeps=32, curves=400, sets=5000),
+}
+SPACINGS = np.array([5.0, 10.0, 20.0, 40.0])
+R2_UM = 100.0
+
+
+def timed(fn, repeat=5, min_batch=0.05):
+    """Median seconds per call; fast calls are looped so one batch lasts at least ``min_batch``."""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= min_batch or number >= 1 << 16:
+            break
+        number *= 4
+    runs = [dt / number]
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - t0) / number)
+    return statistics.median(runs)
+
+
+def cases(app, scale, cfg, tmpdir):
+    """Yield (name, callable, repeat) for one scale."""
+    rng = np.random.default_rng(1)
+    n, k = cfg["points"], cfg["sweeps"]
+
+    iv_text = synth.iv_csv(50.0, n, k, "single", rng=rng)
+    iv2_text = synth.iv_csv(50.0, n, k, "double", layout="two", rng=rng)
+    freqs = list(np.logspace(3, 6, max(k // 4, 2)))
+    cv_text = synth.cv_csv(n, freqs, "double", rng=rng)
+    cv_nodim = synth.cv_csv(n, freqs, "double", dimension1=False, rng=rng)
+    yield "parse_iv_single", lambda: app.parse_b1500_csv_text(iv_text), 5
+    yield "parse_iv_double_2col", lambda: app.parse_b1500_csv_text(iv2_text), 5
+    yield "parse_cv_dimension1", lambda: app.parse_b1500_csv_text(cv_text), 5
+    yield "parse_cv_locus_scan", lambda: app.parse_b1500_csv_text(cv_nodim), 5
+
+    V1 = synth._sweep_v(n, -3.0, 3.0, "double")
+    Vcat = np.tile(V1, len(freqs))
+    yield "split_hint", lambda: app._split_by_locus_or_wrap(Vcat, "double", -3.0, 3.0, len(freqs), V1.size), 5
+    yield "split_locus_double", lambda: app._split_by_locus_or_wrap(Vcat, "double", -3.0, 3.0, len(freqs)), 5
+    Vs = np.tile(np.linspace(-1, 1, n), len(freqs))
+    yield "split_locus_single", lambda: app._split_by_locus_or_wrap(Vs, "single", -1.0, 1.0, len(freqs)), 5
+
+    curves = [c for _ in range(-(-cfg["curves"] // k)) for c in app.parse_b1500_csv_text(
+        synth.iv_csv(float(rng.uniform(5, 50)), n, k, "single", rng=rng))][:cfg["curves"]]
+    yield "compute_rv", lambda: [app.compute_rv(c["V"], c["I"]) for c in curves], 5
+    yield "compute_r0_at_zero", lambda: [app.compute_r0_at_zero(c["V"], c["I"], 0.5) for c in curves], 5
+
+    Rs = 300 * (1 + 0.1 * rng.standard_normal(cfg["sets"]))
+    Lt = np.clip(2 * (1 + 0.1 * rng.standard_normal(cfg["sets"])), 0.05, None)
+    sets = [synth.ctlm_rt(SPACINGS, R2_UM, r, l) * (1 + 1e-3 * rng.standard_normal(SPACINGS.size))
+            for r, l in zip(Rs, Lt)]
+    yield "rho_method1", lambda: [app.rho_method1(SPACINGS, y, R2_UM) for y in sets], 5
+    yield "rho_method2", lambda: [app.rho_method2(SPACINGS, y, R2_UM) for y in sets], 5
+    Ysets = np.array(sets)
+    yield "rho_exact_batch", lambda: app.rho_exact_batch(SPACINGS[None], Ysets, R2_UM), 5
+    yield "ctlm_outliers_huber", lambda: app.ctlm_outliers(SPACINGS[None], Ysets, R2_UM, "Huber"), 5
+    yield "ctlm_outliers_theil_sen", lambda: app.ctlm_outliers(SPACINGS[None], Ysets, R2_UM, "Theil–Sen"), 5
+    # 多條件：同一批 CTLM 組分散在 10 個溫度，一次批次擬合 + Arrhenius
+    recs = [(25.0 + 10 * (k % 10), (k // 10, 0), None, float(sp), float(r), R2_UM)
+            for k, y in enumerate(sets) for sp, r in zip(SPACINGS, y)]
+    def conditions():
+        fits = app.fit_conditions(recs, R2_UM)
+        rows = [(c + 273.15, app.condition_summary(f)["rhoc"]) for c, f in fits.items()]
+        return app.fit_arrhenius(*zip(*rows))
+    yield "fit_conditions_arrhenius", conditions, 5
+    rhoc = np.exp(rng.normal(np.log(1e-5), 0.3, 100 * cfg["sets"]))
+    def histogram():
+        a, b = app.LogHistogram(), app.LogHistogram()
+        a.add(rhoc); b.add(rhoc[::3])
+        return [a.merge(b).quantile(q) for q in (0.05, 0.5, 0.95)]
+    yield "log_histogram_add_quantile", histogram, 5
+
+    # 同一個 R0 job 丟給 1-worker process pool：陣列 pickle 過去 vs. 只傳 shared-memory metas
+    pool, shared = [], []
+    def in_pool(fn, *a):
+        if not pool:
+            from concurrent.futures import ProcessPoolExecutor
+            app.shm_prepare_pool(); pool.append(ProcessPoolExecutor(1)); pool[0].submit(int).result()
+            shared.extend(app.shm_import_curves(app.shm_export_curves(curves), adopt=True))
+        return pool[0].submit(fn, *a).result()
+    yield "pool_r0_pickle", lambda: in_pool(app._r0_job, curves, 0.5), 5
+    yield "pool_r0_shm", lambda: in_pool(app._r0_job, app.shm_refs(shared), 0.5), 5
+
+    # 游標讀值：像素格點索引建立（視窗範圍改變時）與單次查詢
+    fig, ax = app.new_subplots(6, 4, 100)
+    series = [(c["V"], c["I"], i) for i, c in enumerate(curves)]
+    ax.set_xlim(min(c["V"].min() for c in curves), max(c["V"].max() for c in curves))
+    ax.set_ylim(min(c["I"].min() for c in curves), max(c["I"].max() for c in curves))
+    picker = app.CurvePicker(ax, series)
+    qx, qy = rng.uniform(ax.bbox.x0, ax.bbox.x1, 200), rng.uniform(ax.bbox.y0, ax.bbox.y1, 200)
+    yield "picker_build", lambda: (setattr(picker, "_key", None), picker.query(0, 0)), 5
+    yield "picker_query_x200", lambda: [picker.query(x, y) for x, y in zip(qx, qy)], 5
+
+    # sweeps 表縮圖：每條曲線 render + PNG 編碼（背景執行緒的工作量）
+    yield "sparkline_render", lambda: [app.png_rgba(app.render_sparkline(c["V"], c["I"])) for c in curves], 5
+
+    # 欄式匯出（npz 不需要選用相依，兩種環境都能比）
+    yield "export_columnar_npz", lambda: app.export_columnar(curves, Path(tmpdir) / f"columnar_{scale}", "npz",
+                                                             R2_um=R2_UM), 3
+
+    opts = dict(dpi=100)
+    out = Path(tmpdir) / f"overlay_{scale}.png"
+    yield "render_iv", lambda: app.render_overlay(curves, "iv", out, opts), 3
+    yield "render_rv", lambda: app.render_overlay(curves, "rv", out, opts), 3
+    if pool: pool[0].shutdown()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="small,medium", help=f"comma list from {','.join(SCALES)}")
+    ap.add_argument("--only", help="comma list of substrings; run only matching cases")
+    ap.add_argument("--json", help="write results to this JSON file")
+    ap.add_argument("--baseline", help="compare against this JSON baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = ap.parse_args()
+
+    app = load_app()
+    app._mpl()  # matplotlib 載入時間不算進第一個 render case
+    only = [s for s in (args.only or "").split(",") if s]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scales.split(","):
+            cfg = SCALES[scale]
+            print(f"[{scale}] " + ", ".join(f"{k}={v}" for k, v in cfg.items()))
+            for name, fn, repeat in cases(app, scale, cfg, tmp):
+                if only and not any(s in name for s in only):
+                    continue
+                sec = timed(fn, repeat)
+                results[f"{name}[{scale}]"] = sec
+                print(f"  {name:<24} {sec * 1000:10.3f} ms")
+    if args.json:
+        write_json(args.json, results)
+    if args.baseline:
+        sys.exit(report_regressions(compare_to_baseline(results, args.baseline, args.threshold), args.threshold))
+
+
+if __name__ == "__main__":
+    main()
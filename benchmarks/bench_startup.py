@@ -0,0 +1,79 @@
+"""Startup-time benchmark with import-time profiling.
+
+    python benchmarks/bench_startup.py                       # import profile + module load time
+    python benchmarks/bench_startup.py --gui --runs 5        # also time full GUI startup (needs a display)
+    python benchmarks/bench_startup.py --json out.json       # save results
+    python benchmarks/bench_startup.py --baseline base.json  # fail (exit 1) if > threshold slower
+
+GUI startup is measured by launching the app with TRINITY_STARTUP_EXIT=1: it prints
+``startup_ms=`` once the main window is built and then exits.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from _common import APP_PATH, LOAD_SNIPPET, compare_to_baseline, report_regressions, write_json
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile():
+    """Run the module import under ``-X importtime``; return (module_ms, [(cumulative_us, self_us, name)])."""
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", LOAD_SNIPPET],
+                       capture_output=True, text=True, check=True)
+    module_ms = float(re.search(r"module_ms=([\d.]+)", p.stdout).group(1))
+    top = []
+    for ln in p.stderr.splitlines():
+        m = IMPORT_LINE.match(ln)
+        if m and len(m.group(3)) <= 1:  # 只看最上層 import
+            top.append((int(m.group(2)), int(m.group(1)), m.group(4)))
+    return module_ms, sorted(top, reverse=True)
+
+
+def gui_startup(runs):
+    env = dict(os.environ, TRINITY_STARTUP_EXIT="1")
+    inner, wall = [], []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        p = subprocess.run([sys.executable, str(APP_PATH)], capture_output=True, text=True, env=env, timeout=120)
+        wall.append((time.perf_counter() - t0) * 1000)
+        m = re.search(r"startup_ms=([\d.]+)", p.stdout)
+        if not m:
+            raise RuntimeError(f"app did not report startup time:\n{p.stderr[-2000:]}")
+        inner.append(float(m.group(1)))
+    return statistics.median(inner), statistics.median(wall)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--gui", action="store_true", help="also measure full GUI startup (needs a display)")
+    ap.add_argument("--top", type=int, default=15, help="number of top-level imports to list")
+    ap.add_argument("--json", help="write results to this JSON file")
+    ap.add_argument("--baseline", help="compare against this JSON baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = ap.parse_args()
+
+    loads = [import_profile() for _ in range(args.runs)]
+    module_ms = statistics.median(ms for ms, _ in loads)
+    print(f"module import: {module_ms:.1f} ms (median of {args.runs})")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cum, own, name in loads[-1][1][:args.top]:
+        print(f"{cum/1000:14.1f} {own/1000:9.1f}  {name}")
+    results = {"module_import_ms": module_ms}
+    if args.gui:
+        inner, wall = gui_startup(args.runs)
+        print(f"GUI ready: {inner:.0f} ms in-process, {wall:.0f} ms wall (median of {args.runs})")
+        results.update(gui_ready_ms=inner, gui_wall_ms=wall)
+    if args.json:
+        write_json(args.json, results)
+    if args.baseline:
+        sys.exit(report_regressions(compare_to_baseline(results, args.baseline, args.threshold), args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Synthetic Keysight B1500 CSV generator (I–V and C–V) for benchmarks and manual testing.
+
+    python benchmarks/synth_b1500.py OUTDIR --dies 4x4 --spacings 5,10,20,40 --points 201
+    python benchmarks/synth_b1500.py OUTDIR --cv --freqs 1e3,1e4,1e5,1e6 --locus double
+
+Files follow the layout the parser expects: header keys in column 2, values from column 3,
+``DataName`` / ``DataValue`` blocks. I–V files are named ``X{x}_Y{y}_d{spacing}um.csv`` so the
+default wafer-map die pattern picks up the coordinates.
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+UM_TO_CM = 1e-4
+
+
+def ctlm_rt(d_um, R2_um=100.0, Rs=300.0, Lt_um=2.0):
+    """Linearized CTLM total resistance (Ω) for gap d, outer radius R2 (same model as Method-1)."""
+    r0 = (R2_um - np.asarray(d_um, float)) * UM_TO_CM
+    R = R2_um * UM_TO_CM
+    return Rs / (2 * np.pi) * (np.log(R / r0) + Lt_um * UM_TO_CM * (1 / r0 + 1 / R))
+
+
+def _sweep_v(npts, vstart, vstop, locus):
+    if str(locus).startswith("double"):
+        up = np.linspace(vstart, vstop, max((npts + 1) // 2, 2))
+        return np.r_[up, up[-2::-1]]
+    return np.linspace(vstart, vstop, npts)
+
+
+def _header(title, locus, vstart, vstop, extra=()):
+    lines = [f"SetupTitle,{title}", f"PrimitiveTest,{title}",
+             "TestParameter,Channel.Unit,SMU1:HR,SMU2:HR",
+             f"TestParameter,Measurement.Primary.Locus,{locus.capitalize()}",
+             f"TestParameter,Measurement.Primary.Start,{vstart:g}",
+             f"TestParameter,Measurement.Primary.Stop,{vstop:g}"]
+    return lines + list(extra)
+
+
+def _block(names, cols):
+    out = ["DataName," + ",".join(names)]
+    rows = np.column_stack(cols)
+    out += ["DataValue," + ",".join(f"{v:.6e}" for v in r) for r in rows]
+    return out
+
+
+def iv_csv(R_ohm=50.0, npts=201, nsweeps=1, locus="single", vstart=-1.0, vstop=1.0,
+           layout="multi", die=None, rng=None, noise=1e-3):
+    """One CSV text with ``nsweeps`` I–V DataName blocks.
+
+    layout: "multi" → DataName,Vd,Id,Time ; "two" → two-column block (V1,I1).
+    """
+    rng = rng or np.random.default_rng(0)
+    extra = [f"TestParameter,Dimension1,{npts}"]
+    if die is not None:
+        extra.append(f"TestParameter,Die,{die[0]},{die[1]}")
+    lines = _header("I/V Sweep", locus, vstart, vstop, extra)
+    for _ in range(nsweeps):
+        V = _sweep_v(npts, vstart, vstop, locus)
+        I = V / R_ohm + 0.02 * V**3 / R_ohm
+        I = I * (1 + noise * rng.standard_normal(V.size))
+        if layout == "two":
+            lines += _block(["V1", "I1"], [V, I])
+        else:
+            lines += _block(["Vd", "Id", "Time"], [V, I, np.arange(V.size) * 1e-3])
+    return "\n".join(lines) + "\n"
+
+
+def cv_csv(npts=101, freqs=(1e3, 1e4, 1e5, 1e6), locus="single", vstart=-3.0, vstop=3.0,
+           layout="multi", dimension1=True, rng=None, noise=1e-3):
+    """Single DataName block holding one C–V sweep per frequency (concatenated, as the B1500 writes it)."""
+    rng = rng or np.random.default_rng(0)
+    extra = ["TestParameter,Measurement.Secondary.Frequency," + ",".join(f"{f:g}" for f in freqs)]
+    V1 = _sweep_v(npts, vstart, vstop, locus)
+    if dimension1:
+        extra.append(f"TestParameter,Dimension1,{V1.size}")
+    lines = _header("C-V Sweep", locus, vstart, vstop, extra)
+    Vs, Cs = [], []
+    for k, f in enumerate(freqs):
+        C0 = 1e-11 * (1 - 0.05 * k)
+        C = C0 / np.sqrt(1 + np.exp(V1)) + 2e-13
+        Vs.append(V1); Cs.append(C * (1 + noise * rng.standard_normal(V1.size)))
+    V = np.concatenate(Vs); C = np.concatenate(Cs)
+    if layout == "two":
+        lines += _block(["Vbias", "C"], [V, C])
+    else:
+        lines += _block(["Vbias", "C", "G"], [V, C, C * 1e3])
+    return "\n".join(lines) + "\n"
+
+
+def write_lot(outdir, dies=(4, 4), spacings=(5, 10, 20, 40), R2_um=100.0, npts=201, locus="single",
+              layout="multi", Rs=300.0, Lt_um=2.0, spread=0.1, seed=0):
+    """Write one I–V file per (die, spacing). Returns the list of paths."""
+    rng = np.random.default_rng(seed)
+    outdir = Path(outdir); outdir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for x in range(dies[0]):
+        for y in range(dies[1]):
+            rs = Rs * (1 + spread * rng.standard_normal())
+            lt = max(Lt_um * (1 + spread * rng.standard_normal()), 0.05)
+            for sp in spacings:
+                R = float(ctlm_rt(sp, R2_um, rs, lt))
+                p = outdir / f"X{x}_Y{y}_d{sp:g}um.csv"
+                p.write_text(iv_csv(R, npts, 1, locus, layout=layout, die=(x, y), rng=rng), encoding="utf-8")
+                paths.append(p)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("outdir")
+    ap.add_argument("--dies", default="4x4", help="NXxNY die grid for I–V lots")
+    ap.add_argument("--spacings", default="5,10,20,40", help="CTLM gaps in μm")
+    ap.add_argument("--R2", type=float, default=100.0, help="outer radius in μm")
+    ap.add_argument("--points", type=int, default=201)
+    ap.add_argument("--sweeps", type=int, default=1, help="I–V sweeps per file")
+    ap.add_argument("--locus", choices=["single", "double"], default="single")
+    ap.add_argument("--layout", choices=["multi", "two"], default="multi", help="DataName column layout")
+    ap.add_argument("--cv", action="store_true", help="write one multi-frequency C–V file instead")
+    ap.add_argument("--freqs", default="1e3,1e4,1e5,1e6")
+    ap.add_argument("--no-dimension1", action="store_true", help="omit Dimension1 (forces locus-based splitting)")
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    out = Path(a.outdir); out.mkdir(parents=True, exist_ok=True)
+    if a.cv:
+        freqs = [float(f) for f in a.freqs.split(",")]
+        p = out / f"CV_{a.locus}_{len(freqs)}f.csv"
+        p.write_text(cv_csv(a.points, freqs, a.locus, layout=a.layout, dimension1=not a.no_dimension1,
+                            rng=np.random.default_rng(a.seed)), encoding="utf-8")
+        print(p)
+        return
+    nx, ny = (int(v) for v in a.dies.lower().split("x"))
+    paths = write_lot(out, (nx, ny), [float(s) for s in a.spacings.split(",")], a.R2, a.points,
+                      a.locus, a.layout, seed=a.seed)
+    print(f"wrote {len(paths)} files to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""Shared fixtures: the application module (loaded without starting the GUI) and the synthetic data generator."""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from _common import load_app  # noqa: E402
+import synth_b1500  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    return load_app()
+
+
+@pytest.fixture(scope="session")
+def synth():
+    return synth_b1500
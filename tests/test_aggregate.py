@@ -0,0 +1,86 @@
+"""Out-of-core lot aggregation: resume after an interrupted run, mergeable histograms."""
+import json
+
+import numpy as np
+import pytest
+
+SPACINGS = (5, 10, 20, 40)
+DIES = (2, 2)
+
+
+def _quiet(*a, **k):
+    pass
+
+
+def _write_lots(synth, root, n=2):
+    for i in range(n):
+        synth.write_lot(root / f"LOT{i}", dies=DIES, spacings=SPACINGS, npts=41, seed=i)
+    return n * DIES[0] * DIES[1] * len(SPACINGS)
+
+
+def test_resume_after_interrupt_in_first_lot(app, synth, tmp_path, monkeypatch):
+    root = tmp_path / "data"
+    nfiles = _write_lots(synth, root)
+    ref = app.aggregate_lots(root, tmp_path / "ref", workers=1, log=_quiet)
+
+    real = app._aggregate_job
+    calls = []
+
+    def dying(job):
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        calls.append(job)
+        return real(job)
+
+    out = tmp_path / "out"
+    monkeypatch.setattr(app, "_aggregate_job", dying)
+    with pytest.raises(KeyboardInterrupt):
+        app.aggregate_lots(root, out, workers=1, chunk=1, log=_quiet)
+
+    state = json.loads((out / "state.json").read_text(encoding="utf-8"))
+    assert state["lots_done"] == {} and state["dies_bytes"] > 0
+    assert len((out / "files.jsonl").read_text(encoding="utf-8").splitlines()) == 3
+
+    calls.clear()
+    monkeypatch.setattr(app, "_aggregate_job", lambda job: calls.append(job) or real(job))
+    res = app.aggregate_lots(root, out, workers=1, chunk=1, log=_quiet)
+    assert len(calls) == nfiles - 3
+    assert res["ALL"].c == ref["ALL"].c
+    assert (out / "dies.csv").read_text(encoding="utf-8") == (tmp_path / "ref" / "dies.csv").read_text(encoding="utf-8")
+
+
+def test_missing_state_keeps_parsed_files(app, synth, tmp_path, monkeypatch):
+    root = tmp_path / "data"
+    _write_lots(synth, root, n=1)
+    out = tmp_path / "out"
+    ref = app.aggregate_lots(root, out, workers=1, log=_quiet)
+    (out / "state.json").unlink()
+
+    calls = []
+    real = app._aggregate_job
+    monkeypatch.setattr(app, "_aggregate_job", lambda job: calls.append(job) or real(job))
+    res = app.aggregate_lots(root, out, workers=1, log=_quiet)
+    assert calls == [] and res["ALL"].c == ref["ALL"].c
+
+    with pytest.raises(ValueError):
+        app.aggregate_lots(root, out, workers=1, window=0.25, log=_quiet)
+    res = app.aggregate_lots(root, out, workers=1, window=0.25, restart=True, log=_quiet)
+    assert len(calls) == 1 and res["ALL"].c["files"] == ref["ALL"].c["files"]
+
+
+def test_log_histogram_merge_and_quantile(app):
+    rng = np.random.default_rng(0)
+    v = 10 ** rng.uniform(-7, -3, 20000)
+    a, b = app.LogHistogram(), app.LogHistogram()
+    a.add(v[:7000])
+    b.add(np.r_[v[7000:], np.nan, -1.0, 0.0])
+    h = a.merge(b)
+    assert h.n == v.size and h.n_bad == 3
+    assert h.min == v.min() and h.max == v.max()
+    for q in (0.05, 0.25, 0.5, 0.75, 0.95):
+        assert h.quantile(q) == pytest.approx(np.quantile(v, q), rel=0.025)
+    assert h.quantile(0.0) == v.min() and h.quantile(1.0) == v.max()
+
+    back = app.LogHistogram.from_json(json.loads(json.dumps(h.to_json())))
+    assert np.array_equal(back.counts, h.counts) and back.quantile(0.5) == h.quantile(0.5)
+    assert np.isnan(app.LogHistogram().quantile(0.5))
@@ -0,0 +1,50 @@
+"""Multi-condition fits and Arrhenius barrier-height extraction."""
+import numpy as np
+import pytest
+
+PHI_B, RHO0, RS, R2 = 0.25, 6e-10, 300.0, 100.0
+D = np.array([5, 10, 20, 40.0])
+TEMPS_C = (25, 50, 75, 100, 125)
+
+
+def _rhoc(T_K):
+    return RHO0 * np.exp(PHI_B / (8.617333262e-5 * np.asarray(T_K, float)))
+
+
+def test_condition_kelvin(app):
+    assert app.condition_kelvin(25.0, "°C") == pytest.approx(298.15)
+    assert app.condition_kelvin(300.0, "K") == 300.0
+    assert np.isnan(app.condition_kelvin(1.5, "other"))
+
+
+def test_condition_rule_reads_temperature_from_file_name(app):
+    compiled = app.compile_group_rules({"condition": app.CONDITION_RULE}, ("condition",))
+    for name, T in (("X0_Y0_d5um_T125.csv", 125.0), ("X0_Y0_d5um-T-40C.csv", -40.0), ("X0_Y0_d5um.csv", None)):
+        assert app.extract_group_fields(dict(src=name, label=""), compiled)["condition"] == T
+
+
+def test_fit_arrhenius_recovers_barrier(app):
+    T = np.array(TEMPS_C) + 273.15
+    a = app.fit_arrhenius(T, _rhoc(T))
+    assert a["phiB_eV"] == pytest.approx(PHI_B, rel=1e-9)
+    assert a["rho0"] == pytest.approx(RHO0, rel=1e-6)
+    assert a["r2"] == pytest.approx(1.0) and a["n"] == len(T)
+    assert app.fit_arrhenius(np.r_[T, np.nan, 0.0], np.r_[_rhoc(T), 1e-5, 1e-5])["n"] == len(T)
+    assert app.fit_arrhenius([300.0, 300.0], [1e-5, 2e-5]) is None
+
+
+def test_fit_conditions_to_barrier_height(app):
+    records = []
+    for cond in TEMPS_C:
+        Lt_um = np.sqrt(_rhoc(cond + 273.15) / RS) / app.UM_TO_CM
+        for die in ((0, 0), (1, 0), (0, 1)):
+            for d, R0 in zip(D, app.ctlm_exact_rt(D, R2, RS, Lt_um)):
+                records.append((float(cond), die, None, float(d), float(R0), None))
+    fits = app.fit_conditions(records, R2_um=R2)
+    assert sorted(fits) == [float(c) for c in TEMPS_C]
+    assert all(len(f) == 3 for f in fits.values())
+    rows = [(app.condition_kelvin(c, "°C"), app.condition_summary(fits[c], "Exact")) for c in sorted(fits)]
+    assert all(s["n"] == 3 for _, s in rows)
+    assert [s["Rs"] for _, s in rows] == pytest.approx([RS] * len(rows), rel=1e-6)
+    a = app.fit_arrhenius([T for T, _ in rows], [s["rhoc"] for _, s in rows])
+    assert a["phiB_eV"] == pytest.approx(PHI_B, rel=1e-4)
@@ -0,0 +1,55 @@
+"""Exports: npz round-trip of points / curves / dies, and the PDF report."""
+import numpy as np
+import pytest
+
+
+@pytest.fixture()
+def curves(app, synth, tmp_path):
+    synth.write_lot(tmp_path / "lot", dies=(2, 2), spacings=(5, 10, 20, 40), npts=41, seed=3)
+    (tmp_path / "cv.csv").write_text(synth.cv_csv(51, [1e3, 1e5], "double"), encoding="utf-8")
+    out = []
+    for p in sorted((tmp_path / "lot").glob("*.csv")) + [tmp_path / "cv.csv"]:
+        out += app.read_curves_from_file(p)
+    return out
+
+
+def test_npz_round_trip(app, curves, tmp_path):
+    res = app.export_columnar(iter(curves), tmp_path / "out", "npz", R2_um=100.0, chunk_rows=100)
+    P, C, D = (app.read_columnar(res[n][0]) for n in ("points", "curves", "dies"))
+    assert {n: res[n][1] for n in res} == {"points": sum(len(c["V"]) for c in curves), "curves": len(curves), "dies": 4}
+    assert [n for n, _ in app.POINT_COLUMNS] == list(P)
+
+    Y = [c["I"] if c.get("I") is not None else c["C"] for c in curves]
+    assert np.array_equal(P["V"], np.concatenate([c["V"] for c in curves]))
+    assert np.array_equal(P["Y"], np.concatenate(Y))
+    assert np.array_equal(np.bincount(P["curve_id"]), C["n_points"])
+    cv = [i for i, c in enumerate(curves) if c["type"] == "cv"]
+    assert np.array_equal(P["freq_hz"][np.isin(P["curve_id"], cv)], np.repeat(C["freq_hz"][cv], C["n_points"][cv]))
+    assert np.isnan(P["freq_hz"][~np.isin(P["curve_id"], cv)]).all()
+    assert P["locus"].tolist() == np.repeat(C["locus"], C["n_points"]).tolist()
+
+    assert C["label"].tolist() == [c["label"] for c in curves]
+    assert C["spacing_um"][:4].tolist() == [10.0, 20.0, 40.0, 5.0]
+    groups, _ = app.index_ctlm_groups(curves, app.DEFAULT_GROUP_RULES)
+    fits = app.fit_ctlm_groups(curves, groups, R2_um=100.0)
+    assert D["Exact_rhoc"] == pytest.approx([f["exact"]["rhoc"] for f in fits.values()], rel=1e-6)
+    assert np.isfinite(D["Method-1_r2"]).all() and np.isfinite(D["Method-2_r2"]).all()
+
+
+def test_unknown_format_is_rejected(app, curves, tmp_path):
+    with pytest.raises(ValueError):
+        app.export_columnar(curves, tmp_path / "out", "csv")
+
+
+def test_pdf_report_fits_each_die_once(app, synth, tmp_path, monkeypatch):
+    V = np.linspace(-0.5, 0.5, 21)
+    spacings = (5.0, 10.0, 20.0, 40.0)
+    dies = [(f"die{k}", [dict(V=V, I=V / synth.ctlm_rt(d), spacing=d, label=f"d{d:g}", color="C0") for d in spacings])
+            for k in range(3)]
+    calls = []
+    fit = app.die_fit_summary
+    monkeypatch.setattr(app, "die_fit_summary", lambda job: calls.append(job[0]) or fit(job))
+    opts = {k: app.panel_defaults() for k in ("iv", "rv", "rs", "cv")}
+    pages = app.write_pdf_report(tmp_path / "r.pdf", dies, [], opts, R2_um=100.0, workers=2)
+    assert pages == 1 + len(dies)
+    assert sorted(calls) == ["die0", "die1", "die2"]
@@ -0,0 +1,75 @@
+"""CTLM fits: exact-model recovery and outlier flagging / robust weights."""
+import numpy as np
+import pytest
+
+D = np.array([5, 10, 15, 20, 30, 40.0])
+R2 = 100.0
+METHODS = ("OLS", "Huber", "Tukey", "Theil–Sen")
+
+
+@pytest.mark.parametrize("Rs, Lt", [(300.0, 2.0), (50.0, 15.0), (1200.0, 0.5)])
+def test_exact_fit_recovers_rs_lt(app, Rs, Lt):
+    r = app.rho_exact(D, app.ctlm_exact_rt(D, R2, Rs, Lt), R2)
+    assert r is not None
+    assert r[0] == pytest.approx(Rs, rel=1e-6)
+    assert r[1] == pytest.approx(Lt, rel=1e-6)
+    assert r[2] == pytest.approx(Rs * (Lt * app.UM_TO_CM) ** 2, rel=1e-5)
+
+
+def test_exact_fit_batch_skips_bad_sets(app):
+    Y = np.stack([app.ctlm_exact_rt(D, R2, 300.0, 2.0), app.ctlm_exact_rt(D, R2, 80.0, 6.0), np.full(D.size, np.nan)])
+    r = app.rho_exact_batch(D, Y, R2)
+    assert r["ok"].tolist() == [True, True, False]
+    assert r["Rs"][:2] == pytest.approx([300.0, 80.0], rel=1e-6)
+    assert r["Lt_um"][:2] == pytest.approx([2.0, 6.0], rel=1e-6)
+
+
+def test_method1_recovers_linearized_model(app, synth):
+    Rs, Lt, rhoc = app.rho_method1(D, synth.ctlm_rt(D, R2, 300.0, 2.0), R2)
+    assert Rs == pytest.approx(300.0, rel=1e-9) and Lt == pytest.approx(2.0, rel=1e-9)
+
+
+def _noisy_sets(app, n=50, outlier=3):
+    rng = np.random.default_rng(0)
+    Y = app.ctlm_exact_rt(D, R2, 300.0, 2.0)[None] * (1 + 1e-3 * rng.standard_normal((n, D.size)))
+    Y[:, outlier] *= 1.3
+    return Y
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_injected_outlier_is_flagged(app, method):
+    Y = _noisy_sets(app)
+    W, flags = app.ctlm_outliers(D, Y, R2, method)
+    others = np.arange(D.size) != 3
+    assert flags[:, 3].all() and not flags[:, others].any()
+    if method == "OLS":
+        assert W is None
+    else:
+        assert (W[:, 3] == 0).all() and (W[:, others].sum(1) > 0).all()
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_clean_sets_are_not_flagged(app, method):
+    Y = app.ctlm_exact_rt(D, R2, 300.0, 2.0)[None].repeat(4, 0)
+    W, flags = app.ctlm_outliers(D, Y, R2, method)
+    assert not flags.any()
+    if W is not None:
+        assert (W > 0).all()
+
+
+def test_robust_weights_remove_outlier_bias(app):
+    Y = _noisy_sets(app, n=5)
+    W, _ = app.ctlm_outliers(D, Y, R2, "Huber")
+    for y, w in zip(Y, W):
+        Rs, Lt, _, _ = app.rho_exact(D, y, R2, w)
+        assert Rs == pytest.approx(300.0, rel=0.01) and Lt == pytest.approx(2.0, rel=0.05)
+        assert abs(app.rho_exact(D, y, R2)[0] / 300.0 - 1) > 0.01
+
+
+def test_all_zero_weights_fail_every_fit(app):
+    # The R0-vs-spacing tab reports "all points rejected" for this case rather than falling back to OLS.
+    y = app.ctlm_exact_rt(D, R2, 300.0, 2.0)
+    w = np.zeros_like(D)
+    assert app.rho_method1(D, y, R2, w) is None
+    assert app.rho_method2(D, y, R2, w) is None
+    assert app.rho_exact(D, y, R2, w) is None
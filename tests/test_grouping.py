@@ -0,0 +1,44 @@
+"""CTLM grouping rules: file-name / label / header forms and the (die, structure) index."""
+import re
+
+import numpy as np
+import pytest
+
+
+def _curve(src="lot/X3_Y-2_CTLM_A_d12.5um.csv", label="Sweep_1", meta=None):
+    V = np.linspace(-1, 1, 5)
+    return dict(src=src, label=label, meta=meta or {}, V=V, I=V / 100.0)
+
+
+def test_default_rules_read_die_and_spacing_from_file_name(app):
+    f = app.extract_group_fields(_curve(), app.compile_group_rules(app.DEFAULT_GROUP_RULES))
+    assert f == dict(die=(3, -2), structure=None, spacing=12.5, R2=None)
+
+
+def test_label_and_header_rules(app):
+    rules = dict(die="header:Die", structure=r"(CTLM)_([A-Z])", spacing=r"label:gap(\d+)", R2=r"header:Outer:R=(\d+)")
+    c = _curve(label="gap20 run", meta={"Die": "4;7", "Outer": "R=150um"})
+    f = app.extract_group_fields(c, app.compile_group_rules(rules))
+    assert f == dict(die=(4, 7), structure="CTLM_A", spacing=20.0, R2=150.0)
+
+
+def test_single_group_die_is_a_string_and_missing_fields_are_none(app):
+    compiled = app.compile_group_rules(dict(die=r"(W\d+)", spacing="header:Gap"))
+    assert set(compiled) == {"die", "spacing"}  # fields without a rule are not compiled
+    f = app.extract_group_fields(_curve(src="W07_X1.csv"), compiled)
+    assert f["die"] == "W07" and f["spacing"] is None
+
+
+def test_bad_regex_raises(app):
+    with pytest.raises(re.error):
+        app.compile_group_rules(dict(die="X(\\d+"))
+
+
+def test_index_groups_by_die_and_structure(app):
+    curves = [_curve(src=f"X{x}_Y0_{st}_d{sp}um.csv") for x in (0, 1) for st in ("A", "B") for sp in (5, 10)]
+    curves.append(dict(_curve(), I=None, C=np.zeros(5)))  # C–V sweeps are not grouped
+    rules = dict(app.DEFAULT_GROUP_RULES, structure=r"_([AB])_", R2="")
+    groups, fields = app.index_ctlm_groups(curves, rules)
+    assert sorted(groups) == [((0, 0), "A"), ((0, 0), "B"), ((1, 0), "A"), ((1, 0), "B")]
+    assert groups[((1, 0), "B")]["spacings"] == {5.0: [6], 10.0: [7]}
+    assert len(fields) == 8
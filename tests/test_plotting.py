@@ -0,0 +1,58 @@
+"""Plot helpers: fast overlay, legend capping and the pixel-grid cursor picker."""
+import numpy as np
+import pytest
+
+
+@pytest.fixture()
+def ax(app):
+    fig, ax = app.new_subplots(6, 4, 100)
+    yield ax
+    fig.clf()
+
+
+def _labels(ax):
+    return [t.get_text() for t in ax.get_legend().get_texts()]
+
+
+def test_legend_lists_every_plain_curve(app, ax):
+    # Many curves drawn one by one (Fast overlay off) keep their full legend.
+    for k in range(app.FAST_OVERLAY_MIN + 5):
+        ax.plot([0, 1], [k, k + 1], label=f"c{k}")
+    app.apply_legend(ax, app.panel_defaults())
+    assert _labels(ax) == [f"c{k}" for k in range(app.FAST_OVERLAY_MIN + 5)]
+
+
+def test_fast_overlay_legend_is_capped(app, ax):
+    n = app.FAST_OVERLAY_MIN + 5
+    series = [(np.arange(5.0), np.arange(5.0) * k, f"c{k}", "C0", True, True) for k in range(n)]
+    handles, labels, total = app.plot_overlay_fast(ax, series, marker_edge=True)
+    assert total == n and len(handles) == app.LEGEND_MAX_ENTRIES
+    assert handles[0].get_markeredgecolor() == "black"
+    app.apply_legend(ax, app.panel_defaults(), handles, labels, total)
+    keep = app.LEGEND_MAX_ENTRIES - 1
+    assert _labels(ax) == [f"c{k}" for k in range(keep)] + [f"… +{n - keep} more"]
+
+
+def _screen(ax, x, y):
+    return ax.transData.transform((x, y))
+
+
+def test_picker_finds_the_nearest_point(app, ax):
+    X = np.linspace(0, 10, 11)
+    series = [(X, X, "up"), (X, 10 - X, "down")]
+    ax.set_xlim(0, 10); ax.set_ylim(0, 10)
+    picker = app.CurvePicker(ax, series)
+    assert picker.query(*_screen(ax, 2, 2)) == ("up", 2.0, 2.0)
+    assert picker.query(*(_screen(ax, 8, 2) + 3)) == ("down", 8.0, 2.0)
+    assert picker.query(*_screen(ax, 5, 9)) is None                # nothing within the radius
+    assert picker.query(*_screen(ax, 5, 5))[0] == "down"          # later series is drawn on top
+
+
+def test_picker_rebuilds_on_zoom_and_handles_log_axes(app, ax):
+    X = np.logspace(0, 3, 31)
+    ax.set_xscale("log"); ax.set_xlim(1, 1e3); ax.set_ylim(0, 1)
+    picker = app.CurvePicker(ax, [(X, np.full_like(X, 0.5), "flat")])
+    assert picker.query(*_screen(ax, 10, 0.5)) == ("flat", pytest.approx(10.0), 0.5)
+    ax.set_xlim(100, 1e3)
+    assert picker.query(*_screen(ax, 10, 0.5)) is None            # now off the axes
+    assert picker.query(*_screen(ax, 1e3, 0.5)) == ("flat", pytest.approx(1e3), 0.5)
@@ -0,0 +1,73 @@
+"""Analysis server ops (parse LRU, fit / render spacing from the grouping rules), run in-process."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+SPACINGS = (5, 10, 20, 40)
+
+
+@pytest.fixture()
+def server(app):
+    s = app.AnalysisServer(workers=1)
+    s._pool = ThreadPoolExecutor(1)  # in-process, so the test can look at the rendered axes
+    yield s
+    s._pool.shutdown()
+
+
+@pytest.fixture()
+def lot(synth, tmp_path):
+    return [str(p) for p in synth.write_lot(tmp_path / "lot", dies=(2, 1), spacings=SPACINGS, npts=41)]
+
+
+def _call(server, *reqs):
+    async def go():
+        server._slots = asyncio.Semaphore(2)
+        return [await server._dispatch_safe(r) for r in reqs]
+    return asyncio.run(go())
+
+
+def test_parse_hits_cache(server, lot):
+    first, second = _call(server, dict(op="parse", paths=lot[:2]), dict(op="parse", paths=lot[:2]))
+    assert first["ok"] and second["ok"] and first == second
+    assert server.stats["parsed"] == 2 and server.stats["cache_hits"] == 2
+
+
+def test_fit_takes_spacing_from_rule(server, lot):
+    (r,) = _call(server, dict(op="fit", paths=lot[:len(SPACINGS)], R2=100))
+    assert r["ok"], r
+    assert sorted(q["spacing"] for q in r["points"]) == list(SPACINGS)
+
+
+def test_fit_rejects_missing_spacing(server, lot, tmp_path):
+    bad = tmp_path / "nospacing.csv"
+    bad.write_text(open(lot[0], encoding="utf-8").read(), encoding="utf-8")
+    r1, r2 = _call(server, dict(op="fit", paths=[str(bad)], R2=100),
+                   dict(op="fit", items=[dict(path=lot[0], spacing=0)], R2=100))
+    assert not r1["ok"] and "items[0]" in r1["error"] and "nospacing" in r1["error"]
+    assert not r2["ok"] and "spacing" in r2["error"]
+
+
+def test_render_rs_uses_rule_spacing(app, server, lot, tmp_path, monkeypatch):
+    axes = []
+    new_subplots = app.new_subplots
+
+    def spy(*a, **k):
+        fig, ax = new_subplots(*a, **k)
+        axes.append(ax)
+        return fig, ax
+    monkeypatch.setattr(app, "new_subplots", spy)
+    bad = tmp_path / "nospacing.csv"
+    bad.write_text(open(lot[0], encoding="utf-8").read(), encoding="utf-8")
+    out = tmp_path / "rs.png"
+    (r,) = _call(server, dict(op="render", paths=lot + [str(bad)], kind="rs", out=str(out)))
+    assert r["ok"], r
+    assert out.stat().st_size > 0
+    xs = np.concatenate([c.get_offsets()[:, 0] for c in axes[0].collections])
+    assert len(xs) == len(lot) and sorted(set(xs)) == list(SPACINGS)
+
+
+def test_unknown_op_is_an_error(server):
+    (r,) = _call(server, dict(op="nope"))
+    assert not r["ok"] and "unknown op" in r["error"]
@@ -0,0 +1,59 @@
+"""Shared-memory curve transport: export / import round trip and segment cleanup."""
+import gc
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="segments are only handed between processes on POSIX")
+
+
+def _curves():
+    rng = np.random.default_rng(1)
+    return [dict(label="a", type="iv", V=rng.standard_normal(50), I=rng.standard_normal(50)),
+            dict(label="b", type="cv", V=rng.standard_normal(7), C=rng.standard_normal(7), freq=1e5)]
+
+
+def _exists(name):
+    try:
+        shared_memory.SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def test_round_trip_shares_one_segment(app):
+    curves = _curves()
+    metas = app.shm_export_curves(curves)
+    assert all(set(m) & {"V", "I", "C"} == set() for m in metas)
+    name = metas[0]["_shm"][0]
+    assert {m["_shm"][0] for m in metas} == {name}
+
+    plain = dict(label="plain", type="iv", V=np.zeros(3), I=np.ones(3))
+    back = app.shm_import_curves(metas + [plain])
+    assert back[-1] is plain
+    for c, b in zip(curves, back):
+        assert {k: v for k, v in b.items() if k != "_shm"}.keys() == c.keys()
+        for k in ("V", "I", "C"):
+            if k in c:
+                assert np.array_equal(b[k], c[k]) and not b[k].flags.owndata
+        assert b["label"] == c["label"] and b.get("freq") == c.get("freq")
+    assert app.shm_refs(back)[0] == metas[0]
+    del back, b
+    gc.collect()
+    assert not _exists(name)
+
+
+def test_adopted_segment_is_unlinked_after_the_last_view(app):
+    # A worker exports on behalf of the main process (owner_pid), then the main process adopts it.
+    metas = app.shm_export_curves(_curves(), owner_pid=os.getppid())
+    name = metas[0]["_shm"][0]
+    assert name not in app._SHM_OPEN and _exists(name)
+
+    V = app.shm_import_curves(metas, adopt=True)[0]["V"]
+    gc.collect()
+    assert _exists(name)            # a view is still alive
+    del V
+    gc.collect()
+    assert not _exists(name) and name not in app._SHM_OPEN
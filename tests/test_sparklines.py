@@ -0,0 +1,62 @@
+"""Sweep thumbnails: rasterizer, PNG encoder, disk LRU and the poll loop."""
+import struct
+import types
+import zlib
+
+import numpy as np
+
+
+def _decode_png(png):
+    """Minimal decoder for the PNGs png_rgba writes (one IDAT, filter 0 on every row)."""
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, {}
+    while pos < len(png):
+        n, = struct.unpack(">I", png[pos:pos + 4]); tag = png[pos + 4:pos + 8]; data = png[pos + 8:pos + 8 + n]
+        assert struct.unpack(">I", png[pos + 8 + n:pos + 12 + n])[0] == zlib.crc32(tag + data)
+        chunks[tag] = data; pos += 12 + n
+    w, h, depth, ctype = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert (depth, ctype) == (8, 6)
+    raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), np.uint8).reshape(h, 1 + 4 * w)
+    assert not raw[:, 0].any()
+    return raw[:, 1:].reshape(h, w, 4)
+
+
+def test_png_round_trip(app):
+    img = np.random.default_rng(0).integers(0, 256, (app.SPARK_H, app.SPARK_W, 4), dtype=np.uint8)
+    assert np.array_equal(_decode_png(app.png_rgba(img)), img)
+
+
+def test_sparkline_keeps_a_one_sample_spike(app):
+    V = np.linspace(-1, 1, 20001); Y = np.zeros_like(V); Y[12345] = 1.0
+    img = app.render_sparkline(V, Y)
+    assert img.shape == (app.SPARK_H, app.SPARK_W, 4) and img.dtype == np.uint8
+    drawn = img[..., 3] == 255
+    assert drawn[0:2].any()                       # the spike reaches the top rows
+    assert drawn.any(axis=0).all()                # the trace is continuous across the width
+
+
+def test_sparkline_of_too_few_points_is_blank(app):
+    assert not app.render_sparkline([0.0, np.nan], [1.0, 2.0]).any()
+
+
+def test_disk_cache_evicts_oldest(app, tmp_path):
+    png = app.png_rgba(app.render_sparkline(np.arange(10.0), np.arange(10.0)))
+    cache = app.SparklineCache(tmp_path, mem=1, disk_mb=0)
+    cache.cap = 2 * len(png)
+    for k in "abc":
+        cache.put(k, png)
+    assert sorted(p.name for p in tmp_path.glob("*.png")) == ["b.png", "c.png"]
+    fresh = app.SparklineCache(tmp_path, mem=1)
+    assert fresh.get("a") is None and fresh.get("b") == png
+
+
+def test_skipped_row_back_on_screen_is_requeued(app):
+    # A job skipped while its row was off screen comes back as None; if the row is wanted again
+    # by then, _spark_refresh saw it as still pending, so the poll has to schedule another pass.
+    soon = []
+    ui = types.SimpleNamespace(
+        spark=types.SimpleNamespace(results=lambda: [(3, None), (9, None)], wanted=frozenset({3})),
+        _spark_poll_id="id", _spark_pending={3, 9}, _spark_failed=set(), _spark_imgs={},
+        _spark_refresh_soon=lambda: soon.append(1), after=lambda *a: "next")
+    app.App._spark_poll(ui)
+    assert soon == [1] and ui._spark_pending == set() and ui._spark_poll_id is None